@@ -0,0 +1,4 @@
+from .pipeline import main
+
+# Permite ejecutar el ETL con: python -m src [opciones]  (ver python -m src --help)
+main()
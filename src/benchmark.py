@@ -0,0 +1,330 @@
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import matplotlib
+import pandas as pd
+from . import transformacion as tr
+from . import visualizaciones as viz
+from . import divisas as dv
+from . import cache_entradas as ce
+from . import pipeline
+from . import datos_sinteticos as sint
+
+
+# Banco de pruebas de rendimiento del ETL sobre datos sintéticos (ver datos_sinteticos.py).
+# Los resultados se añaden a un fichero JSONL (una línea por prueba) con el commit de git, para comparar entre versiones.
+
+RUTA_RESULTADOS = os.path.join("output", "benchmarks", "resultados.jsonl")
+DIR_TRABAJO = os.path.join("output", "benchmarks")
+
+# Tabla de la API de divisas simulada: unidades de cada divisa por 1 USD
+TABLA_DIVISAS_LOCAL = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "BRL": 5.0, "CLP": 930.0, "MXN": 17.1, "COP": 3950.0,
+                       "ARS": 870.0, "PEN": 3.7, "UYU": 39.0, "CAD": 1.36, "CHF": 0.88, "JPY": 150.0}
+
+PRUEBAS = ["carga_bend", "carga_ds", "carga_pe", "completing_currency", "fcv_currency_or_multicurrency",
+           "same_commercial_model_quoted", "clasificar_por_reglas", "preparacion_floats_powerbi", "exportar_csv_powerbi",
+           "generar_boxplot_delta", "visualizar_outliers", "viz_delta_vs_tipo_servicio"]
+
+# Las pruebas fila a fila (df.apply) se omiten por encima de este nº de filas: tardarían horas
+MAX_FILAS_FILA_A_FILA = 1_000_000
+
+# Módulos del ETL cuyo tiempo de importación se mide (cada vez en un intérprete nuevo), y librerías que el ETL sin gráficos no debería cargar
+MODULOS_IMPORTACION = ["transformacion", "pipeline", "lotes", "visualizaciones"]
+LIBRERIAS_PESADAS = ["matplotlib", "seaborn", "requests"]
+
+
+def servidor_divisas_local(latencia = 0.05, tabla = None):
+    """Arranca en segundo plano un servidor HTTP que imita a la API de divisas (/latest y /convert), con una latencia fija por petición.
+
+    Args:
+        latencia (float): segundos de espera de cada respuesta (simula la red).
+        tabla (dict or None): {código ISO: unidades por 1 USD}. None = TABLA_DIVISAS_LOCAL.
+
+    Returns:
+        tuple: (url base para divisas.URL_BASE_API, servidor). Parar con servidor.shutdown().
+    """
+    tabla = tabla or TABLA_DIVISAS_LOCAL
+
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parametros = {clave: valores[0] for clave, valores in parse_qs(url.query).items()}
+            time.sleep(latencia)
+            cuerpo = None
+            if url.path == "/latest" and parametros.get("base") in tabla:
+                base = tabla[parametros["base"]]
+                divisas = parametros.get("currencies", "").split(",")
+                cuerpo = {"success": True, "base": parametros["base"], "rates": {d: tabla[d] / base for d in divisas if d in tabla}}
+            elif url.path == "/convert" and parametros.get("from") in tabla and parametros.get("to") in tabla:
+                cuerpo = {"success": True, "info": {"rate": tabla[parametros["to"]] / tabla[parametros["from"]]}}
+
+            if cuerpo is None:
+                self.send_response(400)
+                self.end_headers()
+                return
+            datos = json.dumps(cuerpo).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target = servidor.serve_forever, daemon = True).start()
+    return f"http://127.0.0.1:{servidor.server_port}", servidor
+
+
+def version_git():
+    """Commit actual (abreviado) del repositorio del ETL y si hay cambios sin confirmar; None si no es un repositorio git."""
+    carpeta = os.path.dirname(os.path.abspath(__file__)) #el repositorio del código, no la carpeta desde la que se ejecuta
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = carpeta, capture_output = True, text = True, check = True).stdout.strip()
+        cambios = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd = carpeta, capture_output = True, text = True, check = True).stdout.strip()
+        return {"commit": commit, "cambios_sin_confirmar": bool(cambios)}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "cambios_sin_confirmar": None}
+
+
+def medir(funcion, repeticiones = 3, preparar = None):
+    """Ejecuta `funcion` varias veces (sin mostrar lo que imprime) y devuelve sus tiempos.
+
+    Args:
+        funcion (callable): función sin argumentos a medir (recibe el resultado de `preparar` si se indica).
+        repeticiones (int): nº de ejecuciones.
+        preparar (callable, opcional): se llama antes de cada repetición, fuera del tiempo medido (ej. copiar el DataFrame que la función modifica).
+
+    Returns:
+        dict: {'segundos_min', 'segundos_mediana', 'repeticiones'}
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        argumento = preparar() if preparar is not None else None
+        with redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcion(argumento) if preparar is not None else funcion()
+            tiempos.append(time.perf_counter() - inicio)
+    return {"segundos_min": round(min(tiempos), 4), "segundos_mediana": round(statistics.median(tiempos), 4), "repeticiones": repeticiones}
+
+
+def _dir_datos(dir_trabajo, n_filas, semilla, opciones_datos):
+    """Carpeta de los ficheros sintéticos: una por nº de filas, semilla y opciones del generador (hash de las opciones en el nombre),
+    para no reutilizar datos generados con otra mezcla de divisas u otro ratio_sin_divisa."""
+    huella = hashlib.sha1(json.dumps(sorted(opciones_datos.items()), default = str).encode()).hexdigest()[:8]
+    return os.path.join(dir_trabajo, f"datos_{n_filas}_{semilla}_{huella}")
+
+
+def _preparar_datos(dir_datos, dir_trabajo, n_filas, semilla, opciones_datos):
+    """Genera los ficheros sintéticos (si no existen ya para ese nº de filas, semilla y opciones, ver `_dir_datos`) y construye el DataFrame unido del ETL."""
+    if not all(os.path.exists(os.path.join(dir_datos, nombre)) for nombre in ("bend.xlsm", "ds.xlsx", "pe.csv")):
+        sint.generar_ficheros(dir_datos, n_filas = n_filas, semilla = semilla, **opciones_datos)
+
+    with redirect_stdout(io.StringIO()):
+        fuentes = pipeline.cargar_fuentes(dir_datos, dir_trabajo, motor_excel = None)
+        df_merged = pipeline.unir_fuentes(fuentes)
+        df_final = pipeline.convertir_divisas(df_merged, dir_trabajo)
+
+    #Deal Specialist sin procesar, tal y como lo recibe completing_currency
+    ds_crudo = ce.leer_excel_cacheado(os.path.join(dir_datos, "ds.xlsx"), dir_cache = None, index_col = 0)
+    ds_crudo.columns = ds_crudo.columns.str.strip()
+    ds_crudo = ds_crudo.rename(columns = {"Unnamed: 1": "quotation_ID"})
+    return df_merged, df_final, ds_crudo
+
+
+def ejecutar_benchmark(lista_filas = (1_000, 10_000), repeticiones = 3, pruebas = None, dir_trabajo = DIR_TRABAJO,
+                       ruta_resultados = RUTA_RESULTADOS, latencia_api = 0.05, semilla = 0, **opciones_datos):
+    """Mide cada prueba de PRUEBAS con datos sintéticos de distintos tamaños y añade los resultados a `ruta_resultados`.
+
+    Args:
+        lista_filas (iterable): tamaños de los datos (nº de ofertas), ej. (1_000, 100_000, 1_000_000).
+        repeticiones (int): ejecuciones de cada prueba (se guardan el mínimo y la mediana).
+        pruebas (list or None): pruebas a ejecutar (ver PRUEBAS). None = todas.
+        dir_trabajo (str): carpeta para los datos sintéticos y los ficheros temporales.
+        ruta_resultados (str): fichero JSONL donde se acumulan los resultados.
+        latencia_api (float): latencia simulada de la API de divisas local, en segundos.
+        semilla (int): semilla de los datos sintéticos.
+        **opciones_datos: opciones de datos_sinteticos.generar_bloque (mezcla_divisas, ratio_sin_divisa...).
+
+    Returns:
+        list: resultados (un dict por prueba y tamaño).
+    """
+    matplotlib.use("Agg")
+    pruebas = pruebas or PRUEBAS
+    desconocidas = [prueba for prueba in pruebas if prueba not in PRUEBAS]
+    if desconocidas:
+        raise ValueError(f"Pruebas desconocidas: {desconocidas}. Disponibles: {PRUEBAS}")
+
+    url_original = dv.URL_BASE_API
+    url_local, servidor = servidor_divisas_local(latencia = latencia_api)
+    dv.URL_BASE_API = url_local
+
+    comunes = {"fecha": datetime.now().isoformat(timespec = "seconds"), **version_git(),
+               "python": platform.python_version(), "pandas": pd.__version__, "sistema": platform.platform()}
+    resultados = []
+    try:
+        for n_filas in lista_filas:
+            dir_datos = _dir_datos(dir_trabajo, n_filas, semilla, opciones_datos)
+            dir_tmp = os.path.join(dir_trabajo, "tmp")
+            os.makedirs(dir_tmp, exist_ok = True)
+            print(f"📏 {n_filas} filas: preparando datos sintéticos...")
+            df_merged, df_final, ds_crudo = _preparar_datos(dir_datos, dir_tmp, n_filas, semilla, opciones_datos)
+            resultado_outliers = viz.separar_outliers(df_final, "delta PE vs DS")
+
+            casos = {
+                "carga_bend": lambda: tr.cargar_y_procesar_excel_bend(os.path.join(dir_datos, "bend.xlsm")),
+                "carga_ds": lambda: tr.cargar_y_procesar_ds(os.path.join(dir_datos, "ds.xlsx")),
+                "carga_pe": lambda: tr.cargar_y_procesar_pe(os.path.join(dir_datos, "pe.csv"), columnas = tr.COLUMNAS_PE, dtypes = tr.DTYPES_PE),
+                "completing_currency": (lambda ds: tr.completing_currency(ds, 'Main Access Currency', 'Back Up Maintenance Currency', 'Main Maintenance Currency'),
+                                        lambda: ds_crudo.copy()),
+                #Sin caché persistente: cada repetición consulta la API local
+                "fcv_currency_or_multicurrency": lambda: tr.fcv_currency_or_multicurrency(
+                    df_merged, 'Main_Access_Currency_req', 'Main_Access_Currency_ds', 'FCV_ds', 'Main_Access_Currency_pe', 'FCV_pe', tr.name_to_iso),
+                "same_commercial_model_quoted": lambda: df_final.apply(tr.same_commercial_model_quoted, axis = 1),
+                "clasificar_por_reglas": lambda: tr.clasificar_por_reglas(df_final, tr.REGLAS_COMMERCIAL_MODEL_CHANGES),
+                "preparacion_floats_powerbi": (tr.preparacion_floats_powerbi, lambda: df_final.copy()),
+                "exportar_csv_powerbi": lambda: tr.exportar_csv_powerbi(df_final, os.path.join(dir_tmp, "merged.csv")),
+                "generar_boxplot_delta": lambda: viz.generar_boxplot_delta(df_final, save_path = os.path.join(dir_tmp, "boxplot.png"), show_plot = False),
+                "visualizar_outliers": lambda: viz.visualizar_outliers(resultado_outliers['outliers'], resultado_outliers['limite_inferior'],
+                                                                       resultado_outliers['limite_superior'],
+                                                                       save_path = os.path.join(dir_tmp, "outliers.png"), show_plot = False),
+                "viz_delta_vs_tipo_servicio": lambda: viz.viz_delta_vs_tipo_servicio(df_final, resultado_outliers['outliers'], resultado_outliers['sin_outliers'],
+                                                                                     save_path = os.path.join(dir_tmp, "tipo_servicio.png"), show_plot = False),
+            }
+
+            for prueba in pruebas:
+                if prueba in ("same_commercial_model_quoted", "preparacion_floats_powerbi") and n_filas > MAX_FILAS_FILA_A_FILA:
+                    print(f"   ⏭️ {prueba}: omitida (fila a fila, más de {MAX_FILAS_FILA_A_FILA} filas)")
+                    continue
+                caso = casos[prueba]
+                funcion, preparar = caso if isinstance(caso, tuple) else (caso, None)
+                tiempos = medir(funcion, repeticiones, preparar)
+                resultados.append({**comunes, "prueba": prueba, "n_filas": n_filas, **tiempos})
+                print(f"   ⏱️ {prueba}: {tiempos['segundos_min']} s (mediana {tiempos['segundos_mediana']} s)")
+    finally:
+        dv.URL_BASE_API = url_original
+        servidor.shutdown()
+
+    _guardar_resultados(resultados, ruta_resultados)
+    return resultados
+
+
+def _guardar_resultados(resultados, ruta_resultados):
+    """Añade los resultados al fichero JSONL (una línea por prueba)."""
+    carpeta = os.path.dirname(ruta_resultados)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok = True)
+    with open(ruta_resultados, "a", encoding = "utf-8") as archivo:
+        for resultado in resultados:
+            archivo.write(json.dumps(resultado, ensure_ascii = False) + "\n")
+    print(f"📁 Resultados añadidos a: {ruta_resultados}")
+
+
+def medir_importacion(modulo, repeticiones = 5):
+    """Mide cuánto tarda en importarse un módulo del ETL en un intérprete de Python nuevo (sin nada importado antes), como un proceso del pool de lotes.py.
+
+    Args:
+        modulo (str): módulo del paquete (ej. 'transformacion').
+        repeticiones (int): nº de intérpretes lanzados.
+
+    Returns:
+        dict: {'segundos_min', 'segundos_mediana', 'repeticiones', 'librerias_cargadas'} (librerías de LIBRERIAS_PESADAS que ha cargado la importación).
+    """
+    codigo = (f"import json, sys, time; inicio = time.perf_counter(); import {__package__}.{modulo}; segundos = time.perf_counter() - inicio; "
+              f"print(json.dumps({{'segundos': segundos, 'cargadas': [m for m in {LIBRERIAS_PESADAS!r} if m in sys.modules]}}))")
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #carpeta que contiene el paquete
+    tiempos, cargadas = [], []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", codigo], cwd = raiz, capture_output = True, text = True, check = True).stdout
+        medida = json.loads(salida.strip().splitlines()[-1])
+        tiempos.append(medida["segundos"])
+        cargadas = medida["cargadas"]
+    return {"segundos_min": round(min(tiempos), 4), "segundos_mediana": round(statistics.median(tiempos), 4),
+            "repeticiones": repeticiones, "librerias_cargadas": cargadas}
+
+
+def ejecutar_benchmark_importacion(modulos = MODULOS_IMPORTACION, repeticiones = 5, ruta_resultados = RUTA_RESULTADOS):
+    """Mide el tiempo de importación de cada módulo y lo añade a `ruta_resultados` (prueba 'importar_<modulo>', n_filas 0),
+    para compararlo entre commits con `comparar` igual que el resto de pruebas.
+
+    Returns:
+        list: resultados (un dict por módulo).
+    """
+    comunes = {"fecha": datetime.now().isoformat(timespec = "seconds"), **version_git(),
+               "python": platform.python_version(), "pandas": pd.__version__, "sistema": platform.platform()}
+    resultados = []
+    for modulo in modulos:
+        tiempos = medir_importacion(modulo, repeticiones)
+        resultados.append({**comunes, "prueba": f"importar_{modulo}", "n_filas": 0, **tiempos})
+        pesadas = f" | carga {', '.join(tiempos['librerias_cargadas'])}" if tiempos["librerias_cargadas"] else ""
+        print(f"   ⏱️ import {modulo}: {tiempos['segundos_min']} s (mediana {tiempos['segundos_mediana']} s){pesadas}")
+
+    _guardar_resultados(resultados, ruta_resultados)
+    return resultados
+
+
+def comparar(ruta_resultados = RUTA_RESULTADOS, commit_base = None, commit_nuevo = None):
+    """Compara los tiempos de dos commits (por defecto, los dos últimos medidos) prueba a prueba.
+
+    Returns:
+        pd.DataFrame: una fila por prueba y tamaño con el tiempo mínimo de cada commit y el cociente nuevo / base.
+    """
+    resultados = pd.read_json(ruta_resultados, lines = True)
+    resultados["commit"] = resultados["commit"].fillna("sin git")
+    commits = list(dict.fromkeys(resultados.sort_values("fecha")["commit"]))
+    if commit_nuevo is None:
+        commit_nuevo = commits[-1]
+    if commit_base is None:
+        anteriores = [commit for commit in commits if commit != commit_nuevo]
+        if not anteriores:
+            raise ValueError("Hace falta haber medido al menos dos commits para comparar")
+        commit_base = anteriores[-1]
+
+    tabla = (resultados[resultados["commit"].isin([commit_base, commit_nuevo])]
+             .groupby(["prueba", "n_filas", "commit"])["segundos_min"].min()
+             .unstack("commit")
+             .reindex(columns = [commit_base, commit_nuevo]))
+    tabla["cociente"] = (tabla[commit_nuevo] / tabla[commit_base]).round(2)
+    print(f"📊 {commit_nuevo} frente a {commit_base} (cociente < 1 = más rápido):")
+    print(tabla.to_string())
+    return tabla
+
+
+def main(argv = None):
+    """python -m src.benchmark --filas 1000 100000 [--pruebas ...] [--comparar]"""
+    parser = argparse.ArgumentParser(prog = "python -m src.benchmark", description = "Banco de pruebas de rendimiento del ETL con datos sintéticos.")
+    parser.add_argument("--filas", type = int, nargs = "+", default = [1_000, 10_000], help = "Tamaños de los datos (por defecto 1000 10000).")
+    parser.add_argument("--repeticiones", type = int, default = 3)
+    parser.add_argument("--pruebas", nargs = "+", choices = PRUEBAS, default = None, help = "Pruebas a ejecutar (por defecto todas).")
+    parser.add_argument("--resultados", default = RUTA_RESULTADOS, help = f"Fichero JSONL de resultados (por defecto {RUTA_RESULTADOS}).")
+    parser.add_argument("--latencia-api", type = float, default = 0.05, help = "Latencia simulada de la API de divisas en segundos (por defecto 0.05).")
+    parser.add_argument("--ratio-sin-divisa", type = float, default = 0.2)
+    parser.add_argument("--comparar", action = "store_true", help = "Sólo compara los dos últimos commits medidos.")
+    parser.add_argument("--importacion", action = "store_true", help = "Sólo mide el tiempo de importación de los módulos del ETL.")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(args.resultados)
+        return
+    if args.importacion:
+        ejecutar_benchmark_importacion(repeticiones = args.repeticiones, ruta_resultados = args.resultados)
+        return
+    ejecutar_benchmark(args.filas, repeticiones = args.repeticiones, pruebas = args.pruebas, ruta_resultados = args.resultados,
+                       latencia_api = args.latencia_api, ratio_sin_divisa = args.ratio_sin_divisa)
+
+
+if __name__ == "__main__":
+    main()
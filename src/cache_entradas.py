@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import pickle
+import importlib.util
+import pandas as pd
+from . import salidas as sal
+
+
+# Carpeta por defecto donde se guardan las copias ya parseadas de los ficheros de entrada
+DIR_CACHE_ENTRADAS = os.path.join("output", "cache")
+
+
+def hash_archivo(ruta_archivo, tamano_bloque = 1 << 20):
+    """Calcula el hash SHA-256 del contenido de un fichero, leyéndolo por bloques.
+
+    Args:
+        ruta_archivo (str): ruta del fichero.
+        tamano_bloque (int): bytes leídos en cada bloque (1 MB por defecto).
+
+    Returns:
+        str: hash hexadecimal del contenido.
+    """
+    h = hashlib.sha256()
+    with open(ruta_archivo, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def elegir_motor_excel(motor = None):
+    """Decide qué motor usa pandas para leer el Excel.
+
+    Args:
+        motor (str or None): None --> motor por defecto de pandas (openpyxl).
+                             'auto' --> 'calamine' (lectura rápida de sólo lectura, paquete python-calamine) si está instalado; si no, el de por defecto.
+                             Cualquier otro valor se pasa tal cual a pd.read_excel (ej. 'openpyxl', 'calamine').
+
+    Returns:
+        str or None: motor a pasar a pd.read_excel.
+    """
+    if motor == "auto":
+        return "calamine" if importlib.util.find_spec("python_calamine") is not None else None
+    return motor
+
+
+def _escribir_atomico(ruta, escribir):
+    """Escribe un fichero en un temporal de la misma carpeta (ver salidas.ruta_temporal) que sustituye al anterior con os.replace:
+    si la escritura se interrumpe, el fichero anterior sigue entero."""
+    temporal = sal.ruta_temporal(ruta)
+    try:
+        escribir(temporal)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal): #error al escribir: no se deja el temporal
+            os.remove(temporal)
+
+
+def _guardar_snapshot(df, ruta_base):
+    """Guarda el DataFrame en Parquet (si pyarrow está disponible y las columnas lo permiten) o, si no, en pickle (de forma atómica,
+    ver `_escribir_atomico`).
+
+    Returns:
+        str: ruta del fichero generado.
+    """
+    if importlib.util.find_spec("pyarrow") is not None:
+        try:
+            _escribir_atomico(ruta_base + ".parquet", df.to_parquet)
+            return ruta_base + ".parquet"
+        except Exception: #columnas con tipos mezclados (ej. números y textos) que Arrow no admite
+            pass
+
+    def escribir(temporal):
+        with open(temporal, "wb") as archivo:
+            pickle.dump(df, archivo, protocol = pickle.HIGHEST_PROTOCOL)
+    _escribir_atomico(ruta_base + ".pkl", escribir)
+    return ruta_base + ".pkl"
+
+
+def _guardar_meta(ruta_meta, meta):
+    """Guarda los metadatos de una copia (de forma atómica, ver `_escribir_atomico`)."""
+    def escribir(temporal):
+        with open(temporal, "w", encoding = "utf-8") as archivo:
+            json.dump(meta, archivo, indent = 2)
+    _escribir_atomico(ruta_meta, escribir)
+
+
+def _cargar_snapshot(ruta_snapshot):
+    """Carga un snapshot guardado con `_guardar_snapshot`."""
+    if ruta_snapshot.endswith(".parquet"):
+        return pd.read_parquet(ruta_snapshot)
+    with open(ruta_snapshot, "rb") as archivo:
+        return pickle.load(archivo)
+
+
+def leer_excel_cacheado(ruta_archivo, dir_cache = DIR_CACHE_ENTRADAS, motor = None, **kwargs_excel):
+    """Lee una hoja de Excel con pd.read_excel guardando una copia ya parseada (Parquet/pickle) para las siguientes ejecuciones.
+
+    La copia se identifica por la ruta del fichero, el motor y los parámetros de lectura, y se considera válida mientras el fichero no cambie:
+        1. Mismo tamaño y fecha de modificación que la última vez --> se reutiliza la copia (sin abrir el Excel).
+        2. Si cambian el tamaño o la fecha, se compara el hash del contenido: si coincide (ej. el fichero se ha vuelto a guardar sin cambios) se reutiliza.
+        3. En otro caso se vuelve a parsear el Excel y se reemplaza la copia.
+    La copia y sus metadatos se escriben en temporales que sustituyen a los anteriores (os.replace): una ejecución interrumpida no deja la caché a medias.
+
+    Args:
+        ruta_archivo (str): ruta del Excel.
+        dir_cache (str or None): carpeta donde guardar las copias. None = no usar caché (lectura directa).
+        motor (str or None): motor de lectura del Excel (ver `elegir_motor_excel`).
+        **kwargs_excel: parámetros de pd.read_excel (sheet_name, skiprows, header, index_col...).
+
+    Returns:
+        pd.DataFrame: la hoja tal y como la devuelve pd.read_excel.
+    """
+    motor = elegir_motor_excel(motor)
+    if dir_cache is None:
+        return pd.read_excel(ruta_archivo, engine = motor, **kwargs_excel)
+
+    os.makedirs(dir_cache, exist_ok = True)
+
+    #Clave de la copia: ruta absoluta + motor + parámetros de lectura. El motor forma parte de la clave: openpyxl y calamine pueden devolver
+    #tipos distintos (ej. fechas o enteros), y con motor='auto' el motor cambia en cuanto se instala python-calamine
+    ruta_absoluta = os.path.abspath(ruta_archivo)
+    clave = hashlib.sha1(json.dumps([ruta_absoluta, motor, sorted(kwargs_excel.items())], default = str).encode()).hexdigest()[:16]
+    nombre_base = os.path.splitext(os.path.basename(ruta_archivo))[0]
+    ruta_base = os.path.join(dir_cache, f"{nombre_base}_{clave}")
+    ruta_meta = ruta_base + ".json"
+
+    estado = os.stat(ruta_archivo)
+    meta = None
+    if os.path.exists(ruta_meta):
+        try:
+            with open(ruta_meta, encoding = "utf-8") as archivo:
+                meta = json.load(archivo)
+        except (OSError, ValueError): #metadatos ilegibles: se vuelve a parsear el Excel
+            meta = None
+
+    if meta is not None and os.path.exists(meta["snapshot"]):
+        #CASO 1: el fichero no ha cambiado (mismo tamaño y fecha de modificación)
+        if meta["tamano"] == estado.st_size and meta["mtime"] == estado.st_mtime:
+            print(f"⚡ {os.path.basename(ruta_archivo)}: cargado desde la caché ({os.path.basename(meta['snapshot'])})")
+            return _cargar_snapshot(meta["snapshot"])
+
+        #CASO 2: ha cambiado la fecha pero no el contenido
+        contenido = hash_archivo(ruta_archivo)
+        if contenido == meta["hash"]:
+            meta.update(tamano = estado.st_size, mtime = estado.st_mtime)
+            _guardar_meta(ruta_meta, meta)
+            print(f"⚡ {os.path.basename(ruta_archivo)}: contenido sin cambios, cargado desde la caché")
+            return _cargar_snapshot(meta["snapshot"])
+    else:
+        contenido = hash_archivo(ruta_archivo)
+
+    #CASO 3: primera lectura o fichero modificado --> parseamos el Excel y guardamos la copia
+    df = pd.read_excel(ruta_archivo, engine = motor, **kwargs_excel)
+
+    anterior = meta["snapshot"] if meta is not None else None
+    ruta_snapshot = _guardar_snapshot(df, ruta_base)
+    _guardar_meta(ruta_meta, {"ruta": ruta_absoluta, "motor": motor, "tamano": estado.st_size, "mtime": estado.st_mtime,
+                              "hash": contenido, "snapshot": ruta_snapshot})
+    #la copia anterior sólo se borra cuando los metadatos ya apuntan a la nueva (ej. antes era .parquet y ahora .pkl)
+    if anterior is not None and anterior != ruta_snapshot and os.path.exists(anterior):
+        os.remove(anterior)
+
+    return df
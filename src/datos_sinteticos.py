@@ -0,0 +1,270 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+
+# Generador de ficheros de entrada sintéticos (bend.xlsm, ds.xlsx y pe.csv) con los mismos nombres de columna y formato que los reales,
+# para probar y medir el ETL sin datos de clientes (la carpeta data/ no se sube al repositorio).
+
+# Mezcla de divisas por defecto: {nombre de la divisa tal y como viene en los ficheros: peso}
+MEZCLA_DIVISAS = {"Euro": 0.35, "US Dollar": 0.30, "Brazilian Real": 0.12, "Chilean Peso": 0.10,
+                  "Mexican Peso": 0.08, "Colombian Peso": 0.05}
+
+UBICACIONES = [("madrid", "Spain"), ("barcelona", "Spain"), ("santiago", "Chile"), ("sao paulo", "Brazil"),
+               ("MEXICO city", "Mexico"), ("bogota", "Colombia"), ("new york", "United_States"), ("miami", "United_States")]
+COMENTARIOS_COMMERCIAL_MODEL = ["B4B Resale-Unmanaged", "DIA Resale-Unmanaged", "MPLS Full Managed", "Ethernet Point to Point"]
+COMENTARIOS_PE = {"B4B Resale-Unmanaged": "B4B Resale-Unmanaged internet", "DIA Resale-Unmanaged": "DIA Resale-Unmanaged internet",
+                  "MPLS Full Managed": "MPLS Full Managed", "Ethernet Point to Point": "Ethernet Point to Point"}
+PROVEEDORES_DS = ["Telefonica_Chile_S.A._(Mayorista)", "INTELIGLOBE", "Claro_Brasil", "Telmex", "Lumen"]
+PROVEEDORES_PE = {"Telefonica_Chile_S.A._(Mayorista)": "Telefonica_Empresas_Chile_S.A.", "INTELIGLOBE": "Inteliglobe_Communications_USA",
+                  "Claro_Brasil": "Claro_Brasil", "Telmex": "Telmex", "Lumen": "Lumen"}
+LOTES = ["Internet Bk", "Internet Ppal", "MPLS"]
+SERVICIOS = ["Internet", "VPN"]
+TECNOLOGIAS = ["Fiber", "DSL", "Wireless"]
+ORIGEN_PRECIO_PE = ["API", "Costbook", "Regressor"]
+
+# Excel no admite más filas por hoja (el B-End además tiene 8 filas de cabecera antes de los datos)
+MAX_FILAS_EXCEL = 1_048_576 - 10
+
+
+def _elegir(rng, valores, n, pesos = None):
+    """n valores elegidos al azar como categórica (los textos no se repiten en memoria: sirve también para millones de filas)."""
+    valores = list(valores)
+    if pesos is not None:
+        pesos = np.asarray(pesos, dtype=float) / np.sum(pesos)
+    return pd.Categorical.from_codes(rng.choice(len(valores), size = n, p = pesos), categories = pd.Index(valores, dtype = object))
+
+
+def _variar_texto(rng, valores, ratio):
+    """Escribe una parte de los valores en mayúsculas, minúsculas o con espacios alrededor, como llegan en los ficheros reales."""
+    categorias = [variante for valor in valores.categories for variante in (valor, valor.upper(), valor.lower(), f" {valor} ")]
+    codigos = valores.codes.astype(np.int64) * 4
+    variar = rng.random(len(codigos)) < ratio
+    codigos[variar] += rng.integers(1, 4, size = variar.sum())
+
+    #Algunas variantes pueden coincidir (ej. un nombre ya en mayúsculas): se unifican antes de crear la categórica
+    codigos_unicos, unicas = pd.factorize(pd.Index(categorias, dtype = object))
+    return pd.Categorical.from_codes(codigos_unicos[codigos], categories = unicas)
+
+
+def _misma_o_distinta(rng, base, ratio_misma, valores, pesos = None):
+    """Copia `base` (categórica) y cambia al azar una parte (1 - ratio_misma) de los valores por otros de `valores`."""
+    nuevos = _elegir(rng, valores, len(base), pesos)
+    categorias = pd.Index(list(base.categories) + [v for v in nuevos.categories if v not in base.categories], dtype = object)
+    resultado = pd.Categorical(base, categories = categorias)
+    cambiar = rng.random(len(base)) >= ratio_misma
+    resultado[cambiar] = nuevos[cambiar]
+    return resultado
+
+
+def _anular(rng, valores, ratio):
+    """Deja vacía (NaN) una parte `ratio` de los valores."""
+    valores = pd.Categorical(valores, copy = True)
+    valores[rng.random(len(valores)) < ratio] = np.nan
+    return valores
+
+
+def generar_bloque(inicio, n_filas, mezcla_divisas = None, ratio_sin_divisa = 0.2, ratio_alternativas = 0.1,
+                   ratio_misma_divisa = 0.7, ratio_outliers = 0.02, opciones_por_cotizacion = 4, semilla = 0):
+    """Genera las filas [inicio, inicio + n_filas) de las tres fuentes, con el formato en el que vienen en los ficheros.
+
+    Args:
+        inicio (int): nº de la primera fila (permite generar por bloques con identificadores que no se repiten).
+        n_filas (int): nº de filas del bloque.
+        mezcla_divisas (dict or None): {nombre de divisa: peso}. None = MEZCLA_DIVISAS.
+        ratio_sin_divisa (float): fracción de filas del Deal Specialist sin 'Main Access Currency' (las completa completing_currency).
+        ratio_alternativas (float): fracción de ofertas del B-End que no son 'Response to Request' (se descartan al cargarlo).
+        ratio_misma_divisa (float): fracción de filas de DS y PE con la misma divisa que el B-End.
+        ratio_outliers (float): fracción de precios del PE muy alejados del DS (outliers de la delta).
+        opciones_por_cotizacion (int): opciones (filas) por quotation_ID.
+        semilla (int): semilla aleatoria (mismo valor --> mismos datos).
+
+    Returns:
+        dict: {'bend': DataFrame, 'ds': DataFrame, 'pe': DataFrame} con las columnas de cada fichero.
+    """
+    rng = np.random.default_rng([semilla, inicio])
+    mezcla_divisas = mezcla_divisas or MEZCLA_DIVISAS
+    n = n_filas
+    filas = np.arange(inicio, inicio + n)
+
+    quotation = pd.Series(filas // opciones_por_cotizacion + 1_000_000).astype(str).radd("Q").to_numpy(dtype = object)
+    opcion = filas + 1
+    site = pd.Series(filas).astype(str).radd("S").to_numpy(dtype = object)
+    ubicacion = rng.integers(0, len(UBICACIONES), size = n)
+    ciudades = pd.Categorical.from_codes(ubicacion, categories = pd.Index([c for c, _ in UBICACIONES], dtype = object))
+    paises_unicos = pd.Index([p for _, p in UBICACIONES], dtype = object).unique()
+    paises = pd.Categorical.from_codes(paises_unicos.get_indexer([p for _, p in UBICACIONES])[ubicacion], categories = paises_unicos)
+
+    #Columnas comunes (mismo servicio en las tres fuentes)
+    comunes = {
+        "Option ID": opcion,
+        "Standard Services": _elegir(rng, SERVICIOS, n),
+        "Site ID": site,
+        "Lot": _elegir(rng, LOTES, n),
+        "City": ciudades,
+        "Country": paises,
+        "Main access speed UpStream (Kbps)": rng.choice([1000, 10000, 100000], size = n),
+        "Main access speed DownStream (kbps)": rng.choice([1000, 10000, 100000], size = n),
+        "Main access technology": _elegir(rng, TECNOLOGIAS, n),
+        "Main Access Guaranteed Bandwidth %": rng.choice([50, 100], size = n),
+    }
+    plazo = rng.choice([12, 24, 36], size = n)
+    comentario_req = _elegir(rng, COMENTARIOS_COMMERCIAL_MODEL, n, [0.4, 0.3, 0.2, 0.1])
+    divisa_req = _elegir(rng, mezcla_divisas.keys(), n, list(mezcla_divisas.values()))
+    proveedor = _elegir(rng, PROVEEDORES_DS, n)
+
+    #B-End: la primera columna (sin nombre) es el quotation_ID
+    bend = pd.DataFrame({"": quotation, **comunes,
+                         "Comments VPN Site Info\n/Commercial Model": comentario_req,
+                         "Contract Term (month)": plazo,
+                         "Main Access Provider (last mile Provider)": proveedor,
+                         "Main Access Currency": _variar_texto(rng, divisa_req, 0.1),
+                         "Does this offer match the customer request": _elegir(rng, ["Response to Request", "Alternative offer"], n,
+                                                                               [1 - ratio_alternativas, ratio_alternativas])})
+
+    #Deal Specialist: países en mayúsculas, divisa a veces vacía (con divisas de respaldo) y proveedores con otro nombre
+    divisa_ds = _misma_o_distinta(rng, divisa_req, ratio_misma_divisa, mezcla_divisas.keys(), list(mezcla_divisas.values()))
+    nrc_ds = np.round(rng.lognormal(5.5, 0.8, size = n), 2)
+    mrc_ds = np.round(rng.lognormal(5.0, 0.7, size = n), 2)
+    ds_comunes = dict(comunes)
+    ds_comunes["Country"] = pd.Categorical(paises).rename_categories(lambda p: p.upper())
+    ds = pd.DataFrame({"": quotation, **ds_comunes,
+                       "Comments VPN Site Info\n/Commercial Model": _misma_o_distinta(rng, comentario_req, 0.9, COMENTARIOS_COMMERCIAL_MODEL),
+                       "Contract Term (month)": plazo,
+                       "Main Access Provider (last mile Provider)": proveedor,
+                       "Main Access Currency": _anular(rng, _variar_texto(rng, divisa_ds, 0.1), ratio_sin_divisa),
+                       "Back Up Maintenance Currency": _anular(rng, divisa_ds, 0.5),
+                       "Main Maintenance Currency": _anular(rng, divisa_ds, 0.1),
+                       "Main Access NRC": nrc_ds,
+                       "Main Access MRC": mrc_ds},
+                      index = filas + 10)
+
+    #Pricing Engine: nombres de columna propios, unique_id con el quotation_ID dentro y precios alrededor de los del DS
+    divisa_pe = _misma_o_distinta(rng, divisa_req, ratio_misma_divisa, mezcla_divisas.keys(), list(mezcla_divisas.values()))
+    ruido = rng.lognormal(0.0, 0.15, size = n)
+    outliers = rng.random(n) < ratio_outliers
+    ruido[outliers] *= rng.choice([0.2, 5.0], size = outliers.sum())
+    comentario_pe = _misma_o_distinta(rng, comentario_req, 0.85, COMENTARIOS_COMMERCIAL_MODEL)
+    pe = pd.DataFrame({
+        "unique_id": pd.Series(quotation).radd("PE 2024 ").str.cat(pd.Series(filas % opciones_por_cotizacion).astype(str), sep = "_").to_numpy(dtype = object),
+        "option_id": opcion,
+        "vpn_site_comments_des": comentario_pe.rename_categories(lambda c: COMENTARIOS_PE[c]),
+        "standard_services_cd": comunes["Standard Services"],
+        "site_id": site,
+        "lot_cd": comunes["Lot"],
+        "city_name": ciudades,
+        "country_name": paises,
+        "main_access_speed_upstream_kbps_qt": comunes["Main access speed UpStream (Kbps)"],
+        "main_access_speed_downstream_kbps_qt": comunes["Main access speed DownStream (kbps)"],
+        "main_access_technology_name": comunes["Main access technology"],
+        "main_access_guaranteed_bandwidth_qt": comunes["Main Access Guaranteed Bandwidth %"],
+        "contract_term_cd": plazo,
+        "main_access_provider_name": proveedor.rename_categories(lambda p: PROVEEDORES_PE[p]),
+        "main_access_currency_cd": divisa_pe,
+        "main_access_nrc_amt_quoted_by": _elegir(rng, ORIGEN_PRECIO_PE, n),
+        "main_access_nrc_amt": np.round(nrc_ds * ruido, 2),
+        "main_access_mrc_amt_quoted_by": _elegir(rng, ORIGEN_PRECIO_PE, n),
+        "main_access_mrc_amt": np.round(mrc_ds * ruido, 2),
+        "pricing_engine_version": "v3",
+        "quote_timestamp": pd.Timestamp("2024-01-01") + pd.to_timedelta(filas % 86_400, unit = "s"),
+    })
+
+    return {"bend": bend, "ds": ds, "pe": pe}
+
+
+def _escribir_excel(ruta, bloques, hoja, filas_previas = (), con_indice = False):
+    """Escribe en una hoja de Excel los DataFrames de `bloques` (uno detrás de otro) en modo sólo escritura de openpyxl (memoria constante).
+
+    Args:
+        ruta (str): fichero de salida.
+        bloques (iterable): DataFrames con las mismas columnas.
+        hoja (str): nombre de la hoja.
+        filas_previas (iterable): filas a escribir antes de la cabecera (ej. el título del B-End).
+        con_indice (bool): si True, el índice se escribe como primera columna (como hace pandas con to_excel).
+    """
+    libro = Workbook(write_only = True)
+    pestana = libro.create_sheet(hoja)
+    for fila in filas_previas:
+        pestana.append(list(fila))
+
+    cabecera_escrita = False
+    for bloque in bloques:
+        if not cabecera_escrita:
+            pestana.append(([None] if con_indice else []) + list(bloque.columns))
+            cabecera_escrita = True
+        columnas = [bloque.index.to_numpy(dtype = object)] if con_indice else []
+        columnas += [bloque[col].astype(object).where(bloque[col].notna(), None).to_numpy() for col in bloque.columns]
+        for fila in zip(*columnas):
+            pestana.append([valor.item() if isinstance(valor, np.generic) else valor for valor in fila])
+    libro.save(ruta)
+
+
+def generar_ficheros(dir_salida, n_filas = 10_000, tamano_bloque = 500_000, semilla = 0, **opciones):
+    """Genera bend.xlsm, ds.xlsx y pe.csv en `dir_salida`, por bloques de filas (memoria acotada aunque se pidan millones de filas).
+
+    Los Excel se cortan en MAX_FILAS_EXCEL filas (límite de Excel); pe.csv tiene siempre todas las filas pedidas.
+
+    Args:
+        dir_salida (str): carpeta donde se escriben los ficheros (ej. 'data_sintetica'). Se pasa a `python -m src --datos`.
+        n_filas (int): nº de ofertas a generar (de 1.000 a 10.000.000).
+        tamano_bloque (int): filas generadas y escritas de cada vez.
+        semilla (int): semilla aleatoria.
+        **opciones: resto de parámetros de `generar_bloque` (mezcla_divisas, ratio_sin_divisa, ratio_alternativas...).
+
+    Returns:
+        dict: {'bend': ruta, 'ds': ruta, 'pe': ruta}
+    """
+    os.makedirs(dir_salida, exist_ok = True)
+    rutas = {"bend": os.path.join(dir_salida, "bend.xlsm"), "ds": os.path.join(dir_salida, "ds.xlsx"), "pe": os.path.join(dir_salida, "pe.csv")}
+    filas_excel = min(n_filas, MAX_FILAS_EXCEL)
+    if filas_excel < n_filas:
+        print(f"⚠️ Excel admite como máximo {MAX_FILAS_EXCEL} filas: bend.xlsm y ds.xlsx tendrán las primeras {filas_excel}; pe.csv tendrá las {n_filas}")
+
+    def bloques(fuente, limite):
+        for inicio in range(0, limite, tamano_bloque):
+            yield generar_bloque(inicio, min(tamano_bloque, limite - inicio), semilla = semilla, **opciones)[fuente]
+
+    #Pricing Engine: CSV separado por ';', escrito por bloques
+    for i, bloque in enumerate(bloques("pe", n_filas)):
+        bloque.to_csv(rutas["pe"], sep = ";", index = False, mode = "w" if i == 0 else "a", header = i == 0)
+    print(f"📁 {rutas['pe']}: {n_filas} filas")
+
+    #B-End: título en la primera fila y cabecera en la fila 8 (el cargador lee con skiprows=6, header=1)
+    _escribir_excel(rutas["bend"], bloques("bend", filas_excel), "B-Ends", filas_previas = [["B-End request (datos sintéticos)"]] + [[]] * 6)
+    print(f"📁 {rutas['bend']}: {filas_excel} filas")
+
+    #Deal Specialist: el índice va en la primera columna (el cargador lee con index_col=0)
+    _escribir_excel(rutas["ds"], bloques("ds", filas_excel), "Sheet1", con_indice = True)
+    print(f"📁 {rutas['ds']}: {filas_excel} filas")
+
+    return rutas
+
+
+def _leer_mezcla(texto):
+    """'Euro=0.5,US Dollar=0.5' --> {'Euro': 0.5, 'US Dollar': 0.5}"""
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, peso = parte.rsplit("=", 1)
+        mezcla[nombre.strip()] = float(peso)
+    return mezcla
+
+
+def main(argv = None):
+    """python -m src.datos_sinteticos --filas 100000 --salida data_sintetica"""
+    parser = argparse.ArgumentParser(prog = "python -m src.datos_sinteticos", description = "Genera bend.xlsm, ds.xlsx y pe.csv sintéticos.")
+    parser.add_argument("--filas", type = int, default = 10_000, help = "Nº de ofertas (por defecto 10000).")
+    parser.add_argument("--salida", default = "data_sintetica", help = "Carpeta de salida (por defecto data_sintetica).")
+    parser.add_argument("--divisas", type = _leer_mezcla, default = None, help = "Mezcla de divisas, ej. 'Euro=0.5,US Dollar=0.3,Chilean Peso=0.2'.")
+    parser.add_argument("--ratio-sin-divisa", type = float, default = 0.2, help = "Fracción de filas del DS sin divisa (por defecto 0.2).")
+    parser.add_argument("--ratio-alternativas", type = float, default = 0.1, help = "Fracción de ofertas alternativas en el B-End (por defecto 0.1).")
+    parser.add_argument("--semilla", type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    generar_ficheros(args.salida, n_filas = args.filas, semilla = args.semilla, mezcla_divisas = args.divisas,
+                     ratio_sin_divisa = args.ratio_sin_divisa, ratio_alternativas = args.ratio_alternativas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+# requests se importa la primera vez que se llama a la API (ver `_get` y `crear_sesion`): importar el módulo no carga el cliente HTTP
+
+
+# Dirección base de la API. Se puede cambiar (ej. por un servidor local de pruebas) antes de llamar a las funciones del módulo.
+URL_BASE_API = "https://api.fxratesapi.com"
+URL_API_CONVERT = "{url_base}/convert?from={origen}&to={destino}&format=json"
+URL_API_LATEST = "{url_base}/latest?base={base}&currencies={divisas}&format=json"
+URL_API_TIMESERIES = "{url_base}/timeseries?start_date={desde}&end_date={hasta}&base={base}&currencies={divisas}&format=json"
+
+# Días de histórico que se piden como mucho en cada llamada a /timeseries (los rangos más largos se piden por tramos)
+DIAS_POR_LLAMADA = 366
+# Días que se piden antes de la primera fecha: una oferta de un sábado o de un festivo toma la tasa del último día con datos
+DIAS_PREVIOS = 7
+
+# Caché persistente por defecto (un fichero SQLite dentro de output/, que se conserva entre ejecuciones de main.py)
+RUTA_CACHE_DIVISAS = os.path.join("output", "cache_divisas.sqlite")
+
+# Contadores acumulados de las llamadas a la API (los usa instrumentacion.py para el informe de cada etapa).
+# latencia_max es la de la ejecución medida en curso: instrumentacion.iniciar la reinicia
+ESTADISTICAS_HTTP = {"llamadas": 0, "errores": 0, "segundos": 0.0, "latencia_max": 0.0}
+_BLOQUEO_ESTADISTICAS = threading.Lock() #las llamadas de precargar_tasas se hacen desde varios hilos
+
+
+def _get(url, timeout, sesion=None):
+    """GET a la API registrando el nº de llamadas, los errores y la latencia en ESTADISTICAS_HTTP."""
+    inicio = time.perf_counter()
+    correcta = False
+    try:
+        if sesion is None:
+            import requests
+            sesion = requests
+        r = sesion.get(url, timeout=timeout)
+        correcta = r.status_code == 200
+        return r
+    finally:
+        duracion = time.perf_counter() - inicio
+        with _BLOQUEO_ESTADISTICAS:
+            ESTADISTICAS_HTTP["llamadas"] += 1
+            ESTADISTICAS_HTTP["errores"] += not correcta
+            ESTADISTICAS_HTTP["segundos"] += duracion
+            ESTADISTICAS_HTTP["latencia_max"] = max(ESTADISTICAS_HTTP["latencia_max"], duracion)
+
+
+def crear_sesion(reintentos=3, backoff=0.5, max_conexiones=10):
+    """Crea una sesión HTTP reutilizable (conexiones keep-alive) con reintentos automáticos y espera exponencial entre intentos.
+
+    Args:
+        reintentos (int): número máximo de reintentos por petición (errores de conexión y respuestas 429/5xx).
+        backoff (float): factor de espera entre reintentos: backoff * 2^(n-1) segundos.
+        max_conexiones (int): tamaño del pool de conexiones (conviene que sea >= número de hilos que comparten la sesión).
+
+    Returns:
+        requests.Session: sesión lista para usar.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    politica = Retry(total = reintentos,
+                     backoff_factor = backoff,
+                     status_forcelist = (429, 500, 502, 503, 504),
+                     allowed_methods = ("GET",))
+    adaptador = HTTPAdapter(max_retries = politica, pool_connections = max_conexiones, pool_maxsize = max_conexiones)
+
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def obtener_tasa_cambio(origen, destino, cache=None, timeout=10, sesion=None):
+    """Dado un par de monedas (ej.: "USD" a "EUR") esta función:
+        (1) Consulta la API FXRatesAPI para saber el tipo de cambio actual.
+        (2) Guarda los resultados en memoria temporal (cache) para no repetir la llamada en caso de que se repita el par de currencies para los que necesitamos conversión.
+        (3) Devuelve el exchange rate para que luego se use en la conversión de "presupuestos".
+
+    Args:
+        origen (str): código de divisa origen (ej.: "USD")
+        destino (str): código de divisa destino (ej.: "EUR")
+        cache (dict, opcional): diccionario {(origen, destino): tasa} donde guardar/consultar los tipos de cambio ya obtenidos.
+        timeout (int): segundos máximos de espera de la respuesta de la API.
+        sesion (requests.Session, opcional): sesión HTTP a reutilizar (ver `crear_sesion`). Si es None se hace una petición suelta.
+
+    Returns:
+        float: tipo de cambio obtenido de la API (o None si no se ha podido obtener). Lo aplicamos con un ejemplo:
+                Ej. obtener_tasa_cambio("USD", "EUR")  output--> 0.8672701405
+    """
+
+    #CASO 1: no se necesita conversión
+    if origen == destino:
+        return 1
+
+    #CASO 2: se necesita conversión y tenemos almacenado en el caché el tipo de cambio
+    par = (origen, destino) #Guardamos el par de divisas como una tupla (ej.: ("USD", "EUR")).
+    if cache is not None and par in cache:
+        return cache[par]
+
+    #CASO 3: Llamamos a la API si no encuentra el tipo de cambio en el cache
+    url = URL_API_CONVERT.format(url_base=URL_BASE_API, origen=origen, destino=destino)
+
+    try:
+        r = _get(url, timeout=timeout, sesion=sesion) #Esperamos un máximo de `timeout` segundos evitando que el script se quede colgado indefinidamente si el servidor no responde.
+        if r.status_code == 200:
+
+            data = r.json() #convertimos la respuesta exitosa a un dict de Python (JSON)
+            tasa = data.get("info", {}).get("rate", None) #Extraemos del JSON el valor del tipo de cambio (que está en "info": {....., "rate": 0.923421},) Si no existe, nos da None.
+            if cache is not None:
+                cache[par] = tasa #Guardamos la tasa en el cache para futuros usos
+
+            return tasa
+
+    #CASO 4: Si hay algún error (red, timeout, etc.), lo imprime y devuelve None.
+    except Exception as e:
+        print(f"Error al obtener tipo de cambio {origen} --> {destino}: {e}")
+
+    return None
+
+
+def obtener_tabla_base(divisas, base="USD", timeout=10, sesion=None):
+    """Descarga en UNA sola llamada los tipos de cambio de la divisa `base` frente a todas las divisas indicadas.
+
+    Args:
+        divisas (iterable): códigos ISO que queremos en la tabla (ej. ["EUR", "BRL"]).
+        base (str): divisa base de la tabla.
+        timeout (int): segundos máximos de espera de la respuesta.
+        sesion (requests.Session, opcional): sesión HTTP a reutilizar.
+
+    Returns:
+        dict: {codigo_ISO: unidades de esa divisa por 1 unidad de `base`}. Incluye siempre la propia base (= 1).
+              Si la API falla, devuelve sólo {base: 1}.
+    """
+    tabla = {base: 1.0}
+    divisas = sorted(set(divisas) - {base})
+    if not divisas:
+        return tabla
+
+    url = URL_API_LATEST.format(url_base=URL_BASE_API, base=base, divisas=",".join(divisas))
+    try:
+        r = _get(url, timeout=timeout, sesion=sesion)
+        if r.status_code == 200:
+            tasas = r.json().get("rates", {}) or {}
+            tabla.update({divisa: float(tasa) for divisa, tasa in tasas.items() if divisa in divisas and tasa})
+    except Exception as e:
+        print(f"Error al obtener la tabla de tipos de cambio con base {base}: {e}")
+
+    return tabla
+
+
+def precargar_tasas(pares, triangular=True, base="USD", max_hilos=8, timeout=10, sesion=None):
+    """Resuelve de golpe (y no de uno en uno) los tipos de cambio de todos los pares distintos (origen, destino).
+
+    Funcionamiento:
+        1. Si `triangular` es True, descarga una única tabla con base `base` y calcula cada par como tabla[destino] / tabla[origen]
+           (N divisas --> 1 llamada, en lugar de N² llamadas par a par).
+        2. Los pares que no se hayan podido triangular se consultan a /convert en paralelo (pool de hilos) compartiendo una sesión keep-alive con reintentos.
+
+    Args:
+        pares (iterable): pares (origen, destino) en código ISO.
+        triangular (bool): si True, usa la tabla de la divisa base para calcular los pares.
+        base (str): divisa base para triangular.
+        max_hilos (int): número máximo de peticiones simultáneas a la API.
+        timeout (int): segundos máximos de espera de cada petición.
+        sesion (requests.Session, opcional): sesión HTTP a reutilizar. Si es None se crea una para esta llamada.
+
+    Returns:
+        dict: {(origen, destino): tasa o None}
+    """
+    pares = sorted(set(pares))
+    tasas = {par: 1 for par in pares if par[0] == par[1]}
+    pendientes = [par for par in pares if par not in tasas]
+    if not pendientes:
+        return tasas
+
+    sesion_propia = sesion is None
+    if sesion_propia:
+        sesion = crear_sesion(max_conexiones = max_hilos)
+
+    try:
+        #PASO 1: triangulación a partir de una sola tabla de la divisa base
+        if triangular:
+            divisas = {divisa for par in pendientes for divisa in par}
+            tabla = obtener_tabla_base(divisas, base = base, timeout = timeout, sesion = sesion)
+            for origen, destino in pendientes:
+                if origen in tabla and destino in tabla:
+                    tasas[(origen, destino)] = tabla[destino] / tabla[origen]
+            pendientes = [par for par in pendientes if par not in tasas]
+
+        #PASO 2: el resto de pares, en paralelo contra /convert
+        if pendientes:
+            with ThreadPoolExecutor(max_workers = max_hilos) as pool:
+                resultados = pool.map(lambda par: obtener_tasa_cambio(par[0], par[1], timeout = timeout, sesion = sesion), pendientes)
+                tasas.update(zip(pendientes, resultados))
+    finally:
+        if sesion_propia:
+            sesion.close()
+
+    return tasas
+
+
+def _conectar_cache(ruta_cache):
+    """Abre (o crea si no existe) la base de datos SQLite de la caché de tipos de cambio.
+
+    La tabla `tasas` guarda una fila por par de divisas y fecha de descarga:
+        origen | destino | fecha (YYYY-MM-DD) | tasa | obtenido_en (segundos epoch)
+
+    Las tablas `historico` e `historico_rangos` guardan los tipos de cambio históricos (ver `tabla_tasas_historicas`):
+        historico:        base | divisa | fecha (YYYY-MM-DD) | tasa (unidades de `divisa` por 1 unidad de `base`)
+        historico_rangos: base | divisa | desde | hasta --> rangos de fechas ya descargados de cada divisa, ya unidos: los rangos que se solapan
+                          o son consecutivos se guardan como uno solo (ver `_unir_rangos`), así que una fila cubre todo lo descargado seguido
+
+    Args:
+        ruta_cache (str): ruta del fichero SQLite (ej. "output/cache_divisas.sqlite").
+
+    Returns:
+        sqlite3.Connection: conexión abierta.
+    """
+    carpeta = os.path.dirname(ruta_cache)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+
+    conexion = sqlite3.connect(ruta_cache)
+    conexion.execute("""CREATE TABLE IF NOT EXISTS tasas (
+                            origen TEXT NOT NULL,
+                            destino TEXT NOT NULL,
+                            fecha TEXT NOT NULL,
+                            tasa REAL NOT NULL,
+                            obtenido_en REAL NOT NULL,
+                            PRIMARY KEY (origen, destino, fecha))""")
+    conexion.execute("""CREATE TABLE IF NOT EXISTS historico (
+                            base TEXT NOT NULL,
+                            divisa TEXT NOT NULL,
+                            fecha TEXT NOT NULL,
+                            tasa REAL NOT NULL,
+                            PRIMARY KEY (base, divisa, fecha))""")
+    conexion.execute("""CREATE TABLE IF NOT EXISTS historico_rangos (
+                            base TEXT NOT NULL,
+                            divisa TEXT NOT NULL,
+                            desde TEXT NOT NULL,
+                            hasta TEXT NOT NULL)""")
+    #Cachés anteriores sin índice único: pueden tener rangos repetidos o solapados; se unen una vez antes de crear el índice
+    if not conexion.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'historico_rangos_clave'").fetchone():
+        rangos = conexion.execute("SELECT base, divisa, desde, hasta FROM historico_rangos").fetchall()
+        conexion.execute("DELETE FROM historico_rangos")
+        conexion.executemany("INSERT INTO historico_rangos VALUES (?, ?, ?, ?)", _unir_rangos(rangos))
+        conexion.execute("CREATE UNIQUE INDEX historico_rangos_clave ON historico_rangos (base, divisa, desde)")
+        conexion.commit()
+    return conexion
+
+
+def _unir_rangos(rangos):
+    """Une los rangos de fechas de cada (base, divisa) que se solapan o son consecutivos (ej. enero-marzo y abril-junio --> enero-junio).
+
+    Args:
+        rangos (iterable): filas (base, divisa, desde, hasta) con las fechas en texto YYYY-MM-DD.
+
+    Returns:
+        list: filas (base, divisa, desde, hasta) sin solapes, ordenadas.
+    """
+    unidos = []
+    for base, divisa, desde, hasta in sorted(rangos):
+        if unidos and unidos[-1][:2] == (base, divisa) and pd.Timestamp(desde) <= pd.Timestamp(unidos[-1][3]) + pd.Timedelta(days=1):
+            unidos[-1] = (base, divisa, unidos[-1][2], max(unidos[-1][3], hasta))
+        else:
+            unidos.append((base, divisa, desde, hasta))
+    return unidos
+
+
+def leer_tasas_cache(pares, ruta_cache=RUTA_CACHE_DIVISAS, ttl_horas=24):
+    """Lee de la caché persistente el tipo de cambio más reciente de cada par.
+
+    Args:
+        pares (iterable): pares (origen, destino) en código ISO que queremos consultar.
+        ruta_cache (str): ruta del fichero SQLite de la caché.
+        ttl_horas (float or None): antigüedad máxima (en horas) para considerar vigente un tipo de cambio. None = nunca caduca.
+
+    Returns:
+        tuple: (vigentes, caducadas) --> dos diccionarios {(origen, destino): tasa}. Las caducadas sólo se usan como último recurso si la API falla.
+    """
+    pares = set(pares)
+    vigentes, caducadas = {}, {}
+    if not pares or not os.path.exists(ruta_cache):
+        return vigentes, caducadas
+
+    limite = None if ttl_horas is None else time.time() - ttl_horas * 3600
+
+    conexion = _conectar_cache(ruta_cache)
+    try:
+        filas = conexion.execute("""SELECT origen, destino, tasa, obtenido_en FROM tasas
+                                    ORDER BY obtenido_en""").fetchall() #ordenamos por antigüedad: la última fila de cada par es la más reciente
+    finally:
+        conexion.close()
+
+    for origen, destino, tasa, obtenido_en in filas:
+        par = (origen, destino)
+        if par not in pares:
+            continue
+        if limite is None or obtenido_en >= limite:
+            vigentes[par] = tasa
+            caducadas.pop(par, None)
+        elif par not in vigentes:
+            caducadas[par] = tasa
+
+    return vigentes, caducadas
+
+
+def guardar_tasas_cache(tasas, ruta_cache=RUTA_CACHE_DIVISAS, max_entradas=10000):
+    """Guarda en la caché persistente los tipos de cambio obtenidos hoy y elimina las entradas más antiguas si se supera el tamaño máximo.
+
+    Args:
+        tasas (dict): {(origen, destino): tasa}. Las tasas None (la API no respondió) no se guardan.
+        ruta_cache (str): ruta del fichero SQLite de la caché.
+        max_entradas (int or None): número máximo de filas que conservamos (se descartan las más antiguas). None = sin límite.
+    """
+    ahora = time.time()
+    fecha = datetime.now().strftime("%Y-%m-%d")
+    filas = [(origen, destino, fecha, float(tasa), ahora) for (origen, destino), tasa in tasas.items() if tasa is not None]
+
+    conexion = _conectar_cache(ruta_cache)
+    try:
+        conexion.executemany("INSERT OR REPLACE INTO tasas VALUES (?, ?, ?, ?, ?)", filas)
+
+        if max_entradas is not None:
+            conexion.execute("""DELETE FROM tasas WHERE rowid NOT IN (
+                                    SELECT rowid FROM tasas ORDER BY obtenido_en DESC LIMIT ?)""", (max_entradas,))
+        conexion.commit()
+    finally:
+        conexion.close()
+
+
+def resolver_tasas(pares, ruta_cache=None, ttl_horas=24, max_entradas=10000, offline=False, triangular=True, max_hilos=8):
+    """Obtiene el tipo de cambio de cada par distinto (origen, destino), consultando primero la caché persistente y sólo después la API.
+
+    Orden de búsqueda de cada par:
+        1. Mismo origen y destino --> 1 (no hace falta conversión).
+        2. Caché persistente vigente (no más antigua que `ttl_horas`).
+        3. API (salvo en modo `offline`), todos los pares pendientes a la vez con `precargar_tasas`. Lo obtenido se guarda en la caché para las siguientes ejecuciones.
+        4. Si la API falla, se reutiliza el último valor caducado de la caché (avisando por pantalla).
+
+    Args:
+        pares (iterable): pares (origen, destino) en código ISO.
+        ruta_cache (str or None): ruta del fichero SQLite de la caché. Si es None, la caché sólo vive durante esta llamada (comportamiento original).
+        ttl_horas (float or None): antigüedad máxima de un tipo de cambio de la caché. None = nunca caduca.
+        max_entradas (int or None): tamaño máximo de la caché persistente.
+        offline (bool): si True, no se hace ninguna llamada a la API: sólo se usan tipos de cambio de la caché.
+        triangular (bool): si True, los pares se calculan a partir de una única tabla de tipos de cambio (ver `precargar_tasas`).
+        max_hilos (int): número máximo de peticiones simultáneas a la API.
+
+    Returns:
+        tuple: (tasas, pares_sin_tasa)
+            - tasas (dict): {(origen, destino): tasa o None}
+            - pares_sin_tasa (list): pares para los que no se ha podido obtener el tipo de cambio.
+    """
+    pares = sorted(set(pares))
+    tasas = {par: 1 for par in pares if par[0] == par[1]}
+    pendientes = [par for par in pares if par not in tasas]
+
+    vigentes, caducadas = {}, {}
+    if ruta_cache is not None:
+        vigentes, caducadas = leer_tasas_cache(pendientes, ruta_cache, ttl_horas)
+    tasas.update(vigentes)
+    pendientes = [par for par in pendientes if par not in vigentes]
+
+    nuevas = {}
+    if not offline and pendientes:
+        nuevas = precargar_tasas(pendientes, triangular = triangular, max_hilos = max_hilos)
+        if ruta_cache is not None and nuevas:
+            guardar_tasas_cache(nuevas, ruta_cache, max_entradas)
+    tasas.update(nuevas)
+
+    # Si la API no ha respondido (o estamos offline), usamos el último valor conocido aunque esté caducado
+    for par in pendientes:
+        if tasas.get(par) is None and par in caducadas:
+            print(f"⚠️ Tipo de cambio {par[0]} --> {par[1]} caducado en caché: se reutiliza el último valor conocido ({caducadas[par]})")
+            tasas[par] = caducadas[par]
+
+    pares_sin_tasa = [par for par in pares if tasas.get(par) is None]
+    for par in pares_sin_tasa:
+        tasas[par] = None
+
+    print(f"💱 Tipos de cambio: {len(pares)} pares distintos | {len(vigentes)} desde caché | "
+          f"{sum(tasa is not None for tasa in nuevas.values())} obtenidos de la API")
+    if pares_sin_tasa:
+        motivo = "no están en la caché (modo offline)" if offline else "no se han podido obtener"
+        print(f"❌ {len(pares_sin_tasa)} pares {motivo}: {', '.join(f'{o}->{d}' for o, d in pares_sin_tasa)}")
+
+    return tasas, pares_sin_tasa
+
+
+# --------------------------------------------------------------------------------------------------------------------------------------
+# Tipos de cambio históricos: una tabla divisa x fecha (frente a una divisa base) para convertir cada oferta con el tipo de cambio de su fecha.
+# Se carga de un fichero local o se descarga de la API una sola vez por rango de fechas (y se guarda en la caché SQLite):
+# volver a ejecutar el análisis de un trimestre pasado da siempre el mismo resultado.
+
+COLUMNAS_HISTORICO = ['fecha', 'divisa', 'tasa']
+
+
+def _tabla_vacia():
+    return pd.DataFrame({'fecha': pd.Series(dtype='datetime64[ns]'), 'divisa': pd.Series(dtype=str), 'tasa': pd.Series(dtype=float)})
+
+
+def _normalizar_historico(tabla):
+    """Tipos y orden de una tabla histórica: fecha (datetime64[ns], sin hora), divisa (str), tasa (float > 0), ordenada por fecha."""
+    tabla = tabla[COLUMNAS_HISTORICO].copy()
+    tabla['fecha'] = pd.to_datetime(tabla['fecha'], errors='coerce').dt.normalize().astype('datetime64[ns]')
+    tabla['divisa'] = tabla['divisa'].astype(str).str.strip().str.upper()
+    tabla['tasa'] = pd.to_numeric(tabla['tasa'], errors='coerce')
+    tabla = tabla[tabla['fecha'].notna() & (tabla['tasa'] > 0)]
+    return tabla.drop_duplicates(['divisa', 'fecha'], keep='last').sort_values('fecha', kind='stable').reset_index(drop=True)
+
+
+def leer_tabla_tasas(ruta):
+    """Carga una tabla histórica de tipos de cambio de un fichero local (.csv o .parquet).
+
+    Se admiten dos formatos, siempre con las tasas como unidades de cada divisa por 1 unidad de la divisa base (ej. USD):
+        - largo: columnas fecha, divisa, tasa (una fila por divisa y fecha).
+        - ancho: columna fecha y una columna por divisa con su código ISO (ej. fecha, EUR, BRL, MXN).
+
+    Returns:
+        pd.DataFrame: columnas fecha, divisa, tasa, ordenada por fecha.
+    """
+    tabla = pd.read_parquet(ruta) if ruta.lower().endswith('.parquet') else pd.read_csv(ruta)
+    tabla.columns = tabla.columns.str.strip()
+    if 'divisa' not in tabla.columns:
+        tabla = tabla.melt(id_vars='fecha', var_name='divisa', value_name='tasa')
+    return _normalizar_historico(tabla)
+
+
+def obtener_historico(divisas, desde, hasta, base="USD", timeout=30, sesion=None):
+    """Descarga de /timeseries los tipos de cambio diarios de `base` frente a todas las `divisas` entre dos fechas
+    (una llamada por cada DIAS_POR_LLAMADA días, para todas las divisas a la vez).
+
+    Returns:
+        pd.DataFrame: columnas fecha, divisa, tasa (unidades de `divisa` por 1 unidad de `base`). Vacía si la API falla.
+                      En tabla.attrs['rangos'] quedan los rangos de fechas [(desde, hasta), ...] que se han descargado bien
+                      (los tramos que fallan no están, para no darlos por descargados en la caché).
+    """
+    divisas = sorted(set(divisas) - {base})
+    filas, rangos = [], []
+    if not divisas:
+        return _tabla_vacia()
+
+    inicio = pd.Timestamp(desde).normalize()
+    fin = pd.Timestamp(hasta).normalize()
+    while inicio <= fin:
+        tramo_fin = min(fin, inicio + pd.Timedelta(days=DIAS_POR_LLAMADA - 1))
+        url = URL_API_TIMESERIES.format(url_base=URL_BASE_API, desde=inicio.strftime("%Y-%m-%d"), hasta=tramo_fin.strftime("%Y-%m-%d"),
+                                        base=base, divisas=",".join(divisas))
+        try:
+            r = _get(url, timeout=timeout, sesion=sesion)
+            if r.status_code == 200:
+                for fecha, tasas in (r.json().get("rates", {}) or {}).items():
+                    filas.extend((fecha[:10], divisa, tasa) for divisa, tasa in (tasas or {}).items() if divisa in divisas and tasa)
+                #tramos consecutivos descargados bien --> un único rango
+                if rangos and rangos[-1][1] == inicio - pd.Timedelta(days=1):
+                    rangos[-1] = (rangos[-1][0], tramo_fin)
+                else:
+                    rangos.append((inicio, tramo_fin))
+            else:
+                print(f"Error al obtener los tipos de cambio históricos ({inicio.date()} - {tramo_fin.date()}): HTTP {r.status_code}")
+        except Exception as e:
+            print(f"Error al obtener los tipos de cambio históricos ({inicio.date()} - {tramo_fin.date()}): {e}")
+        inicio = tramo_fin + pd.Timedelta(days=1)
+
+    tabla = _normalizar_historico(pd.DataFrame(filas, columns=COLUMNAS_HISTORICO)) if filas else _tabla_vacia()
+    tabla.attrs['rangos'] = rangos
+    return tabla
+
+
+def _leer_historico_cache(divisas, desde, hasta, base, ruta_cache):
+    """Tabla histórica guardada en la caché para estas divisas y fechas, y divisas cuyo rango [desde, hasta] no está descargado entero."""
+    divisas = sorted(set(divisas) - {base})
+    if not os.path.exists(ruta_cache):
+        return _tabla_vacia(), divisas
+
+    desde, hasta = desde.strftime("%Y-%m-%d"), hasta.strftime("%Y-%m-%d")
+    conexion = _conectar_cache(ruta_cache)
+    try:
+        #los rangos guardados ya están unidos (ver `_guardar_historico_cache`): [desde, hasta] está descargado si un rango lo contiene entero
+        cubiertas = {divisa for (divisa,) in conexion.execute(
+            "SELECT DISTINCT divisa FROM historico_rangos WHERE base = ? AND desde <= ? AND hasta >= ?", (base, desde, hasta))}
+        #incluimos la última fecha anterior a `desde` de cada divisa: es la que se aplica (as-of) a las ofertas de los primeros días
+        filas = conexion.execute("""SELECT fecha, divisa, tasa FROM historico
+                                    WHERE base = ? AND fecha <= ?
+                                      AND fecha >= COALESCE((SELECT MAX(fecha) FROM historico anterior
+                                                             WHERE anterior.base = historico.base AND anterior.divisa = historico.divisa
+                                                               AND anterior.fecha <= ?), ?)""",
+                                 (base, hasta, desde, desde)).fetchall()
+    finally:
+        conexion.close()
+
+    tabla = pd.DataFrame(filas, columns=COLUMNAS_HISTORICO)
+    tabla = tabla[tabla['divisa'].isin(divisas)]
+    return _normalizar_historico(tabla), [divisa for divisa in divisas if divisa not in cubiertas]
+
+
+def _guardar_historico_cache(tabla, divisas, rangos, base, ruta_cache):
+    """Guarda en la caché las tasas descargadas y los rangos de fechas descargados bien (ver obtener_historico) de cada divisa con datos,
+    unidos con los que ya había (ver `_unir_rangos`). Los tramos que fallaron no se guardan como descargados: la siguiente ejecución los vuelve a pedir."""
+    divisas_con_datos = sorted(set(tabla['divisa']) & set(divisas))
+    conexion = _conectar_cache(ruta_cache)
+    try:
+        conexion.executemany("INSERT OR REPLACE INTO historico VALUES (?, ?, ?, ?)",
+                             [(base, divisa, fecha.strftime("%Y-%m-%d"), float(tasa))
+                              for fecha, divisa, tasa in tabla[COLUMNAS_HISTORICO].itertuples(index=False, name=None)])
+        nuevos = [(base, divisa, desde.strftime("%Y-%m-%d"), hasta.strftime("%Y-%m-%d")) for divisa in divisas_con_datos for desde, hasta in rangos]
+        anteriores = []
+        for divisa in divisas_con_datos:
+            anteriores += conexion.execute("SELECT base, divisa, desde, hasta FROM historico_rangos WHERE base = ? AND divisa = ?", (base, divisa)).fetchall()
+            conexion.execute("DELETE FROM historico_rangos WHERE base = ? AND divisa = ?", (base, divisa))
+        conexion.executemany("INSERT INTO historico_rangos VALUES (?, ?, ?, ?)", _unir_rangos(anteriores + nuevos))
+        conexion.commit()
+    finally:
+        conexion.close()
+
+
+def tabla_tasas_historicas(divisas, desde, hasta, base="USD", ruta_cache=None, ruta_tabla=None, offline=False):
+    """Tabla de tipos de cambio diarios (divisa x fecha frente a `base`) que cubre las fechas [desde, hasta].
+
+    Orden de búsqueda:
+        1. `ruta_tabla`: si se indica, se usa sólo ese fichero (ver `leer_tabla_tasas`), sin caché ni API.
+        2. Caché persistente (`ruta_cache`): las divisas cuyo rango de fechas ya se descargó no vuelven a pedirse.
+        3. API /timeseries (salvo en modo `offline`): una descarga para todas las divisas que falten y todo el rango. Se guarda en la caché.
+
+    Se piden también los DIAS_PREVIOS días anteriores a `desde`, y las fechas posteriores a hoy se piden hasta hoy
+    (el tipo de cambio de hoy se aplica a las ofertas con fecha futura).
+
+    Args:
+        divisas (iterable): códigos ISO necesarios.
+        desde, hasta (str or pd.Timestamp): primera y última fecha de las ofertas.
+        base (str): divisa frente a la que se expresan las tasas.
+        ruta_cache (str or None): fichero SQLite de la caché (el mismo que el de `resolver_tasas`). None = sin caché.
+        ruta_tabla (str or None): tabla histórica local (.csv o .parquet).
+        offline (bool): si True, no se llama a la API.
+
+    Returns:
+        pd.DataFrame: columnas fecha, divisa, tasa (unidades de `divisa` por 1 unidad de `base`), ordenada por fecha.
+    """
+    if ruta_tabla is not None:
+        tabla = leer_tabla_tasas(ruta_tabla)
+        print(f"💱 Tipos de cambio históricos: {tabla['divisa'].nunique()} divisas, {tabla['fecha'].nunique()} fechas desde {ruta_tabla}")
+        return tabla
+
+    desde = pd.Timestamp(desde).normalize()
+    hasta = min(pd.Timestamp(hasta).normalize(), pd.Timestamp.now().normalize())
+    desde = min(desde, hasta) - pd.Timedelta(days=DIAS_PREVIOS)
+    divisas = sorted(set(divisas) - {base})
+
+    tabla, pendientes = _tabla_vacia(), divisas
+    if ruta_cache is not None:
+        tabla, pendientes = _leer_historico_cache(divisas, desde, hasta, base, ruta_cache)
+
+    nuevas = _tabla_vacia()
+    if not offline and pendientes:
+        nuevas = obtener_historico(pendientes, desde, hasta, base=base)
+        if ruta_cache is not None and not nuevas.empty:
+            _guardar_historico_cache(nuevas, pendientes, nuevas.attrs.get('rangos', []), base, ruta_cache)
+        tabla = _normalizar_historico(pd.concat([tabla, nuevas])) #si una fecha está en las dos, se queda la descargada
+
+    print(f"💱 Tipos de cambio históricos ({desde.date()} - {hasta.date()}): {len(divisas)} divisas | "
+          f"{len(divisas) - len(pendientes)} desde caché | {nuevas['divisa'].nunique()} obtenidas de la API")
+    sin_datos = sorted(set(divisas) - set(tabla['divisa']))
+    if sin_datos:
+        print(f"❌ Sin tipos de cambio históricos para: {', '.join(sin_datos)}")
+    return tabla
@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+from . import instrumentacion as ins
+
+
+# Agrupaciones para las que se calculan los cuartiles y los outliers de la delta (además del total): {nombre: columna}
+GRUPOS_OUTLIERS = {'lot': 'Lot_pe',
+                   'commercial_model': 'Commercial_Model_req',
+                   'pais': 'Country_req',
+                   'proveedor': 'Main_Access_Provider_(last_mile_Provider)_pe'}
+
+AGRUPACION_GLOBAL = 'global'
+GRUPO_GLOBAL = 'Total'
+GRUPO_SIN_DATO = 'Sin dato' #filas con la columna de agrupación vacía
+
+# Dimensiones de las tablas resumen para Power BI (ver tablas_resumen): {nombre: columna}
+DIMENSIONES_RESUMEN = {'pais': 'Country_req',
+                       'lot': 'Lot_pe',
+                       'commercial_model': 'Commercial_Model_req',
+                       'proveedor': 'Main_Access_Provider_(last_mile_Provider)_pe',
+                       'fuente_precio_pe': 'main_access_mrc_amt_quoted_by_pe',
+                       'cambio_divisa_pe': 'same_currency_as_B-End_pe'}
+
+# Columnas que se suman en las tablas resumen (FCV ya convertidos a la divisa del B-End)
+COLUMNAS_SUMA_RESUMEN = ['FCV_ds_conv', 'FCV_pe_conv']
+
+AGRUPACION_DETALLE = 'detalle' #todas las dimensiones a la vez
+
+
+def _estadisticas_grupos(valores, codigos, n_grupos, factor, decimales):
+    """Cuartiles, límites de outliers y recuentos de cada grupo a la vez (una agrupación), sin tener en cuenta los valores vacíos.
+
+    Args:
+        valores (np.ndarray): valores float de la columna analizada (NaN = sin dato).
+        codigos (np.ndarray): grupo de cada fila (0..n_grupos-1).
+
+    Returns:
+        tuple: (DataFrame con una fila por grupo, array bool con los outliers de cada fila)
+    """
+    serie = pd.Series(valores)
+    agrupado = serie.groupby(codigos)
+    cuartiles = agrupado.quantile([0.25, 0.5, 0.75]).unstack().reindex(index = range(n_grupos), columns = [0.25, 0.5, 0.75]) #ignora los NaN
+    extremos = agrupado.agg(['min', 'max']).reindex(range(n_grupos))
+
+    q1 = cuartiles[0.25].round(decimales).to_numpy()
+    q3 = cuartiles[0.75].round(decimales).to_numpy()
+    ric = q3 - q1
+    limite_inferior = q1 - factor * ric
+    limite_superior = q3 + factor * ric
+
+    #Límites de cada fila a partir de los de su grupo: las comparaciones con NaN dan False (un valor vacío nunca es outlier)
+    inferiores = valores < limite_inferior[codigos]
+    superiores = valores > limite_superior[codigos]
+    con_dato = ~np.isnan(valores)
+
+    tabla = pd.DataFrame({
+        'filas': np.bincount(codigos, minlength = n_grupos),
+        'filas_con_dato': np.bincount(codigos[con_dato], minlength = n_grupos),
+        'q1': q1,
+        'mediana': cuartiles[0.5].round(decimales).to_numpy(),
+        'q3': q3,
+        'ric': ric,
+        'limite_inferior': limite_inferior,
+        'limite_superior': limite_superior,
+        'minimo': extremos['min'].to_numpy(),
+        'maximo': extremos['max'].to_numpy(),
+        'outliers_inferiores': np.bincount(codigos[inferiores], minlength = n_grupos),
+        'outliers_superiores': np.bincount(codigos[superiores], minlength = n_grupos),
+    })
+    tabla['outliers'] = tabla['outliers_inferiores'] + tabla['outliers_superiores']
+    tabla['porcentaje_outliers'] = (100 * tabla['outliers'] / tabla['filas_con_dato'].replace(0, np.nan)).round(2)
+    return tabla, inferiores | superiores
+
+
+@ins.instrumentar
+def estadisticas_outliers(df, columna = 'delta PE vs DS', grupos = GRUPOS_OUTLIERS, factor = 1.5, decimales = 2):
+    """Calcula en una pasada por agrupación los cuartiles, el rango intercuartílico (RIC), los límites de outliers y qué filas son outliers,
+    para el total y para cada grupo (ej. cada Lot o cada país). Los valores vacíos (NaN) no cuentan para los cuartiles ni son outliers.
+
+    Se calcula una vez y se reutiliza en todos los gráficos (ver pipeline.visualizar) y en la tabla para Power BI (estadisticas_outliers.csv).
+
+    Args:
+        df (pd.DataFrame): datos (ej. df_merged_final o merged_viz.csv).
+        columna (str): columna numérica analizada.
+        grupos (dict): {nombre de la agrupación: columna}. Por defecto GRUPOS_OUTLIERS; {} = sólo el total.
+                       Las columnas que no estén en df se ignoran.
+        factor (float): los límites son Q1 - factor * RIC y Q3 + factor * RIC (1.5 = bigotes del boxplot).
+        decimales (int): decimales de los cuartiles (los límites se calculan con los cuartiles redondeados, como en el boxplot).
+
+    Returns:
+        dict:
+            - 'tabla': pd.DataFrame con una fila por agrupación y grupo: agrupacion, columna_grupo, grupo, filas, filas_con_dato,
+                       q1, mediana, q3, ric, limite_inferior, limite_superior, minimo, maximo, outliers_inferiores, outliers_superiores,
+                       outliers, porcentaje_outliers.
+            - 'outliers': pd.DataFrame de booleanos (mismo índice que df) con una columna por agrupación: True si la fila es outlier en su grupo.
+            - 'columna': la columna analizada.
+
+    Ejemplo de uso:
+        estadisticas = estadisticas_outliers(df_merged_final)
+        fila_total = fila_estadisticas(estadisticas)
+        df_outliers_por_pais = df_merged_final[estadisticas['outliers']['pais']]
+    """
+    valores = pd.to_numeric(df[columna], errors = 'coerce').to_numpy(dtype = float)
+    agrupaciones = {AGRUPACION_GLOBAL: None, **{nombre: col for nombre, col in grupos.items() if col in df.columns}}
+
+    tablas, mascaras = [], {}
+    for agrupacion, col in agrupaciones.items():
+        if col is None:
+            codigos, etiquetas = np.zeros(len(df), dtype = np.intp), [GRUPO_GLOBAL]
+        else:
+            codigos, etiquetas = pd.factorize(df[col], use_na_sentinel = False, sort = True)
+            etiquetas = [GRUPO_SIN_DATO if pd.isna(etiqueta) else etiqueta for etiqueta in etiquetas]
+        tabla, mascaras[agrupacion] = _estadisticas_grupos(valores, codigos, len(etiquetas), factor, decimales)
+        tabla.insert(0, 'grupo', etiquetas)
+        tabla.insert(0, 'columna_grupo', col or '')
+        tabla.insert(0, 'agrupacion', agrupacion)
+        tablas.append(tabla)
+
+    return {'tabla': pd.concat(tablas, ignore_index = True),
+            'outliers': pd.DataFrame(mascaras, index = df.index),
+            'columna': columna}
+
+
+def fila_estadisticas(estadisticas, agrupacion = AGRUPACION_GLOBAL, grupo = GRUPO_GLOBAL):
+    """Estadísticas de un grupo (por defecto, el total) como dict: {'q1', 'mediana', 'q3', 'ric', 'limite_inferior', ...}."""
+    tabla = estadisticas['tabla']
+    fila = tabla[(tabla['agrupacion'] == agrupacion) & (tabla['grupo'] == grupo)]
+    if fila.empty:
+        raise KeyError(f"No hay estadísticas para el grupo {grupo!r} de la agrupación {agrupacion!r}")
+    return fila.iloc[0].to_dict()
+
+
+def _grupos(df, columnas):
+    """Grupo de cada fila según una o varias columnas (los vacíos son un grupo más, GRUPO_SIN_DATO), en orden de las etiquetas.
+
+    Returns:
+        tuple: (códigos 0..n_grupos-1 de cada fila, nº de grupos, {columna: etiqueta de cada grupo})
+    """
+    codigos = np.zeros(len(df), dtype = np.intp)
+    factorizadas = []
+    for col in columnas:
+        codigos_col, etiquetas = pd.factorize(df[col], use_na_sentinel = False, sort = True)
+        etiquetas = np.array([GRUPO_SIN_DATO if pd.isna(etiqueta) else etiqueta for etiqueta in etiquetas], dtype = object)
+        #Se vuelve a numerar en cada paso para que los códigos combinados no crezcan con el nº de columnas
+        codigos = pd.factorize(codigos * len(etiquetas) + codigos_col, sort = True)[0]
+        factorizadas.append((col, codigos_col, etiquetas))
+
+    n_grupos = int(codigos.max()) + 1 if len(codigos) else 0
+    primeras = np.unique(codigos, return_index = True)[1] #primera fila de cada grupo, para sacar sus etiquetas
+    return codigos, n_grupos, {col: etiquetas[codigos_col[primeras]] for col, codigos_col, etiquetas in factorizadas}
+
+
+@ins.instrumentar
+def tablas_resumen(df, columna = 'delta PE vs DS', dimensiones = DIMENSIONES_RESUMEN, sumas = COLUMNAS_SUMA_RESUMEN, factor = 1.5, decimales = 2):
+    """Tablas resumen para Power BI: en lugar de agregar en el informe las filas de merged.csv, se calculan aquí una vez y se exportan
+    ya agregadas (kilobytes en lugar de todo el detalle).
+
+    Para el total, para cada dimensión por separado y para todas las dimensiones a la vez (agrupación 'detalle'), cada grupo tiene:
+    nº de filas, suma de los FCV convertidos, media, cuartiles, mínimo y máximo de la delta y nº de outliers.
+    Cada agrupación se resuelve con un único código de grupo por fila: las sumas y la media salen de un bincount sobre esos códigos,
+    y los cuartiles y outliers del mismo cálculo que estadisticas_outliers (mismos límites que el boxplot).
+
+    Args:
+        df (pd.DataFrame): datos (ej. df_merged_final).
+        columna (str): columna numérica analizada.
+        dimensiones (dict): {nombre: columna} por las que se agrupa. Por defecto DIMENSIONES_RESUMEN. Las que no estén en df se ignoran.
+        sumas (list): columnas que se suman en cada grupo. Por defecto COLUMNAS_SUMA_RESUMEN.
+        factor, decimales: como en estadisticas_outliers.
+
+    Returns:
+        pd.DataFrame: una fila por agrupación y grupo: agrupacion, una columna por dimensión (GRUPO_GLOBAL si no se agrupa por ella),
+                      filas, filas_con_dato, media, q1, mediana, q3, ric, limite_inferior, limite_superior, minimo, maximo,
+                      outliers_inferiores, outliers_superiores, outliers, porcentaje_outliers y suma_<columna> por cada columna de `sumas`.
+
+    Ejemplo de uso:
+        resumen = tablas_resumen(df_merged_final)
+        por_pais = resumen[resumen['agrupacion'] == 'pais']
+    """
+    dimensiones = {nombre: col for nombre, col in dimensiones.items() if col in df.columns}
+    valores = pd.to_numeric(df[columna], errors = 'coerce').to_numpy(dtype = float)
+    con_dato = ~np.isnan(valores)
+    sumandos = {col: np.nan_to_num(pd.to_numeric(df[col], errors = 'coerce').to_numpy(dtype = float)) for col in sumas if col in df.columns}
+    agrupaciones = {AGRUPACION_GLOBAL: [], **{nombre: [nombre] for nombre in dimensiones}}
+    if len(dimensiones) > 1:
+        agrupaciones[AGRUPACION_DETALLE] = list(dimensiones)
+
+    tablas = []
+    for agrupacion, nombres in agrupaciones.items():
+        codigos, n_grupos, etiquetas = _grupos(df, [dimensiones[nombre] for nombre in nombres])
+        tabla, _ = _estadisticas_grupos(valores, codigos, n_grupos, factor, decimales)
+        suma_delta = np.bincount(codigos[con_dato], weights = valores[con_dato], minlength = n_grupos)
+        tabla.insert(tabla.columns.get_loc('q1'), 'media', (suma_delta / tabla['filas_con_dato'].replace(0, np.nan)).round(decimales))
+        for col, sumando in sumandos.items():
+            tabla[f'suma_{col}'] = np.bincount(codigos, weights = sumando, minlength = n_grupos)
+
+        for posicion, (nombre, col) in enumerate(dimensiones.items()):
+            tabla.insert(posicion, nombre, etiquetas[col] if col in etiquetas else GRUPO_GLOBAL)
+        tabla.insert(0, 'agrupacion', agrupacion)
+        tablas.append(tabla)
+
+    return pd.concat(tablas, ignore_index = True)
+
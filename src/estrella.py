@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from . import instrumentacion as ins
+from .tipos import _es_texto
+
+
+# Exportación en estrella para el modelo de Power BI: en lugar de la tabla ancha de merged.csv (las mismas ciudades, países, proveedores,
+# divisas y Commercial Models repetidos tres veces con los sufijos _req/_ds/_pe de rename_columns), una tabla de hechos estrecha y numérica
+# (ids, FCV, tipos de cambio, delta y claves enteras) y tablas de dimensiones pequeñas con los textos, una fila por valor distinto.
+# Uniendo los hechos con las dimensiones por sus claves se recupera merged.csv.
+
+# Fuentes, en el orden de las columnas de merged.csv (sufijos de rename_columns)
+SUFIJOS = ['req', 'ds', 'pe']
+
+# Dimensiones compartidas por las tres fuentes: {dimensión: columnas sin el sufijo de la fuente}
+# Cada fuente tiene en los hechos su propia clave (ej. id_ubicacion_req, id_ubicacion_ds, id_ubicacion_pe) a la misma tabla de dimensión.
+DIMENSIONES_ESTRELLA = {'ubicacion': ['City', 'Country'],
+                        'proveedor': ['Main_Access_Provider_(last_mile_Provider)'],
+                        'divisa': ['Main_Access_Currency', 'currency_ISO'],
+                        'commercial_model': ['Commercial_Model'],
+                        'servicio': ['Standard_Services', 'Lot', 'Main_access_technology']}
+
+# Columnas de texto que identifican la oferta (un valor distinto por fila): se quedan en los hechos
+IDS_ESTRELLA = ['quotation_ID', 'Site_ID']
+
+# Claves de la unión: en _ds y _pe repiten el valor de _req (o están vacías si la oferta no está en esa fuente); si es así, no se exportan
+CLAVES_UNION = ['quotation_ID', 'Option_ID']
+
+# Dimensión con el resto de columnas de texto (fuente de cada precio, etiquetas de cambio de divisa y de Commercial Model...):
+# una fila por combinación de valores
+DIMENSION_ETIQUETAS = 'etiquetas'
+
+TABLA_HECHOS = 'hechos'
+
+
+def _dimension(df, claves, atributos, nombre_id):
+    """Tabla de dimensión con los valores distintos de unas columnas y la clave entera de cada fila de df.
+
+    Args:
+        df (pd.DataFrame): datos.
+        claves (dict): {columna de la clave en los hechos: columnas de df con los atributos}, ej.
+                       {'id_ubicacion_req': ['City_req', 'Country_req'], 'id_ubicacion_ds': ['City_ds', 'Country_ds']}.
+                       Todas las listas van en el orden de `atributos` y comparten la misma tabla de dimensión.
+        atributos (list): nombres de los atributos en la tabla de dimensión (ej. ['City', 'Country']).
+        nombre_id (str): nombre de la clave en la tabla de dimensión (ej. 'id_ubicacion').
+
+    Returns:
+        tuple: (tabla de dimensión con la clave 1..n y los atributos, ordenada por los atributos,
+                {columna de la clave: clave de cada fila de df (Int32, vacía si todos los atributos están vacíos)})
+    """
+    valores = pd.concat([df[columnas].set_axis(atributos, axis = 1).astype(object) for columnas in claves.values()], ignore_index = True)
+    con_dato = valores.notna().any(axis = 1).to_numpy()
+    codigos = valores[con_dato].groupby(atributos, dropna = False, sort = True).ngroup().to_numpy()
+
+    tabla = valores[con_dato].iloc[np.unique(codigos, return_index = True)[1]].reset_index(drop = True) #primera fila de cada valor distinto
+    tabla.insert(0, nombre_id, np.arange(1, len(tabla) + 1, dtype = np.int32))
+
+    todas = pd.array(np.full(len(valores), pd.NA), dtype = 'Int32')
+    todas[np.flatnonzero(con_dato)] = codigos + 1
+    return tabla, {clave: todas[i * len(df):(i + 1) * len(df)] for i, clave in enumerate(claves)}
+
+
+def _claves_redundantes(df):
+    """Columnas _ds y _pe de CLAVES_UNION que sólo repiten el valor de _req (o están vacías)."""
+    redundantes = []
+    for base in CLAVES_UNION:
+        referencia = f'{base}_req'
+        for sufijo in SUFIJOS[1:]:
+            col = f'{base}_{sufijo}'
+            if referencia in df.columns and col in df.columns:
+                serie = df[col].astype(object)
+                if (serie.isna() | (serie == df[referencia].astype(object))).all():
+                    redundantes.append(col)
+    return redundantes
+
+
+@ins.instrumentar
+def esquema_estrella(df, dimensiones = DIMENSIONES_ESTRELLA):
+    """Divide df_merged_final en una tabla de hechos estrecha y tablas de dimensiones.
+
+    - Dimensiones compartidas (`dimensiones`): una tabla por dimensión con los valores de las tres fuentes (ej. dim_ubicacion con City y Country)
+      y, en los hechos, una clave por fuente (ej. id_ubicacion_req, id_ubicacion_ds, id_ubicacion_pe). Clave vacía = sin dato en esa fuente.
+    - Dimensión de etiquetas: el resto de columnas de texto (salvo los ids de IDS_ESTRELLA), con una clave id_etiquetas en los hechos.
+    - Hechos: columnas numéricas y de fechas, ids y claves de las dimensiones (cada clave en el lugar de la primera columna que sustituye).
+      Las claves de la unión de _ds y _pe que sólo repiten la de _req no se exportan.
+
+    Args:
+        df (pd.DataFrame): datos (ej. df_merged_final).
+        dimensiones (dict): {dimensión: columnas sin el sufijo de la fuente}. Por defecto DIMENSIONES_ESTRELLA.
+                            Se usan las fuentes que tienen todas las columnas de la dimensión.
+
+    Returns:
+        dict: {'hechos': pd.DataFrame, 'dim_<dimensión>': pd.DataFrame, ...}
+
+    Ejemplo de uso:
+        tablas = esquema_estrella(df_merged_final)
+        hechos = tablas['hechos'].merge(tablas['dim_ubicacion'].add_suffix('_req'), on = 'id_ubicacion_req', how = 'left')
+    """
+    tablas, claves = {}, {}
+    sustituidas = {} #columna de df --> clave que la sustituye en los hechos
+
+    def anadir(dimension, grupos, atributos):
+        tabla, claves_dimension = _dimension(df, grupos, atributos, f'id_{dimension}')
+        tablas[f'dim_{dimension}'] = tabla
+        claves.update(claves_dimension)
+        for clave, columnas in grupos.items():
+            sustituidas.update(dict.fromkeys(columnas, clave))
+
+    for dimension, atributos in dimensiones.items():
+        grupos = {f'id_{dimension}_{sufijo}': [f'{atributo}_{sufijo}' for atributo in atributos]
+                  for sufijo in SUFIJOS if all(f'{atributo}_{sufijo}' in df.columns for atributo in atributos)}
+        if grupos:
+            anadir(dimension, grupos, atributos)
+
+    redundantes = set(_claves_redundantes(df))
+    ids = {f'{base}_{sufijo}' for base in IDS_ESTRELLA for sufijo in SUFIJOS}
+    etiquetas = [col for col in df.columns if col not in sustituidas and col not in redundantes and col not in ids and _es_texto(df[col])]
+    if etiquetas:
+        anadir(DIMENSION_ETIQUETAS, {f'id_{DIMENSION_ETIQUETAS}': etiquetas}, etiquetas)
+
+    hechos = {}
+    for col in df.columns:
+        if col in sustituidas:
+            hechos.setdefault(sustituidas[col], claves[sustituidas[col]])
+        elif col not in redundantes:
+            hechos[col] = df[col].array
+    return {TABLA_HECHOS: pd.DataFrame(hechos), **tablas}
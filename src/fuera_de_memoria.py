@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from . import transformacion as tr
+from . import instrumentacion as ins
+from .reconciliacion import _normalizar_clave
+
+
+# Carga fuera de memoria del Pricing Engine: para extracciones (ej. todo el histórico) que no caben en la RAM.
+# El CSV se lee por bloques de tamaño acotado y de cada bloque sólo se conservan las filas cuya oferta (quotation_ID + option_id)
+# está en el B-End (semi-join). La unión sólo conserva las filas del B-End, así que el resultado es el mismo que cargando el fichero
+# entero, y el resto del ETL (merge, fx, export) trabaja ya con datos del tamaño del B-End.
+
+# Memoria (MB) por defecto para cada bloque del CSV
+MEMORIA_PE_MB = 512
+
+# Filas que se leen para estimar cuánta memoria ocupa cada fila
+FILAS_MUESTRA = 10_000
+
+# Memoria de trabajo de un bloque respecto a lo que ocupa recién leído (limpieza, normalización y filtro crean columnas temporales)
+FACTOR_MEMORIA = 4
+
+# Bytes por fila en la segunda lectura (sólo la columna option_id: valor, orden y búsqueda)
+BYTES_FILA_OPTION_ID = 64
+
+MIN_FILAS_BLOQUE = 1_000
+
+
+def filas_por_bloque(ruta_archivo, opciones, memoria_mb = MEMORIA_PE_MB):
+    """Nº de filas por bloque para que cada bloque, con sus columnas temporales, quepa en `memoria_mb` MB.
+    Se estima con lo que ocupan en memoria las primeras FILAS_MUESTRA filas del CSV."""
+    muestra = pd.read_csv(ruta_archivo, nrows = FILAS_MUESTRA, **opciones)
+    bytes_fila = muestra.memory_usage(deep = True).sum() / max(len(muestra), 1)
+    return max(MIN_FILAS_BLOQUE, int(memoria_mb * 2**20 / (bytes_fila * FACTOR_MEMORIA)))
+
+
+def _texto_clave(valores):
+    """Valores de una columna clave como texto, igual que en la unión (ver reconciliacion._normalizar_clave: 101, 101.0 y '101' --> '101'),
+    con None en los vacíos. Sólo se normalizan los valores distintos."""
+    codigos, unicos = pd.factorize(pd.Series(valores))
+    texto = np.full(len(codigos), None, dtype=object)
+    con_dato = codigos >= 0
+    texto[con_dato] = _normalizar_clave(unicos).to_numpy(dtype=object)[codigos[con_dato]]
+    return texto
+
+
+def claves_ofertas(quotation_ids, option_ids):
+    """Claves (quotation_ID, option_id) de las ofertas que se buscan, como texto normalizado (ver `_texto_clave`: una fuente puede leer
+    como número la clave que otra lee como texto), sin las que tienen algún valor vacío (nunca se unen)."""
+    claves = pd.MultiIndex.from_arrays([_texto_clave(quotation_ids), _texto_clave(option_ids)])
+    return claves[~pd.isna(claves.get_level_values(0)) & ~pd.isna(claves.get_level_values(1))].unique()
+
+
+def _filtrar_bloque(bloque, claves, option_ids_buscados):
+    """Posiciones de las filas del bloque cuya (quotation_ID, option_id), normalizada como en `claves_ofertas`, está en `claves`.
+    Primero se descartan con un filtro vectorizado las filas cuyo option_id no está en el B-End; sólo las que quedan se comparan por la clave completa."""
+    option_ids = _texto_clave(bloque['option_id'])
+    candidatas = np.flatnonzero(pd.Index(option_ids).isin(option_ids_buscados))
+    if not len(candidatas):
+        return candidatas
+    pares = pd.MultiIndex.from_arrays([_texto_clave(bloque['quotation_ID'].iloc[candidatas]), option_ids[candidatas]])
+    return candidatas[pares.isin(claves)]
+
+
+def _ids_globales(ruta_archivo, posiciones, option_ids, filas_bloque, tipo_option_id = None):
+    """'id' que tendría cada fila conservada si se cargara el CSV entero (ver tr.cargar_y_procesar_pe): su posición tras ordenar todo
+    el fichero por option_id (orden estable, vacíos al final). Se calcula con una segunda lectura por bloques de la columna option_id:
+
+        id = nº de filas del fichero con option_id menor + nº de filas anteriores (en el fichero) con el mismo option_id
+
+    Args:
+        posiciones (np.ndarray): nº de fila en el fichero (0 = primera fila de datos) de cada fila conservada, en orden creciente.
+        option_ids (np.ndarray): option_id de cada fila conservada (sin vacíos).
+        tipo_option_id (str, opcional): tipo con el que se leyó la columna option_id (ej. 'str', ver `cargar_pe_por_bloques`).
+
+    Returns:
+        np.ndarray: id de cada fila conservada.
+    """
+    valores, codigos = np.unique(option_ids, return_inverse = True) #option_ids distintos buscados (ordenados) y el de cada fila
+    menores = np.zeros(len(valores) + 1, dtype=np.int64)    #nº de filas del fichero con option_id menor que cada valor
+    iguales_previas = np.zeros(len(valores), dtype=np.int64) #nº de filas de los bloques ya leídos con ese mismo option_id
+    anteriores = np.zeros(len(posiciones), dtype=np.int64)   #nº de filas anteriores con el mismo option_id, para cada fila conservada
+
+    columna = next(col for col in pd.read_csv(ruta_archivo, sep=';', nrows=0).columns if col.strip() == 'option_id')
+    inicio = 0
+    tipo = {columna: tipo_option_id} if tipo_option_id else None
+    for bloque in pd.read_csv(ruta_archivo, sep=';', usecols=[columna], dtype=tipo, chunksize=filas_bloque):
+        serie = bloque[columna]
+        leidos = serie.dropna().to_numpy()
+        hasta = np.searchsorted(valores, leidos, side='right') #leído < valores[j] para todo j >= hasta
+        menores += np.bincount(hasta, minlength = len(valores) + 1).cumsum()
+        desde = np.searchsorted(valores, leidos, side='left')
+        es_igual = desde < hasta
+
+        #Filas conservadas de este bloque: filas con el mismo option_id en bloques anteriores + en este bloque antes que ella
+        en_bloque = np.flatnonzero((posiciones >= inicio) & (posiciones < inicio + len(serie)))
+        if len(en_bloque):
+            apariciones = serie.groupby(serie, sort = False).cumcount().to_numpy()
+            anteriores[en_bloque] = iguales_previas[codigos[en_bloque]] + apariciones[posiciones[en_bloque] - inicio]
+
+        iguales_previas += np.bincount(desde[es_igual], minlength = len(valores))
+        inicio += len(serie)
+
+    return menores[codigos] + anteriores
+
+
+@ins.instrumentar
+def cargar_pe_por_bloques(ruta_archivo, claves, memoria_mb = MEMORIA_PE_MB, columnas = None, dtypes = None):
+    """Carga y procesa el CSV del Pricing Engine como tr.cargar_y_procesar_pe, pero sólo con las filas de las ofertas en `claves`
+    y sin tener nunca el fichero entero en memoria: cada bloque se lee, se limpia y se filtra antes de leer el siguiente.
+
+    Con las mismas claves que el B-End el resultado de la unión es el mismo que cargando el fichero entero, incluida la columna 'id'
+    (se calcula sobre todo el fichero con una segunda lectura de la columna option_id, ver `_ids_globales`).
+
+    Args:
+        ruta_archivo (str): ruta al CSV.
+        claves (pd.MultiIndex): ofertas (quotation_ID, option_id) que se conservan (ver `claves_ofertas`).
+        memoria_mb (float): memoria máxima (MB) de cada bloque, con sus columnas temporales.
+        columnas, dtypes: como en tr.cargar_y_procesar_pe (ej. tr.COLUMNAS_PE y tr.DTYPES_PE).
+
+    Returns:
+        pd.DataFrame: filas del Pricing Engine con oferta en `claves`, ordenadas por option_id y con su 'id' de la carga completa.
+    """
+    opciones = tr.opciones_csv_pe(ruta_archivo, columnas, dtypes)
+    filas_bloque = filas_por_bloque(ruta_archivo, opciones, memoria_mb)
+    option_ids_buscados = claves.get_level_values(1).unique()
+
+    def leer(opciones):
+        partes, posiciones, tipos = [], [], {}
+        inicio = n_bloques = 0
+        for bloque in pd.read_csv(ruta_archivo, chunksize = filas_bloque, **opciones):
+            bloque.columns = bloque.columns.str.strip()
+            bloque = tr._limpiar_pe(bloque)
+            for col, tipo in bloque.dtypes.items():
+                tipos.setdefault(col, set()).add(tipo)
+            filas = _filtrar_bloque(bloque, claves, option_ids_buscados)
+            if len(filas) or not partes:
+                partes.append(bloque.iloc[filas].reset_index(drop = True))
+                posiciones.append(inicio + filas)
+            inicio += len(bloque)
+            n_bloques += 1
+        return partes, posiciones, tipos, inicio, n_bloques
+
+    partes, posiciones, tipos, inicio, n_bloques = leer(opciones)
+    #option_id numérico en unos bloques y texto en otros (ej. un valor no numérico en un bloque): leyendo el fichero entero, pandas la leería
+    #como texto en todas las filas. Se vuelve a leer así, para tener los mismos valores y el mismo orden (y por tanto los mismos 'id')
+    tipo_option_id = None
+    if len({isinstance(tipo, np.dtype) and tipo.kind in 'iuf' for tipo in tipos['option_id']}) > 1:
+        print(f"⚠️ {ruta_archivo}: option_id es numérico en unos bloques y texto en otros; se vuelve a leer como texto")
+        tipo_option_id = 'str'
+        columna = next(col for col in pd.read_csv(ruta_archivo, sep=';', nrows=0).columns if col.strip() == 'option_id')
+        partes, posiciones, tipos, inicio, n_bloques = leer({**opciones, 'dtype': {**opciones.get('dtype', {}), columna: tipo_option_id}})
+    pe = tr.unir_bloques_pe(partes, dtypes)
+    posiciones = np.concatenate(posiciones)
+
+    #Tipo numérico que tendría cada columna leyendo el fichero entero (ej. una columna entera con algún vacío en otro bloque es float)
+    for col, tipos_bloques in tipos.items():
+        if all(isinstance(tipo, np.dtype) and tipo.kind in 'iufb' for tipo in tipos_bloques):
+            tipo = np.result_type(*tipos_bloques)
+            if pe[col].dtype != tipo:
+                pe[col] = pe[col].astype(tipo)
+
+    print(f"📦 {ruta_archivo}: {inicio} filas leídas en {n_bloques} bloques de hasta {filas_bloque} filas | {len(pe)} con oferta en el B-End")
+
+    ids = _ids_globales(ruta_archivo, posiciones, pe['option_id'].to_numpy(), max(filas_bloque, int(memoria_mb * 2**20 / BYTES_FILA_OPTION_ID)),
+                        tipo_option_id)
+    pe.insert(0, 'id', ids)
+    return pe.sort_values('id', kind = 'stable').reset_index(drop = True)
@@ -0,0 +1,220 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from . import transformacion as tr
+from . import cache_entradas as ce
+
+
+# Procesamiento incremental: la etapa fx (conversión de divisas y clasificación) sólo se recalcula para las ofertas nuevas o modificadas.
+# El resultado de la última ejecución se guarda en <dir_salida>/incremental/ con la huella (hash) de los datos de entrada de cada fila;
+# en la siguiente ejecución las filas cuya huella no ha cambiado se toman de ahí, y las ofertas que ya no están en las fuentes se eliminan.
+
+DIR_INCREMENTAL = "incremental"
+ARCHIVO_ESTADO = "estado.json"
+BASE_ALMACEN = "resultado" #resultado.parquet (o resultado.pkl si Arrow no admite alguna columna)
+
+# Columnas que identifican una fila del resultado (la unión conserva las filas del B-End)
+CLAVES_FILA = ['quotation_ID_req', 'Option_ID_req']
+
+# Nº de fila de cada fichero (columna 'id' de los cargadores): cambia al añadir o borrar filas por encima aunque la oferta sea la misma,
+# así que no forma parte de la huella (en las filas sin cambios se toma el valor actual)
+COLUMNAS_SIN_HUELLA = ['id_req', 'id_ds', 'id_pe']
+
+# Columnas que añade el almacén al resultado
+COLUMNAS_ALMACEN = ['_clave', '_huella']
+
+# Tipo de cambio aplicado a cada fuente: {columna con la divisa de origen: columna con el tipo de cambio} (ver fcv_currency_or_multicurrency).
+# Las filas guardadas con divisa de origen y de destino pero sin tipo de cambio (ej. ejecución offline o fallo de la API) se vuelven a convertir.
+COLUMNAS_TASA = {'currency_ISO_ds': 'FCV_ds_exchange_rate', 'currency_ISO_pe': 'FCV_pe_exchange_rate'}
+COLUMNA_DESTINO = 'currency_ISO_req'
+
+# Cambiar si cambia el formato del almacén: obliga a recalcular todo una vez
+VERSION_ALMACEN = 1
+
+
+def firma_logica(columnas, opciones = None):
+    """Huella de todo lo que, además de los datos, decide el resultado de la etapa fx: columnas de entrada, diccionario de divisas, reglas
+    y opciones de la conversión (ej. tipos de cambio históricos). Si cambia (ej. se añade una divisa al diccionario o una regla),
+    el resultado guardado ya no sirve y se recalcula todo."""
+    contenido = repr((VERSION_ALMACEN, list(columnas), sorted(tr.name_to_iso.items()), tr.REGLAS_COMMERCIAL_MODEL_CHANGES,
+                      sorted((opciones or {}).items())))
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _hash_filas(df):
+    """Hash de cada fila que no depende del tipo de las columnas: los textos dan lo mismo como category o str, y los números como int o float
+    (una columna entera pasa a float en cuanto una oferta no tiene correspondencia en esa fuente)."""
+    df = df.apply(lambda col: col.astype(float) if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col) else col)
+    return pd.util.hash_pandas_object(df, index = False).to_numpy()
+
+
+def claves_filas(df, claves = CLAVES_FILA):
+    """Clave entera de cada fila: hash de quotation_ID + Option ID y del nº de aparición de esa clave (por si hay ofertas repetidas en el B-End)."""
+    aparicion = df.groupby(claves, dropna = False, sort = False, observed = True).cumcount()
+    return _hash_filas(df[claves].assign(aparicion = aparicion))
+
+
+def huellas_filas(df):
+    """Hash de cada fila con todos sus datos de entrada (salvo COLUMNAS_SIN_HUELLA): si cambia cualquier valor de la oferta en cualquiera
+    de las fuentes, cambia la huella."""
+    return _hash_filas(df.drop(columns = [col for col in COLUMNAS_SIN_HUELLA if col in df.columns]))
+
+
+def filas_sin_tasa(df):
+    """Máscara de las filas con divisa de origen (DS o PE) y de destino (B-End) pero sin tipo de cambio: el par no se pudo resolver al convertirlas.
+    Las filas sin divisa reconocida no cuentan (volver a convertirlas daría lo mismo)."""
+    sin_tasa = np.zeros(len(df), dtype = bool)
+    if COLUMNA_DESTINO not in df.columns:
+        return sin_tasa
+    destino = df[COLUMNA_DESTINO].notna().to_numpy()
+    for col_origen, col_tasa in COLUMNAS_TASA.items():
+        if col_origen in df.columns and col_tasa in df.columns:
+            sin_tasa |= destino & df[col_origen].notna().to_numpy() & df[col_tasa].isna().to_numpy()
+    return sin_tasa
+
+
+def pares_sin_tasa(df):
+    """Pares (origen, destino) de las filas de `filas_sin_tasa`, como df.attrs['pares_sin_tasa'] de fcv_currency_or_multicurrency."""
+    sin_tasa = filas_sin_tasa(df)
+    pares = set()
+    for col_origen, col_tasa in COLUMNAS_TASA.items():
+        if col_origen in df.columns and col_tasa in df.columns:
+            filas = sin_tasa & df[col_tasa].isna().to_numpy()
+            pares.update(tr._pares_distintos(df[COLUMNA_DESTINO][filas], df[col_origen][filas], df[col_origen][filas]))
+    return sorted(pares)
+
+
+def leer_almacen(dir_salida, firma):
+    """Carga el resultado guardado por la ejecución anterior.
+
+    Returns:
+        pd.DataFrame or None: resultado con las columnas '_clave' y '_huella', o None si no hay almacén o no es válido para esta versión del ETL.
+    """
+    ruta_estado = os.path.join(dir_salida, DIR_INCREMENTAL, ARCHIVO_ESTADO)
+    if not os.path.exists(ruta_estado):
+        print("🔁 Sin resultado anterior: se procesan todas las filas")
+        return None
+    with open(ruta_estado, encoding = "utf-8") as archivo:
+        estado = json.load(archivo)
+
+    ruta_almacen = os.path.join(dir_salida, DIR_INCREMENTAL, estado.get("archivo", ""))
+    if estado.get("firma") != firma or not os.path.isfile(ruta_almacen):
+        print("🔁 El resultado anterior no es válido (han cambiado las columnas, el diccionario de divisas o las reglas): se procesan todas las filas")
+        return None
+    return ce._cargar_snapshot(ruta_almacen)
+
+
+def guardar_almacen(df_final, claves, huellas, dir_salida, firma):
+    """Guarda el resultado completo con la clave y la huella de cada fila para la siguiente ejecución incremental."""
+    carpeta = os.path.join(dir_salida, DIR_INCREMENTAL)
+    os.makedirs(carpeta, exist_ok = True)
+    ruta_estado = os.path.join(carpeta, ARCHIVO_ESTADO)
+    if os.path.exists(ruta_estado):
+        os.remove(ruta_estado) #si la escritura se interrumpe, la siguiente ejecución no usa un almacén a medias
+
+    ruta_almacen = ce._guardar_snapshot(df_final.assign(**dict(zip(COLUMNAS_ALMACEN, [claves, huellas]))), os.path.join(carpeta, BASE_ALMACEN))
+    with open(ruta_estado, "w", encoding = "utf-8") as archivo:
+        json.dump({"firma": firma, "archivo": os.path.basename(ruta_almacen), "filas": len(df_final),
+                   "fecha": pd.Timestamp.now().isoformat(timespec = "seconds")}, archivo, indent = 2)
+
+
+def comparar_filas(claves, huellas, claves_anteriores, huellas_anteriores, sin_tasa_anteriores = None):
+    """Clasifica las filas actuales frente a las de la ejecución anterior.
+
+    Args:
+        sin_tasa_anteriores (np.ndarray, opcional): máscara de las filas guardadas sin tipo de cambio (ver `filas_sin_tasa`).
+                                                    Aunque su huella no cambie, no se toman del almacén: se vuelven a convertir.
+
+    Returns:
+        dict: {'nuevas': posiciones actuales, 'cambiadas': posiciones actuales, 'sin_tasa': posiciones actuales (mismos datos, pero
+               guardadas sin tipo de cambio), 'sin_cambios': posiciones actuales, 'anteriores': posición en el almacén de cada fila sin cambios,
+               'borradas': nº de filas anteriores que ya no existen}
+    """
+    posicion_anterior = pd.Index(claves_anteriores).get_indexer(claves)
+    existe = posicion_anterior >= 0
+    igual = np.zeros(len(claves), dtype=bool)
+    igual[existe] = huellas_anteriores[posicion_anterior[existe]] == huellas[existe]
+    sin_tasa = np.zeros(len(claves), dtype=bool)
+    if sin_tasa_anteriores is not None:
+        sin_tasa[igual] = sin_tasa_anteriores[posicion_anterior[igual]]
+
+    sin_cambios = np.flatnonzero(igual & ~sin_tasa)
+    return {'nuevas': np.flatnonzero(~existe),
+            'cambiadas': np.flatnonzero(existe & ~igual),
+            'sin_tasa': np.flatnonzero(sin_tasa),
+            'sin_cambios': sin_cambios,
+            'anteriores': posicion_anterior[sin_cambios],
+            'borradas': len(claves_anteriores) - int(existe.sum())}
+
+
+def _concatenar(partes):
+    """pd.concat que conserva las columnas categóricas aunque cada parte tenga categorías distintas (se usa la unión de todas)."""
+    partes = [parte.copy() for parte in partes]
+    for col in partes[0].columns:
+        if not any(isinstance(parte[col].dtype, pd.CategoricalDtype) for parte in partes):
+            continue
+        categorias = pd.Index([])
+        for parte in partes:
+            valores = parte[col].cat.categories if isinstance(parte[col].dtype, pd.CategoricalDtype) else pd.Index(parte[col].dropna().unique())
+            categorias = categorias.append(valores.difference(categorias))
+        for parte in partes:
+            parte[col] = parte[col].astype(pd.CategoricalDtype(categorias))
+    return pd.concat(partes, ignore_index = True)
+
+
+def convertir_incremental(df_merged, convertir, dir_salida = "output", completo = False, opciones = None):
+    """Etapa fx incremental: aplica `convertir` sólo a las filas nuevas o modificadas desde la última ejecución y completa el resultado
+    con las filas sin cambios guardadas entonces. Después guarda el resultado completo para la siguiente ejecución.
+
+    Las filas sin cambios conservan el tipo de cambio con el que se convirtieron; para convertir todo con los tipos de cambio actuales,
+    usar completo=True. Las que se guardaron sin tipo de cambio (ej. ejecución offline sin caché o fallo de la API, ver `filas_sin_tasa`)
+    no cuentan como sin cambios: se vuelven a convertir en cada ejecución hasta que lo tengan.
+
+    Args:
+        df_merged (pd.DataFrame): resultado de la etapa merge (todas las filas).
+        convertir (callable): función df_merged --> df_merged_final (ej. pipeline.convertir_divisas).
+        dir_salida (str): carpeta de salida; el almacén se guarda en <dir_salida>/incremental/.
+        completo (bool): si True, se recalculan todas las filas (y se vuelve a crear el almacén).
+        opciones (dict, opcional): opciones con las que `convertir` calcula el resultado; si cambian, se recalcula todo (ver `firma_logica`).
+
+    Returns:
+        pd.DataFrame: df_merged_final con todas las filas, en el orden de df_merged.
+                      En df.attrs['incremental'] queda el nº de filas nuevas, cambiadas, sin tipo de cambio, sin cambios y borradas,
+                      y en df.attrs['pares_sin_tasa'] los pares que siguen sin tipo de cambio en el resultado completo.
+    """
+    firma = firma_logica(df_merged.columns, opciones)
+    claves, huellas = claves_filas(df_merged), huellas_filas(df_merged)
+    almacen = None if completo else leer_almacen(dir_salida, firma)
+
+    if almacen is None:
+        vacio = np.array([], dtype=np.int64)
+        cambios = {'nuevas': np.arange(len(df_merged)), 'cambiadas': vacio, 'sin_tasa': vacio, 'sin_cambios': vacio, 'anteriores': vacio, 'borradas': 0}
+    else:
+        cambios = comparar_filas(claves, huellas, *(almacen[col].to_numpy() for col in COLUMNAS_ALMACEN), filas_sin_tasa(almacen))
+    recalcular = np.sort(np.concatenate([cambios['nuevas'], cambios['cambiadas'], cambios['sin_tasa']]))
+    resumen = {clave: len(cambios[clave]) for clave in ['nuevas', 'cambiadas', 'sin_tasa', 'sin_cambios']}
+    resumen['borradas'] = cambios['borradas']
+    print(f"🔁 Incremental: {resumen['nuevas']} filas nuevas, {resumen['cambiadas']} cambiadas, "
+          f"{resumen['sin_tasa']} sin tipo de cambio (se vuelven a convertir), {resumen['sin_cambios']} sin cambios, {resumen['borradas']} borradas")
+
+    if len(recalcular) == len(df_merged):
+        df_merged_final = convertir(df_merged)
+    else:
+        #Filas sin cambios: columnas de entrada actuales (mismos datos, pero con el 'id' de fila actual) + columnas calculadas guardadas
+        columnas = [col for col in almacen.columns if col not in COLUMNAS_ALMACEN]
+        calculadas = [col for col in columnas if col not in df_merged.columns]
+        sin_cambios = pd.concat([df_merged.iloc[cambios['sin_cambios']].reset_index(drop = True),
+                                 almacen[calculadas].iloc[cambios['anteriores']].reset_index(drop = True)], axis = 1)
+        partes = [sin_cambios[columnas]]
+        if len(recalcular):
+            partes.append(convertir(df_merged.iloc[recalcular].reset_index(drop = True)))
+        #Volvemos a poner las filas en el orden de df_merged
+        posiciones = np.concatenate([cambios['sin_cambios'], recalcular])
+        df_merged_final = _concatenar(partes).iloc[np.argsort(posiciones, kind = 'stable')].reset_index(drop = True)
+
+    guardar_almacen(df_merged_final, claves, huellas, dir_salida, firma)
+    df_merged_final.attrs['incremental'] = resumen
+    df_merged_final.attrs['pares_sin_tasa'] = pares_sin_tasa(df_merged_final)
+    return df_merged_final
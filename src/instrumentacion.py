@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import platform
+import functools
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from . import divisas as dv
+
+try:
+    import resource #sólo existe en Linux/Mac
+except ImportError:
+    resource = None
+
+
+# Estado de la ejecución medida. Mientras no se llame a `iniciar`, medir_etapa e instrumentar no hacen nada (sin coste en el ETL normal).
+_ESTADO = {"activo": False, "etapas": [], "pila": [], "inicio": None, "http_inicio": {},
+           "trazar_memoria": False, "dir_perfiles": None}
+
+
+def iniciar(trazar_memoria = False, dir_perfiles = None):
+    """Empieza a medir una ejecución: a partir de aquí se registran las etapas y las funciones instrumentadas.
+
+    Args:
+        trazar_memoria (bool): si True, mide la memoria reservada por Python con tracemalloc (más preciso, pero ralentiza la ejecución).
+        dir_perfiles (str or None): carpeta donde guardar un perfil cProfile (.prof) por etapa principal. None = sin perfiles.
+    """
+    #La latencia máxima no se puede restar como el resto de contadores: se reinicia para que el informe dé la de esta ejecución
+    #(ej. varias ejecuciones en el mismo proceso, como en los lotes o el benchmark)
+    with dv._BLOQUEO_ESTADISTICAS:
+        dv.ESTADISTICAS_HTTP["latencia_max"] = 0.0
+    _ESTADO.update(activo = True, etapas = [], pila = [], inicio = datetime.now(), http_inicio = dict(dv.ESTADISTICAS_HTTP),
+                   trazar_memoria = trazar_memoria, dir_perfiles = dir_perfiles)
+    if dir_perfiles:
+        os.makedirs(dir_perfiles, exist_ok = True)
+    if trazar_memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def detener():
+    """Deja de medir (las etapas registradas se conservan hasta el siguiente `iniciar`)."""
+    _ESTADO["activo"] = False
+    if _ESTADO["trazar_memoria"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _pico_rss_mb():
+    """Pico de memoria residente del proceso hasta ahora, en MB (None si el sistema no lo permite, ej. Windows)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024**2 if sys.platform == "darwin" else pico / 1024 #Mac lo da en bytes, Linux en KB
+
+
+def _cpu_procesos_hijos():
+    """Segundos de CPU (usuario + sistema) de los procesos hijos ya terminados (ej. los de un ProcessPoolExecutor cerrado); 0 si no se puede medir."""
+    if resource is None:
+        return 0.0
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return uso.ru_utime + uso.ru_stime
+
+
+def _pico_rss_hijos_mb():
+    """Pico de memoria residente del mayor proceso hijo ya terminado, en MB (None si no se puede medir o aún no hay ninguno)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if not pico:
+        return None
+    return pico / 1024**2 if sys.platform == "darwin" else pico / 1024
+
+
+def contar_filas(objeto):
+    """Nº de filas de un DataFrame/Series (o suma de las tablas de una tupla/lista/dict de resultados); None si no hay ninguna tabla."""
+    if isinstance(objeto, (pd.DataFrame, pd.Series)):
+        return len(objeto)
+    if isinstance(objeto, dict):
+        objeto = list(objeto.values())
+    if isinstance(objeto, (tuple, list)):
+        filas = [contar_filas(elemento) for elemento in objeto]
+        filas = [n for n in filas if n is not None]
+        return sum(filas) if filas else None
+    return None
+
+
+@contextmanager
+def medir_etapa(nombre, filas_entrada = None):
+    """Mide un bloque de código y lo añade al informe de la ejecución.
+
+    Registra tiempo real y de CPU, pico de memoria del proceso (RSS), memoria de Python (tracemalloc, si se ha activado),
+    llamadas a la API de divisas (nº, errores y latencia) y filas de entrada/salida.
+    Las etapas se pueden anidar (ej. una etapa del pipeline y las funciones de transformacion.py que llama).
+
+    Args:
+        nombre (str): nombre de la etapa.
+        filas_entrada (int, opcional): filas que recibe la etapa.
+
+    Yields:
+        dict: registro de la etapa; se puede completar dentro del bloque (ej. registro['filas_salida'] = len(df)).
+
+    Ejemplo de uso:
+        with medir_etapa('merge', filas_entrada = len(bend)) as registro:
+            df = reconciliar(fuentes)
+            registro['filas_salida'] = len(df)
+    """
+    registro = {"etapa": nombre, "filas_entrada": filas_entrada, "filas_salida": None}
+    if not _ESTADO["activo"]:
+        yield registro
+        return
+
+    nivel = len(_ESTADO["pila"])
+    registro.update(nivel = nivel, padre = _ESTADO["pila"][-1] if nivel else None)
+    _ESTADO["pila"].append(nombre)
+    _ESTADO["etapas"].append(registro) #se añade al empezar para que el informe quede en orden de inicio
+
+    http_antes = dict(dv.ESTADISTICAS_HTTP)
+    rss_antes = _pico_rss_mb()
+    cpu_hijos_antes = _cpu_procesos_hijos()
+    trazar = _ESTADO["trazar_memoria"] and tracemalloc.is_tracing()
+    if trazar:
+        memoria_antes, _ = tracemalloc.get_traced_memory()
+        if nivel == 0:
+            tracemalloc.reset_peak() #en etapas anidadas no se reinicia el pico para no falsear el de la etapa principal
+
+    #Sólo puede haber un perfilador activo a la vez: se perfilan las etapas principales
+    perfil = cProfile.Profile() if _ESTADO["dir_perfiles"] and nivel == 0 else None
+    inicio_real, inicio_cpu = time.perf_counter(), time.process_time()
+    if perfil is not None:
+        perfil.enable()
+
+    try:
+        yield registro
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        registro["segundos"] = round(time.perf_counter() - inicio_real, 4)
+        #CPU de este proceso + la de los procesos hijos que han terminado durante la etapa (ej. la carga en paralelo o los gráficos)
+        registro["segundos_cpu"] = round(time.process_time() - inicio_cpu + _cpu_procesos_hijos() - cpu_hijos_antes, 4)
+
+        rss_despues = _pico_rss_mb()
+        registro["pico_rss_mb"] = None if rss_despues is None else round(rss_despues, 1)
+        registro["aumento_pico_rss_mb"] = None if rss_despues is None else round(rss_despues - rss_antes, 1)
+        rss_hijos = _pico_rss_hijos_mb()
+        registro["pico_rss_procesos_hijos_mb"] = None if rss_hijos is None else round(rss_hijos, 1)
+        if trazar:
+            memoria_despues, pico = tracemalloc.get_traced_memory()
+            registro["tracemalloc_delta_mb"] = round((memoria_despues - memoria_antes) / 1024**2, 2)
+            if nivel == 0:
+                registro["tracemalloc_pico_mb"] = round((pico - memoria_antes) / 1024**2, 2)
+
+        llamadas = dv.ESTADISTICAS_HTTP["llamadas"] - http_antes["llamadas"]
+        segundos_http = dv.ESTADISTICAS_HTTP["segundos"] - http_antes["segundos"]
+        registro["http_llamadas"] = llamadas
+        registro["http_errores"] = dv.ESTADISTICAS_HTTP["errores"] - http_antes["errores"]
+        registro["http_segundos"] = round(segundos_http, 4)
+        registro["http_latencia_media_ms"] = round(1000 * segundos_http / llamadas, 1) if llamadas else None
+
+        if perfil is not None:
+            ruta_perfil = os.path.join(_ESTADO["dir_perfiles"], f"{nombre}.prof")
+            perfil.dump_stats(ruta_perfil)
+            registro["perfil"] = ruta_perfil
+
+        _ESTADO["pila"].pop()
+
+
+def instrumentar(funcion = None, nombre = None):
+    """Decorador: mide cada llamada a la función con `medir_etapa` (sólo si la medición está activa).
+    Las filas de entrada son las del primer argumento que sea una tabla (DataFrame/Series o dict de DataFrames) y las de salida, las del resultado.
+
+    Ejemplo de uso:
+        @instrumentar
+        def cargar_y_procesar_pe(...): ...
+    """
+    if funcion is None:
+        return lambda f: instrumentar(f, nombre = nombre)
+
+    etiqueta = nombre or funcion.__name__
+
+    @functools.wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        if not _ESTADO["activo"]:
+            return funcion(*args, **kwargs)
+        filas_entrada = next((n for n in map(contar_filas, list(args) + list(kwargs.values())) if n is not None), None)
+        with medir_etapa(etiqueta, filas_entrada = filas_entrada) as registro:
+            resultado = funcion(*args, **kwargs)
+            registro["filas_salida"] = contar_filas(resultado)
+        return resultado
+
+    return envoltorio
+
+
+def opciones_proceso():
+    """Opciones de `iniciar` para medir también en un proceso del pool (sin perfiles cProfile: son por etapa del proceso principal).
+    None si no se está midiendo."""
+    return {"trazar_memoria": _ESTADO["trazar_memoria"]} if _ESTADO["activo"] else None
+
+
+def registros():
+    """Etapas ya medidas en este proceso (ej. en un proceso del pool, para enviarlas al principal: ver `incorporar`)."""
+    return [registro for registro in _ESTADO["etapas"] if "segundos" in registro]
+
+
+def incorporar(etapas, **datos):
+    """Añade al informe las etapas medidas en otro proceso (las de `registros()` en ese proceso), anidadas en la etapa abierta ahora.
+
+    Args:
+        etapas (list): registros de las etapas del otro proceso.
+        **datos: datos que se añaden a cada registro (ej. proceso = 'bend').
+    """
+    if not _ESTADO["activo"]:
+        return
+    nivel = len(_ESTADO["pila"])
+    padre = _ESTADO["pila"][-1] if nivel else None
+    for registro in etapas:
+        _ESTADO["etapas"].append({**registro, "nivel": registro["nivel"] + nivel, "padre": registro["padre"] or padre, **datos})
+
+
+def resumen():
+    """Imprime una línea por etapa medida (las anidadas, sangradas)."""
+    print("⏱️ Tiempos por etapa:")
+    for registro in _ESTADO["etapas"]:
+        if "segundos" not in registro:
+            continue
+        sangria = "   " * (registro["nivel"] + 1)
+        filas = f" | filas {registro['filas_entrada']} ➡️ {registro['filas_salida']}" if registro["filas_entrada"] is not None or registro["filas_salida"] is not None else ""
+        http = f" | HTTP {registro['http_llamadas']} llamadas ({registro['http_segundos']} s)" if registro["http_llamadas"] else ""
+        proceso = f" | proceso de '{registro['proceso']}'" if registro.get("proceso") else ""
+        print(f"{sangria}{registro['etapa']}: {registro['segundos']} s (CPU {registro['segundos_cpu']} s){filas}{http}{proceso}")
+
+
+def guardar_informe(ruta_json, extra = None):
+    """Guarda el informe de la ejecución medida en JSON.
+
+    Args:
+        ruta_json (str): ruta del fichero (ej. 'output/informe_ejecucion.json').
+        extra (dict, opcional): datos adicionales de la ejecución (ej. etapas pedidas, rutas).
+
+    Returns:
+        dict: el informe guardado.
+    """
+    etapas = [registro for registro in _ESTADO["etapas"] if "segundos" in registro]
+    informe = {
+        "inicio": _ESTADO["inicio"].isoformat(timespec = "seconds") if _ESTADO["inicio"] else None,
+        "fin": datetime.now().isoformat(timespec = "seconds"),
+        "segundos_totales": round(sum(registro["segundos"] for registro in etapas if registro["nivel"] == 0), 4),
+        "entorno": {"python": platform.python_version(), "pandas": pd.__version__,
+                    "sistema": platform.platform(), "cpus": os.cpu_count(), "argv": sys.argv},
+        "http": {clave: valor if clave == "latencia_max" else valor - _ESTADO["http_inicio"].get(clave, 0) #latencia_max: desde `iniciar`
+                 for clave, valor in dv.ESTADISTICAS_HTTP.items()},
+        "etapas": etapas,
+    }
+    if extra:
+        informe.update(extra)
+
+    carpeta = os.path.dirname(ruta_json)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok = True)
+    with open(ruta_json, "w", encoding = "utf-8") as archivo:
+        json.dump(informe, archivo, indent = 2, ensure_ascii = False, default = str)
+    print(f"📁 Informe de la ejecución guardado en: {ruta_json}")
+    return informe
@@ -0,0 +1,287 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import pandas as pd
+from . import transformacion as tr
+from . import divisas as dv
+from . import pipeline as pl
+from . import instrumentacion as ins
+from . import salidas as sal
+
+
+# Procesamiento de varios lotes (un lote = un deal con sus tres ficheros: bend.xlsm, ds.xlsx y pe.csv) en paralelo, un proceso por lote.
+#   1. Cada proceso carga y une su lote y devuelve los pares de divisas que necesita.
+#   2. El proceso principal descarga los tipos de cambio de TODOS los lotes a la vez en una caché compartida (cada par se pide una sola vez).
+#   3. Cada proceso convierte las divisas de su lote sólo con esa caché (sin llamar a la API) y exporta sus CSV.
+#   4. El proceso principal junta los lotes en un merged.csv y un precios.csv con una columna 'lote'.
+
+# Ficheros de cada lote dentro de su carpeta (mismos nombres que en la carpeta de datos del ETL)
+ARCHIVOS_LOTE = {'bend': pl.ARCHIVO_BEND, 'ds': pl.ARCHIVO_DS, 'pe': pl.ARCHIVO_PE}
+
+DIR_LOTES = "lotes" #subcarpeta de la salida con una carpeta por lote
+ARCHIVO_INTERMEDIO = "fusionado.pkl" #DataFrame de un lote entre fases (se borra al terminar)
+ARCHIVO_LOG = "log.txt" #mensajes del ETL de cada lote (los procesos en paralelo no escriben en la consola)
+
+
+def descubrir_lotes(origen):
+    """Lista los lotes a procesar a partir de una carpeta o de un manifiesto.
+
+    Args:
+        origen (str): - carpeta con una subcarpeta por lote que contenga bend.xlsm, ds.xlsx y pe.csv (el nombre de la subcarpeta es el del lote).
+                      - o CSV (manifiesto) con las columnas lote, bend, ds, pe. Las rutas relativas se toman desde la carpeta del manifiesto.
+
+    Returns:
+        list: un dict por lote {'lote', 'bend', 'ds', 'pe'}, en orden.
+
+    Ejemplo de manifiesto:
+        lote,bend,ds,pe
+        deal_001,deal_001/bend.xlsm,deal_001/ds.xlsx,deal_001/pe.csv
+    """
+    lotes = []
+    if os.path.isdir(origen):
+        for nombre in sorted(os.listdir(origen)):
+            carpeta = os.path.join(origen, nombre)
+            if not os.path.isdir(carpeta):
+                continue
+            rutas = {clave: os.path.join(carpeta, archivo) for clave, archivo in ARCHIVOS_LOTE.items()}
+            faltan = [archivo for clave, archivo in ARCHIVOS_LOTE.items() if not os.path.isfile(rutas[clave])]
+            if faltan:
+                print(f"⚠️ Carpeta '{nombre}' ignorada: faltan {faltan}")
+                continue
+            lotes.append({'lote': nombre, **rutas})
+    else:
+        manifiesto = pd.read_csv(origen, dtype = str)
+        faltan = [col for col in ['lote', *ARCHIVOS_LOTE] if col not in manifiesto.columns]
+        if faltan:
+            raise ValueError(f"Faltan columnas en el manifiesto {origen}: {faltan}")
+        base = os.path.dirname(os.path.abspath(origen))
+        for fila in manifiesto.itertuples(index = False):
+            lotes.append({'lote': str(fila.lote).strip(),
+                          **{clave: os.path.join(base, getattr(fila, clave).strip()) for clave in ARCHIVOS_LOTE}})
+
+    if not lotes:
+        raise ValueError(f"No se ha encontrado ningún lote en {origen}")
+    nombres = pd.Series([lote['lote'] for lote in lotes])
+    if nombres.duplicated().any():
+        raise ValueError(f"Nombres de lote repetidos: {sorted(set(nombres[nombres.duplicated()]))}")
+    return lotes
+
+
+def _dir_lote(dir_salida, nombre):
+    return os.path.join(dir_salida, DIR_LOTES, nombre)
+
+
+def _preparar_lote(lote, dir_salida, motor_excel):
+    """Fase 1 (en un proceso del pool): carga y une un lote, lo guarda para la fase 2 y devuelve los pares de divisas que necesita."""
+    inicio = time.perf_counter()
+    dir_lote = _dir_lote(dir_salida, lote['lote'])
+    os.makedirs(dir_lote, exist_ok = True)
+
+    with open(os.path.join(dir_lote, ARCHIVO_LOG), 'w', encoding = 'utf-8') as log, redirect_stdout(log):
+        fuentes = pl.cargar_fuentes(dir_salida = dir_lote, motor_excel = motor_excel, rutas = lote)
+        df_merged = pl.unir_fuentes(fuentes)
+    df_merged.to_pickle(os.path.join(dir_lote, ARCHIVO_INTERMEDIO))
+
+    return {'filas': len(df_merged), 'pares': pl.pares_divisas(df_merged),
+            'segundos_carga': round(time.perf_counter() - inicio, 4)}
+
+
+def _completar_lote(lote, dir_salida, ruta_cache):
+    """Fase 2 (en un proceso del pool): convierte las divisas del lote sólo con la caché compartida y exporta sus tablas resumen y sus CSV."""
+    inicio = time.perf_counter()
+    dir_lote = _dir_lote(dir_salida, lote['lote'])
+    ruta_intermedio = os.path.join(dir_lote, ARCHIVO_INTERMEDIO)
+
+    with open(os.path.join(dir_lote, ARCHIVO_LOG), 'a', encoding = 'utf-8') as log, redirect_stdout(log):
+        df_merged = pd.read_pickle(ruta_intermedio)
+        df_merged_final = pl.convertir_divisas(df_merged, dir_salida = dir_lote, offline = True, ruta_cache = ruta_cache)
+        pl.resumir(df_merged_final, dir_lote)
+        pl.exportar(df_merged_final, dir_lote)
+    df_merged_final.to_pickle(ruta_intermedio) #el proceso principal lo añade a los CSV combinados
+
+    return {'pares_sin_tasa': len(df_merged_final.attrs.get('pares_sin_tasa', [])),
+            'segundos_divisas_export': round(time.perf_counter() - inicio, 4),
+            'columnas': list(df_merged_final.columns)}
+
+
+def _repartir(pool, funcion, lotes, *args):
+    """Ejecuta funcion(lote, *args) para cada lote (en el pool o, si no hay pool, uno detrás de otro).
+    Un lote que falla no detiene al resto: devuelve {nombre del lote: resultado o excepción}."""
+    resultados = {}
+    if pool is None:
+        for lote in lotes:
+            try:
+                resultados[lote['lote']] = funcion(lote, *args)
+            except Exception as e:
+                resultados[lote['lote']] = e
+        return resultados
+
+    futuros = {pool.submit(funcion, lote, *args): lote['lote'] for lote in lotes}
+    for futuro in as_completed(futuros):
+        try:
+            resultados[futuros[futuro]] = futuro.result()
+        except Exception as e:
+            resultados[futuros[futuro]] = e
+    return resultados
+
+
+def _registrar(resumen, resultados):
+    """Añade los resultados de una fase al resumen de cada lote y devuelve los nombres de los lotes que han fallado."""
+    fallidos = []
+    for nombre, resultado in resultados.items():
+        if isinstance(resultado, Exception):
+            resumen[nombre].update(estado = 'error', error = f"{type(resultado).__name__}: {resultado}")
+            print(f"❌ Lote {nombre}: {resumen[nombre]['error']}")
+            fallidos.append(nombre)
+        else:
+            resumen[nombre].update(resultado)
+    return fallidos
+
+
+def _unir_columnas(listas):
+    """Columnas de varios lotes sin repetir, en su orden: una columna que no tienen todos los lotes (ej. 'Quote Date') va detrás de la que
+    la precede en el primer lote que la tiene."""
+    columnas = []
+    for lista in listas:
+        anterior = None
+        for col in lista:
+            if col not in columnas:
+                columnas.insert(columnas.index(anterior) + 1 if anterior is not None else 0, col)
+            anterior = col
+    return columnas
+
+
+def combinar_lotes(lotes, dir_salida, columnas = None):
+    """Escribe merged.csv y precios.csv con todos los lotes (columna 'lote' al principio), de lote en lote para no juntarlos en memoria.
+    Todos los lotes se escriben con las mismas columnas (las que le faltan a un lote quedan vacías), para que cada valor quede bajo su cabecera.
+    Se escriben en temporales que sólo sustituyen a los CSV anteriores al final y si han cambiado (ver salidas.py), y se anotan en el manifiesto.
+
+    Args:
+        lotes (list): nombres de los lotes ya completados, en el orden en que se escriben.
+        dir_salida (str): carpeta de salida de procesar_lotes.
+        columnas (list, opcional): columnas de cada lote (en el orden de `lotes`), ej. las devueltas por `_completar_lote`.
+                                   None = se leen de los ficheros intermedios antes de escribir.
+    """
+    if not lotes:
+        return
+    rutas = {'merged': os.path.join(dir_salida, 'merged.csv'), 'precios': os.path.join(dir_salida, 'precios.csv')}
+    if columnas is None:
+        columnas = [pd.read_pickle(os.path.join(_dir_lote(dir_salida, nombre), ARCHIVO_INTERMEDIO)).columns for nombre in lotes]
+    columnas_salida = {'merged': ['lote'] + _unir_columnas(columnas), 'precios': ['lote'] + pl.COLUMNAS_PRECIOS}
+    temporales = {clave: sal.ruta_temporal(ruta) for clave, ruta in rutas.items()}
+    manifiesto = sal.leer_manifiesto(dir_salida)
+    filas, tipos = 0, {} #tipos: para el esquema del manifiesto, el de cada columna en el primer lote que la tiene
+    try:
+        for i, nombre in enumerate(lotes):
+            ruta_intermedio = os.path.join(_dir_lote(dir_salida, nombre), ARCHIVO_INTERMEDIO)
+            df = pd.read_pickle(ruta_intermedio)
+            df.insert(0, 'lote', nombre)
+            faltan = [col for col in columnas_salida['merged'] if col not in df.columns]
+            if faltan:
+                print(f"⚠️ Lote {nombre}: sin las columnas {faltan} (quedan vacías en los CSV combinados)")
+            for col, tipo in df.dtypes.items():
+                tipos.setdefault(col, tipo)
+            for clave, columnas_clave in columnas_salida.items():
+                tr.exportar_csv_powerbi(df.reindex(columns = columnas_clave), temporales[clave], modo = 'w' if i == 0 else 'a', cabecera = i == 0)
+            filas += len(df)
+
+        for clave, ruta in rutas.items():
+            huella, cambiado = sal.sustituir_si_cambia(temporales[clave], ruta, manifiesto.get(sal.nombre_en_manifiesto(ruta, dir_salida)))
+            esquema = [{'nombre': str(col), 'tipo': str(tipos.get(col, 'float64'))} for col in columnas_salida[clave]]
+            sal.registrar(manifiesto, dir_salida, ruta, huella, cambiado, filas = filas, columnas = esquema)
+    finally:
+        for temporal in temporales.values():
+            if os.path.exists(temporal): #error al escribir: no se dejan los temporales
+                os.remove(temporal)
+
+    for nombre in lotes: #los intermedios sólo se borran cuando los CSV combinados ya están escritos
+        os.remove(os.path.join(_dir_lote(dir_salida, nombre), ARCHIVO_INTERMEDIO))
+
+    for ruta in rutas.values():
+        sal.registrar(manifiesto, dir_salida, tr.guardar_ruta_csv(ruta))
+    sal.guardar_manifiesto(dir_salida, manifiesto)
+    print(f"✅ {len(lotes)} lotes combinados en {rutas['merged']} y {rutas['precios']}")
+
+
+def procesar_lotes(lotes, dir_salida = "output_lotes", procesos = None, offline = False, motor_excel = "auto", ruta_informe = None):
+    """Procesa varios lotes en paralelo (load, merge, fx y export de cada uno) con una única descarga de tipos de cambio para todos.
+
+    Args:
+        lotes (list or str): lotes de `descubrir_lotes`, o la carpeta/manifiesto de la que obtenerlos.
+        dir_salida (str): carpeta de salida: <dir_salida>/lotes/<lote>/ con los CSV de cada lote (y su log.txt),
+                          y <dir_salida>/merged.csv y precios.csv con todos los lotes.
+        procesos (int or None): nº de procesos en paralelo. None = nº de núcleos; 1 = sin pool (un lote detrás de otro, útil para depurar).
+        offline (bool): si True, no se llama a la API de divisas (sólo la caché <dir_salida>/cache_divisas.sqlite).
+        motor_excel (str or None): motor de lectura de los Excel (ver cache_entradas.elegir_motor_excel).
+        ruta_informe (str or None): JSON con el tiempo de cada fase (ver instrumentacion.py). Por defecto <dir_salida>/informe_lotes.json.
+
+    Returns:
+        pd.DataFrame: resumen con una fila por lote (estado, filas, pares sin tipo de cambio, tiempos), guardado también en resumen_lotes.csv.
+
+    Ejemplo de uso:
+        procesar_lotes('data/lotes', dir_salida = 'output_lotes', procesos = 4)
+    """
+    if isinstance(lotes, str):
+        lotes = descubrir_lotes(lotes)
+    procesos = min(procesos or os.cpu_count() or 1, len(lotes))
+    os.makedirs(dir_salida, exist_ok = True)
+    ruta_cache = os.path.join(dir_salida, 'cache_divisas.sqlite')
+    resumen = {lote['lote']: {'lote': lote['lote'], 'estado': 'ok', 'error': None} for lote in lotes}
+    print(f"📦 {len(lotes)} lotes, {procesos} procesos")
+
+    ins.iniciar()
+    pool = ProcessPoolExecutor(max_workers = procesos) if procesos > 1 else None
+    try:
+        with ins.medir_etapa('lotes_carga') as registro:
+            fallidos = _registrar(resumen, _repartir(pool, _preparar_lote, lotes, dir_salida, motor_excel))
+            registro['filas_salida'] = sum(datos.get('filas', 0) for datos in resumen.values())
+        pendientes = [lote for lote in lotes if lote['lote'] not in fallidos]
+
+        # Una sola resolución de tipos de cambio para todos los lotes: los procesos la leen de la caché compartida
+        with ins.medir_etapa('divisas'):
+            pares = {par for lote in pendientes for par in resumen[lote['lote']].pop('pares')}
+            _, pares_sin_tasa = dv.resolver_tasas(pares, ruta_cache = ruta_cache, offline = offline)
+            print(f"💱 {len(pares)} pares de divisas distintos en todos los lotes ({len(pares_sin_tasa)} sin tipo de cambio)")
+
+        with ins.medir_etapa('lotes_divisas_export'):
+            fallidos += _registrar(resumen, _repartir(pool, _completar_lote, pendientes, dir_salida, ruta_cache))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    try:
+        with ins.medir_etapa('combinar') as registro:
+            completados = [lote['lote'] for lote in lotes if lote['lote'] not in fallidos]
+            combinar_lotes(completados, dir_salida, columnas = [resumen[nombre].pop('columnas') for nombre in completados])
+            registro['filas_salida'] = sum(resumen[nombre]['filas'] for nombre in completados)
+    finally:
+        ins.detener()
+
+    df_resumen = pd.DataFrame(list(resumen.values()))
+    df_resumen.to_csv(os.path.join(dir_salida, 'resumen_lotes.csv'), index = False)
+    ins.resumen()
+    ins.guardar_informe(ruta_informe or os.path.join(dir_salida, 'informe_lotes.json'),
+                        extra = {"procesos": procesos, "lotes": df_resumen.to_dict(orient = 'records')})
+    print(f"✅ Lotes completados: {len(lotes) - len(fallidos)} de {len(lotes)}")
+    return df_resumen
+
+
+def main(argv = None):
+    """python -m src.lotes --lotes data/lotes [--salida output_lotes] [--procesos 4] [--offline]"""
+    parser = argparse.ArgumentParser(prog = "python -m src.lotes", description = "Procesa varios lotes (deals) del ETL en paralelo.")
+    parser.add_argument("--lotes", required = True, help = "Carpeta con una subcarpeta por lote (bend.xlsm, ds.xlsx, pe.csv) o manifiesto CSV (lote,bend,ds,pe).")
+    parser.add_argument("--salida", default = "output_lotes", help = "Carpeta de salida (por defecto output_lotes).")
+    parser.add_argument("--procesos", type = int, default = None, help = "Procesos en paralelo (por defecto, nº de núcleos; 1 = sin paralelismo).")
+    parser.add_argument("--offline", action = "store_true", help = "No llamar a la API de divisas (sólo caché).")
+    parser.add_argument("--motor-excel", default = "auto", help = "Motor de lectura de los Excel (auto, calamine, openpyxl...).")
+    parser.add_argument("--informe", default = None, help = "Ruta del informe JSON (por defecto <salida>/informe_lotes.json).")
+    args = parser.parse_args(argv)
+
+    procesar_lotes(args.lotes, dir_salida = args.salida, procesos = args.procesos, offline = args.offline,
+                   motor_excel = args.motor_excel, ruta_informe = args.informe)
+
+
+if __name__ == "__main__":
+    main()
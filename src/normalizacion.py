@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+# Tablas de normalización configurables. Se aplican en orden como reemplazos de texto (buscar --> reemplazar).
+
+# Proveedores conocidos: mismo nombre final aunque cada fuente lo escriba de una forma distinta
+MAPEO_PROVEEDORES = [
+    ('Telefonica_Chile_S.A._(Mayorista)', 'Telefonica Chile S.A.'),  # Deal Specialist
+    ('Telefonica_Empresas_Chile_S.A.', 'Telefonica Chile S.A.'),     # Pricing Engine
+    ('Inteliglobe_Communications_USA', 'Inteliglobe'),               # Pricing Engine
+    ('INTELIGLOBE', 'Inteliglobe'),                                  # Deal Specialist
+    ('_', ' '),
+]
+
+# Países: guiones bajos por espacios y nombres en otros idiomas
+MAPEO_PAISES = [
+    ('_', ' '),
+    ('Brasil', 'Brazil'),
+]
+
+# Divisas: equivalencias de nombres completos (ya en minúsculas y sin espacios alrededor) antes de traducirlos a código ISO.
+# Ej. {'dolar': 'us dollar'}. Vacía por defecto: los nombres se traducen directamente con transformacion.name_to_iso.
+MAPEO_DIVISAS = {}
+
+
+# Pasos de limpieza de cada tipo de columna (ver `normalizar_columna`)
+PASOS_DIVISA = ['minusculas', 'sin_espacios', ('mapear', MAPEO_DIVISAS)]
+PASOS_CIUDAD = ['titulo']
+PASOS_PAIS = [('reemplazar', MAPEO_PAISES)]
+PASOS_PAIS_DS = ['titulo', ('reemplazar', MAPEO_PAISES)] #el Deal Specialist escribe los países en mayúsculas
+PASOS_PROVEEDOR = [('reemplazar', MAPEO_PROVEEDORES)]
+PASOS_COMMERCIAL_MODEL = [('token', ' ', 0)] #primera palabra del comentario (ej. 'B4B Resale-Unmanaged' --> 'B4B')
+PASOS_QUOTATION_ID_PE = [('token', ' ', 2), ('token', '_', 0)] #tercera palabra de unique_id y lo que va antes del '_'
+
+
+def _aplicar_paso(valores, paso):
+    """Aplica un paso de limpieza a la serie de valores distintos de una columna.
+
+    Args:
+        valores (pd.Series): valores distintos de la columna (texto).
+        paso (str or tuple): uno de
+            - 'minusculas', 'mayusculas', 'titulo', 'sin_espacios'
+            - ('reemplazar', [(buscar, reemplazo), ...]): reemplazos de texto en orden.
+            - ('mapear', {valor: nuevo_valor}): sustituye valores completos.
+            - ('token', separador, posicion): se queda con la palabra `posicion` al separar por `separador` (vacío si no existe).
+
+    Returns:
+        pd.Series: valores transformados.
+    """
+    nombre = paso if isinstance(paso, str) else paso[0]
+
+    if nombre == 'minusculas':
+        return valores.str.lower()
+    if nombre == 'mayusculas':
+        return valores.str.upper()
+    if nombre == 'titulo':
+        return valores.str.title()
+    if nombre == 'sin_espacios':
+        return valores.str.strip()
+    if nombre == 'reemplazar':
+        for buscar, reemplazo in paso[1]:
+            valores = valores.str.replace(buscar, reemplazo, regex=False)
+        return valores
+    if nombre == 'mapear':
+        return valores.map(lambda valor: paso[1].get(valor, valor))
+    if nombre == 'token':
+        return valores.str.split(paso[1]).str[paso[2]]
+
+    raise ValueError(f"Paso de normalización desconocido: {paso}")
+
+
+def normalizar_columna(serie, pasos, como_categoria = True):
+    """Limpia una columna de texto aplicando los pasos SÓLO a sus valores distintos y repartiendo el resultado con los códigos de cada fila.
+    Las columnas de las fuentes tienen unos cientos de valores distintos, así que cada paso cuesta una pasada por esos valores
+    y no una operación de texto por cada fila.
+
+    Args:
+        serie (pd.Series): columna a limpiar (texto o categórica).
+        pasos (list): pasos de limpieza, en orden (ver `_aplicar_paso`). Ej. PASOS_DIVISA, PASOS_PROVEEDOR.
+        como_categoria (bool): si True el resultado es categórico; si False, texto (útil para columnas con casi todos los valores distintos, como IDs).
+
+    Returns:
+        pd.Series: columna limpia con el mismo índice y nombre.
+
+    Ejemplo de uso:
+        ds['Main Access Currency'] = normalizar_columna(ds['Main Access Currency'], PASOS_DIVISA)
+    """
+    codigos, unicos = pd.factorize(serie) #en columnas categóricas reutiliza sus códigos; los NaN reciben el código -1
+    limpios = pd.Series(np.asarray(unicos, dtype=object), dtype=object)
+    for paso in pasos:
+        limpios = _aplicar_paso(limpios, paso)
+
+    #Dos valores originales distintos pueden quedar iguales tras la limpieza: volvemos a factorizar para unificarlos
+    codigos_limpios, categorias = pd.factorize(limpios.astype(object))
+    codigos_finales = np.full(len(codigos), -1, dtype=np.int64)
+    validos = codigos >= 0
+    codigos_finales[validos] = codigos_limpios[codigos[validos]]
+
+    resultado = pd.Categorical.from_codes(codigos_finales, categories=categorias)
+    if not como_categoria:
+        resultado = np.asarray(resultado, dtype=object)
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+
+def normalizar_columnas(df, pasos_por_columna):
+    """Aplica `normalizar_columna` a varias columnas de un DataFrame (modificándolo).
+
+    Args:
+        df (pd.DataFrame): DataFrame a limpiar.
+        pasos_por_columna (dict): {columna: pasos}. Las columnas que no existan en el DataFrame se ignoran.
+
+    Returns:
+        pd.DataFrame: el mismo DataFrame con las columnas limpias.
+    """
+    for columna, pasos in pasos_por_columna.items():
+        if columna in df.columns:
+            df[columna] = normalizar_columna(df[columna], pasos)
+    return df
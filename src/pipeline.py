@@ -0,0 +1,493 @@
+import os
+import argparse
+import pandas as pd
+from . import transformacion as tr
+from . import tipos
+from . import reconciliacion as rc
+from . import instrumentacion as ins
+from . import incremental as inc
+from . import estadisticas as est
+from . import fuera_de_memoria as fm
+from . import salidas as sal
+from . import estrella as es
+
+
+# Etapas del ETL, en orden de ejecución. load, merge, fx, agg y export dependen de la anterior; viz lee el CSV ya exportado.
+ETAPAS = ['load', 'merge', 'fx', 'agg', 'export', 'viz']
+ETAPAS_ETL = ['load', 'merge', 'fx', 'agg', 'export']
+
+# Nombres de los ficheros de entrada dentro de la carpeta de datos
+ARCHIVO_BEND = "bend.xlsm"
+ARCHIVO_DS = "ds.xlsx"
+ARCHIVO_PE = "pe.csv"
+
+COLUMNAS_BEND = ['id', 'quotation_ID', 'Option ID', 'Source',
+                 'Standard Services', 'Site ID', 'Lot', 'City', 'Country',
+                 'Main access speed UpStream (Kbps)', 'Main access speed DownStream (kbps)',
+                 'Main access technology', 'Main Access Guaranteed Bandwidth %',
+                 'Commercial Model','Contract Term (month)',
+                 'Main Access Provider (last mile Provider)', 'Main Access Currency']
+
+COLUMNAS_DS = ['id', 'quotation_ID', 'Option ID', 'Source',
+               'Standard Services', 'Site ID', 'Lot', 'City', 'Country',
+               'Main access speed UpStream (Kbps)', 'Main access speed DownStream (kbps)',
+               'Main access technology', 'Main Access Guaranteed Bandwidth %',
+               'Commercial_Model','Contract Term (month)',
+               'Main Access Provider (last mile Provider)', 'Main Access Currency',
+               'Main Access NRC', 'Main Access MRC', 'FCV']
+
+COLUMNAS_PE_SUMMARY = ['id', 'quotation_ID', 'option_id', 'Source',
+                       'standard_services_cd', 'site_id', 'lot_cd', 'city_name', 'country_name',
+                       'main_access_speed_upstream_kbps_qt', 'main_access_speed_downstream_kbps_qt',
+                       'main_access_technology_name', 'main_access_guaranteed_bandwidth_qt',
+                       'Commercial_Model', 'contract_term_cd',
+                       'main_access_provider_name','main_access_currency_cd',
+                       'main_access_nrc_amt_quoted_by', 'main_access_nrc_amt',
+                       'main_access_mrc_amt_quoted_by', 'main_access_mrc_amt', 'FCV']
+
+# Nombres del Pricing Engine --> nombres del B-End
+RENOMBRAR_PE = {'Source': 'Source',
+                'option_id': 'Option ID',
+                'standard_services_cd': 'Standard Services',
+                'site_id': 'Site ID',
+                'lot_cd': 'Lot',
+                'city_name': 'City',
+                'country_name': 'Country',
+                'main_access_speed_upstream_kbps_qt': 'Main access speed UpStream (Kbps)',
+                'main_access_speed_downstream_kbps_qt': 'Main access speed DownStream (kbps)',
+                'main_access_technology_name': 'Main access technology',
+                'main_access_guaranteed_bandwidth_qt': 'Main Access Guaranteed Bandwidth %',
+                'contract_term_cd': 'Contract Term (month)',
+                'main_access_nrc_amt':'Main Access NRC',
+                'main_access_mrc_amt': 'Main Access MRC',
+                'main_access_provider_name': 'Main Access Provider (last mile Provider)',
+                'main_access_currency_cd': 'Main Access Currency'}
+
+# Columna opcional del B-End con la fecha de la oferta: si existe se conserva (tras la unión, COLUMNA_FECHA)
+# para convertir cada oferta con el tipo de cambio de su fecha (ver convertir_divisas)
+COLUMNA_FECHA_BEND = 'Quote Date'
+COLUMNA_FECHA = 'Quote_Date_req'
+
+# Divisa de cada fuente tras la unión (B-End, DS, PE)
+COLUMNAS_DIVISA = ('Main_Access_Currency_req', 'Main_Access_Currency_ds', 'Main_Access_Currency_pe')
+
+# Carpeta (dentro de la de salida) de la exportación en estrella: hechos.csv y dim_*.csv
+DIR_ESTRELLA = "estrella"
+
+# Columnas de merged_viz.csv que usan los gráficos de la etapa viz
+COLUMNAS_VIZ = ['delta PE vs DS', 'Lot_pe', 'Commercial_Model_req', 'main_access_mrc_amt_quoted_by_pe']
+
+COLUMNAS_PRECIOS = ['id_req', 'Site_ID_req', 'City_req', 'Country_req', 'Commercial_Model_req', 'currency_ISO_req',
+                    'Main_Access_Provider_(last_mile_Provider)_ds', 'FCV_ds_conv', 'same_currency_as_B-End_ds','Commercial_Model_ds',
+                    'Commercial_Model_pe', 'Main_Access_Provider_(last_mile_Provider)_pe', 'main_access_mrc_amt_quoted_by_pe',
+                    'FCV_pe_conv', 'same_currency_as_B-End_pe', 'Commercial_model_changes', 'delta PE vs DS']
+
+
+def resolver_etapas(etapas):
+    """Añade las etapas del ETL de las que dependen las pedidas y las devuelve en orden de ejecución.
+
+    Ej. ['export'] --> ['load', 'merge', 'fx', 'agg', 'export']; ['viz'] --> ['viz'] (lee el merged_viz.csv de una ejecución anterior).
+    """
+    desconocidas = [etapa for etapa in etapas if etapa not in ETAPAS]
+    if desconocidas:
+        raise ValueError(f"Etapas desconocidas: {desconocidas}. Disponibles: {ETAPAS}")
+
+    pedidas = set(etapas)
+    ultima_etl = max((ETAPAS_ETL.index(etapa) for etapa in pedidas if etapa in ETAPAS_ETL), default = -1)
+    pedidas.update(ETAPAS_ETL[:ultima_etl + 1])
+    return [etapa for etapa in ETAPAS if etapa in pedidas]
+
+
+def _cargar_bend(ruta, dir_cache, motor_excel):
+    bend = tr.cargar_y_procesar_excel_bend(ruta_archivo = ruta, dir_cache = dir_cache, motor = motor_excel)
+    print('\n✅ Datos B-end cargados. \n ')
+    bend['Commercial Model'] = tr.clasificar_por_reglas(bend, tr.REGLAS_COMMERCIAL_MODEL_PROVIDED)
+    return bend[COLUMNAS_BEND + [col for col in [COLUMNA_FECHA_BEND] if col in bend.columns]]
+
+
+def _cargar_ds(ruta, dir_cache, motor_excel):
+    ds = tr.cargar_y_procesar_ds(ruta_archivo = ruta, dir_cache = dir_cache, motor = motor_excel)
+    print('\n✅ Datos Deal Specialist cargados. Revisar si arriba  ⬆️  nos han salido ❌ IDs con dato faltante. \n')
+    return ds[COLUMNAS_DS]
+
+
+def _cargar_pe(ruta, dir_cache, motor_excel):
+    pe = tr.cargar_y_procesar_pe(ruta_archivo = ruta, columnas = tr.COLUMNAS_PE, dtypes = tr.DTYPES_PE)
+    print('✅ Datos Motor cargados \n ')
+    return pe[COLUMNAS_PE_SUMMARY].rename(columns = RENOMBRAR_PE)
+
+
+def _cargar_pe_por_bloques(ruta, bend, memoria_mb):
+    claves = fm.claves_ofertas(bend['quotation_ID'], bend['Option ID'])
+    pe = fm.cargar_pe_por_bloques(ruta, claves, memoria_mb = memoria_mb, columnas = tr.COLUMNAS_PE, dtypes = tr.DTYPES_PE)
+    print('✅ Datos Motor cargados \n ')
+    return pe[COLUMNAS_PE_SUMMARY].rename(columns = RENOMBRAR_PE)
+
+
+# Carga de cada fuente (ya con sus columnas seleccionadas), en el orden en que se muestran sus mensajes
+CARGADORES = {'bend': _cargar_bend, 'ds': _cargar_ds, 'pe': _cargar_pe}
+
+
+def _a_bytes(df):
+    """DataFrame --> bytes para devolverlo desde un proceso: formato Arrow (columnas en bloque, sin serializar objeto a objeto)
+    o, si pyarrow no está instalado o alguna columna no cabe en Arrow (tipos mezclados), pickle."""
+    try:
+        import pyarrow as pa
+        tabla = pa.Table.from_pandas(df, preserve_index = False)
+        destino = pa.BufferOutputStream()
+        with pa.ipc.new_stream(destino, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+        return 'arrow', destino.getvalue().to_pybytes()
+    except Exception:
+        import pickle
+        return 'pickle', pickle.dumps(df, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+def _de_bytes(formato, datos):
+    """Inversa de `_a_bytes`."""
+    if formato == 'arrow':
+        import pyarrow as pa
+        return pa.ipc.open_stream(datos).read_all().to_pandas()
+    import pickle
+    return pickle.loads(datos)
+
+
+def _cargar_en_proceso(fuente, ruta, dir_cache, motor_excel, medir = None):
+    """Carga una fuente en un proceso del pool; devuelve lo que ha impreso, la tabla en bytes (ver `_a_bytes`) y, si `medir`
+    (opciones de ins.iniciar, ver ins.opciones_proceso), las mediciones de las funciones instrumentadas en este proceso (para añadirlas al informe del proceso principal)."""
+    import io
+    from contextlib import redirect_stdout
+    if medir is not None:
+        ins.iniciar(**medir)
+    try:
+        with redirect_stdout(io.StringIO()) as salida:
+            df = CARGADORES[fuente](ruta, dir_cache, motor_excel)
+    finally:
+        ins.detener()
+    return salida.getvalue(), _a_bytes(df), ins.registros() if medir is not None else []
+
+
+def cargar_fuentes(dir_datos = "data", dir_salida = "output", motor_excel = "auto", reportes_memoria = None, rutas = None, paralelo = False,
+                   memoria_pe_mb = None):
+    """Etapa load: carga las tres fuentes, selecciona sus columnas, las renombra con su sufijo y aplica la política de tipos.
+
+    Args:
+        rutas (dict, opcional): rutas de cada fichero ({'bend', 'ds', 'pe'}) si no siguen los nombres ARCHIVO_* dentro de `dir_datos`
+                                (ej. los lotes de lotes.py).
+        paralelo (bool): si True, las tres fuentes se cargan a la vez, cada una en su proceso (el tiempo de carga se acerca al de la más lenta).
+                         Los mensajes de cada carga se muestran al terminar, en el mismo orden que en la carga secuencial.
+        memoria_pe_mb (float, opcional): si se indica, el CSV del Pricing Engine se carga por bloques de como mucho estos MB y sólo se conservan
+                                         las ofertas del B-End (ver fuera_de_memoria.py): para extracciones que no caben en memoria.
+                                         El PE se carga después del B-End (necesita sus claves).
+
+    Returns:
+        dict: {'req': bend_summary, 'ds': ds_summary, 'pe': pe_summary}
+    """
+    dir_cache = os.path.join(dir_salida, "cache")
+    rutas = {'bend': os.path.join(dir_datos, ARCHIVO_BEND),
+             'ds': os.path.join(dir_datos, ARCHIVO_DS),
+             'pe': os.path.join(dir_datos, ARCHIVO_PE),
+             **(rutas or {})}
+
+    cargadores = CARGADORES if memoria_pe_mb is None else {fuente: cargar for fuente, cargar in CARGADORES.items() if fuente != 'pe'}
+    if paralelo:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = len(cargadores)) as pool:
+            medir = ins.opciones_proceso()
+            futuros = {fuente: pool.submit(_cargar_en_proceso, fuente, rutas[fuente], dir_cache, motor_excel, medir) for fuente in cargadores}
+            tablas = {}
+            for fuente, futuro in futuros.items(): #en orden: los mensajes salen igual que en la carga secuencial
+                salida, datos, mediciones = futuro.result()
+                print(salida, end = '')
+                tablas[fuente] = _de_bytes(*datos)
+                ins.incorporar(mediciones, proceso = fuente) #tiempos de cargar_y_procesar_* medidos en el proceso del pool
+    else:
+        tablas = {fuente: cargar(rutas[fuente], dir_cache, motor_excel) for fuente, cargar in cargadores.items()}
+    if memoria_pe_mb is not None:
+        tablas['pe'] = _cargar_pe_por_bloques(rutas['pe'], tablas['bend'], memoria_pe_mb)
+
+    print('-' * 50)
+
+    fuentes = {'req': tr.rename_columns(tablas['bend'], 'req'),
+               'ds': tr.rename_columns(tablas['ds'], 'ds'),
+               'pe': tr.rename_columns(tablas['pe'], 'pe')}
+
+    # Política de tipos: columnas de texto con pocos valores distintos --> 'category', con las mismas categorías en las tres fuentes
+    memoria_antes = {sufijo: tipos.memoria_por_columna(df) for sufijo, df in fuentes.items()}
+    tipos.aplicar_politica_dtypes(fuentes, excluir = ['quotation_ID_req', 'quotation_ID_ds', 'quotation_ID_pe'])
+    if reportes_memoria is not None:
+        reportes_memoria.extend(tipos.reporte_memoria(f'carga {sufijo}', df, memoria_antes[sufijo]) for sufijo, df in fuentes.items())
+
+    return fuentes
+
+
+def unir_fuentes(fuentes, reportes_memoria = None):
+    """Etapa merge: une las tres fuentes por sus claves reales (quotation_ID + Option ID), no por la posición de cada fila."""
+    df_merged = rc.reconciliar(fuentes)
+    if reportes_memoria is not None:
+        reportes_memoria.append(tipos.reporte_memoria('merge', df_merged))
+    return df_merged
+
+
+def pares_divisas(df_merged):
+    """Pares (origen, destino) de divisas que necesitará la etapa fx para este DataFrame (sin llamar a la API)."""
+    return tr.pares_divisas(df_merged, *COLUMNAS_DIVISA, diccionario = tr.name_to_iso)
+
+
+def convertir_divisas(df_merged, dir_salida = "output", offline = False, reportes_memoria = None, ruta_cache = None,
+                      tasas_historicas = False, fecha_tasas = None, tabla_tasas = None):
+    """Etapa fx: convierte el FCV de DS y PE a la divisa del B-End, calcula la delta y clasifica los cambios de modelo comercial.
+
+    Por defecto se usa el tipo de cambio del día. Con `tasas_historicas` o `fecha_tasas` se usa una tabla histórica de tipos de cambio
+    (descargada una vez por rango de fechas y guardada en la caché, o leída de `tabla_tasas`), y volver a ejecutar da el mismo resultado.
+
+    Args:
+        ruta_cache (str, opcional): caché SQLite de tipos de cambio. Por defecto <dir_salida>/cache_divisas.sqlite.
+        tasas_historicas (bool): si True, cada oferta se convierte con el tipo de cambio de su fecha (columna COLUMNA_FECHA del B-End).
+        fecha_tasas (str, opcional): fecha (YYYY-MM-DD) cuyo tipo de cambio se aplica a todas las ofertas.
+        tabla_tasas (str, opcional): tabla histórica local de tipos de cambio (ver divisas.leer_tabla_tasas).
+    """
+    if tasas_historicas and COLUMNA_FECHA not in df_merged.columns:
+        raise KeyError(f"Para convertir con el tipo de cambio de cada fecha, el B-End necesita la columna '{COLUMNA_FECHA_BEND}'")
+    col_currency_req, col_currency_ds, col_currency_pe = COLUMNAS_DIVISA
+    df_merged_final = tr.fcv_currency_or_multicurrency(
+        df_merged,
+        col_currency_req = col_currency_req,
+        col_currency_ds = col_currency_ds, col_val_ds = 'FCV_ds',
+        col_currency_pe = col_currency_pe, col_val_pe = 'FCV_pe',
+        diccionario = tr.name_to_iso,
+        ruta_cache = ruta_cache or os.path.join(dir_salida, 'cache_divisas.sqlite'), # caché persistente de tipos de cambio: las siguientes ejecuciones no llaman a la API
+        offline = offline,
+        col_fecha = COLUMNA_FECHA if tasas_historicas else None, fecha_tasas = fecha_tasas, ruta_tabla_tasas = tabla_tasas
+    )
+    if reportes_memoria is not None:
+        reportes_memoria.append(tipos.reporte_memoria('divisas', df_merged_final))
+
+    print('-' * 50)
+
+    df_merged_final['Commercial_model_changes'] = tr.clasificar_por_reglas(df_merged_final, tr.REGLAS_COMMERCIAL_MODEL_CHANGES)
+    return df_merged_final
+
+
+def resumir(df_merged_final, dir_salida = "output"):
+    """Etapa agg: tablas resumen para Power BI (resumen.csv y su .txt con la ruta), para que los informes se actualicen a partir de
+    las filas ya agregadas por país, Lot, Commercial Model, proveedor, fuente del precio del PE y cambio de divisa (ver estadisticas.tablas_resumen)."""
+    df_resumen = est.tablas_resumen(df_merged_final)
+    ruta = os.path.join(dir_salida, 'resumen.csv')
+    manifiesto = sal.leer_manifiesto(dir_salida)
+    sal.guardar_salida(ruta, lambda temporal: tr.exportar_csv_powerbi(df_resumen, temporal), manifiesto, dir_salida, df = df_resumen)
+    print(f"✅ Tablas resumen para PowerBI: {len(df_resumen)} filas en {ruta}")
+    sal.registrar(manifiesto, dir_salida, tr.guardar_ruta_csv(ruta))
+    sal.guardar_manifiesto(dir_salida, manifiesto)
+    return df_resumen
+
+
+def exportar(df_merged_final, dir_salida = "output", estrella = False):
+    """Etapa export: CSV para las visualizaciones en Python, CSV para Power BI y los .txt con sus rutas.
+    Cada fichero se escribe de forma atómica y sólo si su contenido cambia, y queda anotado en <dir_salida>/manifiesto.json (ver salidas.py).
+
+    Args:
+        estrella (bool): si True, en lugar de merged.csv se exporta en <dir_salida>/estrella/ una tabla de hechos (hechos.csv) y una tabla
+                         por dimensión (dim_*.csv) para el modelo de Power BI, y su carpeta en estrella_path.txt (ver estrella.py).
+    """
+    df_precios = df_merged_final[COLUMNAS_PRECIOS]
+    manifiesto = sal.leer_manifiesto(dir_salida)
+
+    def guardar(nombre, df, escribir):
+        sal.guardar_salida(os.path.join(dir_salida, nombre), escribir, manifiesto, dir_salida, df = df)
+
+    guardar('merged_viz.csv', df_merged_final, lambda ruta: df_merged_final.to_csv(ruta, index = False))
+    print('\n ✅ Archivos transformados para visualizaciones en python')
+
+    # Coma decimal para Power BI: la escribe directamente el exportador, sin convertir los floats del DataFrame a texto
+    # Cuartiles y outliers de la delta, en total y por Lot, Commercial Model, país y proveedor
+    df_estadisticas = est.estadisticas_outliers(df_merged_final)['tabla']
+    tablas = {'precios.csv': df_precios, 'estadisticas_outliers.csv': df_estadisticas}
+    if estrella:
+        tablas.update({os.path.join(DIR_ESTRELLA, f'{nombre}.csv'): df for nombre, df in es.esquema_estrella(df_merged_final).items()})
+    else:
+        tablas = {'merged.csv': df_merged_final, **tablas}
+    for nombre, df in tablas.items():
+        guardar(nombre, df, lambda ruta, df = df: tr.exportar_csv_powerbi(df, ruta))
+
+    print('✅ Archivos transformados para visualizaciones en PowerBI.')
+    print('-' * 50)
+
+    rutas = [DIR_ESTRELLA if estrella else 'merged.csv', 'precios.csv', 'estadisticas_outliers.csv']
+    for nombre in rutas: #con estrella=True, estrella_path.txt guarda la ruta de la carpeta (en Power BI: origen "Carpeta")
+        sal.registrar(manifiesto, dir_salida, tr.guardar_ruta_csv(os.path.join(dir_salida, nombre)))
+    sal.guardar_manifiesto(dir_salida, manifiesto)
+
+
+def visualizar(dir_salida = "output", mostrar = True, dpi = None, max_puntos = None, procesos = None):
+    """Etapa viz: gráficos de la delta a partir del merged_viz.csv exportado.
+
+    Args:
+        dir_salida (str): carpeta con merged_viz.csv, donde se guardan también los PNG.
+        mostrar (bool): si False, los gráficos sólo se guardan (sin plt.show()) y se dibujan a la vez en un pool de procesos.
+        dpi (int or None): resolución de los PNG. None = visualizaciones.DPI.
+        max_puntos (int or None): por encima de este nº de puntos se dibuja una muestra estratificada. None = visualizaciones.MAX_PUNTOS.
+        procesos (int or None): procesos para dibujar los gráficos cuando mostrar=False (ver visualizaciones.renderizar_en_paralelo).
+    """
+    from . import visualizaciones as viz #matplotlib y seaborn sólo se cargan si se generan gráficos
+    dpi = dpi or viz.DPI
+    max_puntos = max_puntos or viz.MAX_PUNTOS
+
+    # Sólo las columnas que usan los gráficos
+    df_viz = pd.read_csv(os.path.join(dir_salida, 'merged_viz.csv'), usecols = COLUMNAS_VIZ)
+    # Cuartiles y outliers calculados una sola vez para todos los gráficos
+    estadisticas = est.estadisticas_outliers(df_viz, 'delta PE vs DS', grupos = {})
+    resultado = viz.separar_outliers(df_viz, 'delta PE vs DS', estadisticas = estadisticas)
+
+    graficos = [
+        ('generar_boxplot_delta', {'df': df_viz, 'save_path': os.path.join(dir_salida, 'delta_boxplot.png'),
+                                   'estadisticas': estadisticas, 'max_puntos': max_puntos, 'dpi': dpi}),
+        ('visualizar_outliers', {'df': resultado['outliers'], 'limite_inferior': resultado['limite_inferior'],
+                                 'limite_superior': resultado['limite_superior'],
+                                 'save_path': os.path.join(dir_salida, 'delta_outliers_distribution.png'),
+                                 'estadisticas': estadisticas, 'dpi': dpi}),
+        ('viz_delta_vs_tipo_servicio', {'df_completo': df_viz, 'df_outliers': resultado['outliers'], 'df_sin_outliers': resultado['sin_outliers'],
+                                        'save_path': os.path.join(dir_salida, 'delta_vs_tipo_servicio.png'), 'max_puntos': max_puntos, 'dpi': dpi}),
+    ]
+    if mostrar:
+        for nombre, kwargs in graficos:
+            getattr(viz, nombre)(**kwargs, show_plot = True)
+    else:
+        viz.renderizar_en_paralelo(graficos, procesos = procesos)
+
+    # Los PNG se guardan de forma atómica y sólo si cambian (ver visualizaciones._guardar_o_mostrar); aquí se anotan en el manifiesto
+    manifiesto = sal.leer_manifiesto(dir_salida)
+    for _, kwargs in graficos:
+        if os.path.isfile(kwargs['save_path']):
+            sal.registrar(manifiesto, dir_salida, kwargs['save_path'])
+    sal.guardar_manifiesto(dir_salida, manifiesto)
+
+
+def ejecutar(etapas = ETAPAS, dir_datos = "data", dir_salida = "output", headless = False, offline = False, motor_excel = "auto",
+             ruta_informe = None, trazar_memoria = False, dir_perfiles = None, incremental = False, completo = False, dpi = None,
+             carga_paralela = None, tasas_historicas = False, fecha_tasas = None, tabla_tasas = None, memoria_pe_mb = None, estrella = False):
+    """Ejecuta las etapas indicadas del ETL (y las etapas de las que dependen), midiendo cada una.
+
+    Args:
+        etapas (list): etapas a ejecutar (ver ETAPAS).
+        dir_datos (str): carpeta con bend.xlsm, ds.xlsx y pe.csv.
+        dir_salida (str): carpeta donde se guardan los CSV, los gráficos y las cachés.
+        headless (bool): si True, backend 'Agg' de matplotlib y sin plt.show() (ejecuciones programadas, CI).
+        offline (bool): si True, no se llama a la API de divisas (sólo caché).
+        motor_excel (str or None): motor de lectura de los Excel (ver cache_entradas.elegir_motor_excel).
+        ruta_informe (str or None): JSON con tiempos, memoria, filas y llamadas HTTP de cada etapa (ver instrumentacion.py).
+                                    Por defecto <dir_salida>/informe_ejecucion.json.
+        trazar_memoria (bool): si True, añade al informe la memoria de Python medida con tracemalloc (ralentiza la ejecución).
+        dir_perfiles (str or None): carpeta donde guardar un perfil cProfile por etapa (ej. 'output/perfiles'). None = sin perfiles.
+        incremental (bool): si True, la etapa fx sólo recalcula las ofertas nuevas o modificadas desde la última ejecución (ver incremental.py).
+        completo (bool): con incremental=True, recalcula todas las filas (ej. para aplicar los tipos de cambio actuales) y rehace el almacén.
+        dpi (int or None): resolución de los gráficos. None = visualizaciones.DPI (300).
+        carga_paralela (bool or None): si True, las tres fuentes se cargan a la vez en procesos separados (ver cargar_fuentes).
+                                       None = sí si la máquina tiene más de un núcleo.
+        tasas_historicas, fecha_tasas, tabla_tasas: tipos de cambio históricos en lugar de los del día (ver convertir_divisas).
+        memoria_pe_mb (float or None): carga el Pricing Engine por bloques de como mucho estos MB, sólo con las ofertas del B-End (ver cargar_fuentes).
+        estrella (bool): exporta para Power BI una tabla de hechos y tablas de dimensiones en lugar de merged.csv (ver exportar).
+
+    Returns:
+        pd.DataFrame or None: df_merged_final si se ha ejecutado la etapa fx.
+    """
+    etapas = resolver_etapas(etapas)
+    if carga_paralela is None:
+        carga_paralela = (os.cpu_count() or 1) > 1
+    if headless and 'viz' in etapas:
+        import matplotlib
+        matplotlib.use('Agg')
+    os.makedirs(dir_salida, exist_ok = True)
+    print(f"▶️ Etapas: {' ➡️ '.join(etapas)}")
+
+    ins.iniciar(trazar_memoria = trazar_memoria, dir_perfiles = dir_perfiles)
+    reportes_memoria = []
+    fuentes = df_merged = df_merged_final = None
+
+    try:
+        if 'load' in etapas:
+            with ins.medir_etapa('load') as registro:
+                fuentes = cargar_fuentes(dir_datos, dir_salida, motor_excel, reportes_memoria, paralelo = carga_paralela,
+                                         memoria_pe_mb = memoria_pe_mb)
+                registro['filas_salida'] = ins.contar_filas(fuentes)
+        if 'merge' in etapas:
+            with ins.medir_etapa('merge', filas_entrada = ins.contar_filas(fuentes)) as registro:
+                df_merged = unir_fuentes(fuentes, reportes_memoria)
+                registro['filas_salida'] = len(df_merged)
+        if 'fx' in etapas:
+            with ins.medir_etapa('fx', filas_entrada = len(df_merged)) as registro:
+                opciones_tasas = {'tasas_historicas': tasas_historicas, 'fecha_tasas': fecha_tasas, 'tabla_tasas': tabla_tasas}
+                if incremental:
+                    df_merged_final = inc.convertir_incremental(df_merged, lambda df: convertir_divisas(df, dir_salida, offline, reportes_memoria, **opciones_tasas),
+                                                                dir_salida, completo = completo, opciones = opciones_tasas)
+                    registro.update(df_merged_final.attrs['incremental'])
+                else:
+                    df_merged_final = convertir_divisas(df_merged, dir_salida, offline, reportes_memoria, **opciones_tasas)
+                registro['filas_salida'] = len(df_merged_final)
+        if reportes_memoria:
+            pd.concat(reportes_memoria).to_csv(os.path.join(dir_salida, 'reporte_memoria.csv'))
+        if 'agg' in etapas:
+            with ins.medir_etapa('agg', filas_entrada = len(df_merged_final)) as registro:
+                registro['filas_salida'] = len(resumir(df_merged_final, dir_salida))
+        if 'export' in etapas:
+            with ins.medir_etapa('export', filas_entrada = len(df_merged_final)):
+                exportar(df_merged_final, dir_salida, estrella = estrella)
+        if 'viz' in etapas:
+            with ins.medir_etapa('viz'):
+                visualizar(dir_salida, mostrar = not headless, dpi = dpi)
+    finally:
+        ins.detener()
+        print('-' * 50)
+        ins.resumen()
+        ins.guardar_informe(ruta_informe or os.path.join(dir_salida, 'informe_ejecucion.json'),
+                            extra = {'etapas_pedidas': etapas, 'dir_datos': dir_datos, 'dir_salida': dir_salida, 'offline': offline,
+                                     'incremental': incremental})
+
+    return df_merged_final
+
+
+def crear_parser():
+    """Argumentos de la línea de comandos."""
+    parser = argparse.ArgumentParser(prog = "python -m src", description = "ETL de análisis de precios: B-End vs Deal Specialist vs Pricing Engine.")
+    parser.add_argument("--etapas", nargs = "+", choices = ETAPAS, default = ETAPAS,
+                        help = "Etapas a ejecutar (se añaden las etapas del ETL de las que dependen). Por defecto todas.")
+    parser.add_argument("--datos", default = "data", help = "Carpeta con bend.xlsm, ds.xlsx y pe.csv (por defecto: data).")
+    parser.add_argument("--salida", default = "output", help = "Carpeta de salida (por defecto: output).")
+    parser.add_argument("--headless", action = "store_true", help = "Sin ventanas: backend Agg y gráficos sólo guardados en PNG.")
+    parser.add_argument("--sin-viz", action = "store_true", help = "Omite la etapa viz.")
+    parser.add_argument("--offline", action = "store_true", help = "No llama a la API de divisas: usa sólo la caché.")
+    parser.add_argument("--informe", default = None, help = "Ruta del informe JSON de la ejecución (por defecto: <salida>/informe_ejecucion.json).")
+    parser.add_argument("--perfil", action = "store_true", help = "Guarda un perfil cProfile por etapa en <salida>/perfiles (abrir con snakeviz o pstats).")
+    parser.add_argument("--trazar-memoria", action = "store_true", help = "Añade al informe la memoria de Python por etapa (tracemalloc; más lento).")
+    parser.add_argument("--incremental", action = "store_true", help = "Sólo recalcula las ofertas nuevas o modificadas desde la última ejecución.")
+    parser.add_argument("--completo", action = "store_true", help = "Con --incremental: recalcula todo y rehace el resultado guardado.")
+    parser.add_argument("--carga-secuencial", action = "store_true", help = "Carga las tres fuentes una detrás de otra (por defecto, a la vez si hay varios núcleos).")
+    parser.add_argument("--tasas-historicas", action = "store_true",
+                        help = f"Convierte cada oferta con el tipo de cambio de su fecha (columna '{COLUMNA_FECHA_BEND}' del B-End).")
+    parser.add_argument("--fecha-tasas", default = None, help = "Convierte todas las ofertas con el tipo de cambio de esta fecha (YYYY-MM-DD).")
+    parser.add_argument("--tabla-tasas", default = None,
+                        help = "Tabla histórica local de tipos de cambio (.csv o .parquet: fecha, divisa, tasa frente al USD) en lugar de la API.")
+    parser.add_argument("--memoria-pe", type = float, default = None, metavar = "MB",
+                        help = "Lee pe.csv por bloques de como mucho MB megas y sólo con las ofertas del B-End (para extracciones que no caben en memoria).")
+    parser.add_argument("--estrella", action = "store_true",
+                        help = "Exporta para Power BI una tabla de hechos y tablas de dimensiones (<salida>/estrella/) en lugar de merged.csv.")
+    parser.add_argument("--dpi", type = int, default = None, help = "Resolución de los gráficos PNG (por defecto: 300).")
+    parser.add_argument("--motor-excel", default = "auto", help = "Motor de lectura de los Excel: auto, calamine, openpyxl (por defecto: auto).")
+    return parser
+
+
+def main(argv = None):
+    """Punto de entrada: python -m src [--etapas ...] [--datos ...] [--salida ...] [--headless] [--offline]"""
+    args = crear_parser().parse_args(argv)
+    etapas = [etapa for etapa in args.etapas if not (args.sin_viz and etapa == 'viz')]
+    ejecutar(etapas, dir_datos = args.datos, dir_salida = args.salida, headless = args.headless,
+             offline = args.offline, motor_excel = args.motor_excel, ruta_informe = args.informe,
+             trazar_memoria = args.trazar_memoria, dir_perfiles = os.path.join(args.salida, "perfiles") if args.perfil else None,
+             incremental = args.incremental, completo = args.completo, dpi = args.dpi,
+             carga_paralela = False if args.carga_secuencial else None, tasas_historicas = args.tasas_historicas,
+             fecha_tasas = args.fecha_tasas, tabla_tasas = args.tabla_tasas, memoria_pe_mb = args.memoria_pe,
+             estrella = args.estrella)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+from . import instrumentacion as ins
+
+
+# Claves que identifican una misma oferta en las tres fuentes (nombres antes de añadir el sufijo de transformacion.rename_columns)
+CLAVES_RECONCILIACION = ['quotation_ID', 'Option ID']
+
+
+def _columna_clave(clave, sufijo):
+    """Nombre de la columna clave en una fuente ya renombrada con transformacion.rename_columns (ej. 'Option ID', 'pe' --> 'Option_ID_pe')."""
+    return clave.replace(' ', '_') + '_' + sufijo
+
+
+def _texto_clave(valor):
+    """Representación de texto de un valor clave: los números enteros sin decimales (101 y 101.0 --> '101') y los textos sin espacios."""
+    if isinstance(valor, (float, np.floating)) and np.isfinite(valor) and float(valor).is_integer():
+        return str(int(valor))
+    if isinstance(valor, (int, np.integer)):
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _normalizar_clave(unicos):
+    """Valores distintos de una columna clave como texto (ver `_texto_clave`), para que el mismo ID se reconozca aunque una fuente
+    lo haya leído como número y otra como texto (ej. 101 en un Excel y '101' en el CSV)."""
+    serie = pd.Series(unicos)
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(serie.cat.categories.dtype)
+    if pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.astype(str)
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.astype('int64').astype(str)
+    if pd.api.types.is_float_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype = float)
+        enteros = np.isfinite(valores) & (valores == np.floor(valores))
+        if enteros.all():
+            return pd.Series(valores.astype(np.int64).astype(str), dtype = object)
+        texto = serie.astype(str).to_numpy(dtype = object)
+        texto[enteros] = valores[enteros].astype(np.int64).astype(str)
+        return pd.Series(texto, dtype = object)
+    if pd.api.types.is_string_dtype(serie.dtype) and not pd.api.types.is_object_dtype(serie.dtype):
+        return serie.str.strip()
+    return serie.map(_texto_clave) #object: puede mezclar números y textos
+
+
+def _enteros_clave(unicos):
+    """Valores distintos de una columna clave numérica como int64 si todos son enteros (ej. 101.0 --> 101); None si no."""
+    serie = pd.Series(unicos)
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(serie.cat.categories.dtype)
+    if pd.api.types.is_bool_dtype(serie.dtype) or not pd.api.types.is_numeric_dtype(serie.dtype):
+        return None
+    valores = serie.to_numpy(dtype = float) if pd.api.types.is_float_dtype(serie.dtype) else serie.to_numpy(dtype = np.int64)
+    if valores.dtype == float and not (np.isfinite(valores) & (valores == np.floor(valores))).all():
+        return None
+    return valores.astype(np.int64)
+
+
+def _codificar_clave(series):
+    """Traduce una misma columna clave de varias fuentes a códigos enteros comunes (mismo valor --> mismo código en todas las fuentes).
+
+    Cada columna se factoriza por separado (en las categóricas se reutilizan sus códigos) y después se unen sólo sus valores distintos,
+    como enteros o pasados a texto (ver `_normalizar_clave`): 101, 101.0 y '101' son la misma clave.
+
+    Args:
+        series (list): una pd.Series por fuente.
+
+    Returns:
+        tuple: (lista de arrays de códigos int64, uno por fuente, con -1 para los valores vacíos; nº de valores distintos)
+    """
+    locales = [pd.factorize(serie) for serie in series]
+
+    #Una sola factorización de los valores distintos de todas las fuentes da el código común de cada uno: como enteros si en todas las fuentes
+    #son números enteros (lo habitual en Option ID, y mucho más rápido) y, si no, como texto
+    enteros = [_enteros_clave(unicos) for _, unicos in locales]
+    if all(valores is not None for valores in enteros):
+        distintos = [pd.Series(valores) for valores in enteros]
+    else:
+        distintos = [_normalizar_clave(unicos).astype(object) for _, unicos in locales]
+    comunes, vocabulario = pd.factorize(pd.concat(distintos, ignore_index = True))
+
+    codigos_fuentes = []
+    inicio = 0
+    for codigos, unicos in locales:
+        mapa = comunes[inicio:inicio + len(unicos)]
+        inicio += len(unicos)
+        codigos_fuentes.append(np.where(codigos >= 0, mapa[codigos], -1).astype(np.int64))
+    return codigos_fuentes, len(vocabulario)
+
+
+def codificar_claves(fuentes, claves):
+    """Construye una clave entera única por fila a partir de varias columnas clave, común a todas las fuentes.
+
+    Args:
+        fuentes (dict): {sufijo: DataFrame} con las columnas renombradas (ej. 'quotation_ID_req', 'Option_ID_req').
+        claves (list): nombres de las columnas clave sin sufijo (ej. CLAVES_RECONCILIACION).
+
+    Returns:
+        tuple: ({sufijo: array int64 de códigos de clave, -1 si alguna columna clave está vacía}, nº de claves distintas)
+    """
+    sufijos = list(fuentes)
+    combinados = [np.zeros(len(fuentes[sufijo]), dtype=np.int64) for sufijo in sufijos]
+    n_claves = 1
+
+    for clave in claves:
+        codigos, n_valores = _codificar_clave([fuentes[sufijo][_columna_clave(clave, sufijo)] for sufijo in sufijos])
+        for i, codigo in enumerate(codigos):
+            combinados[i] = np.where((combinados[i] >= 0) & (codigo >= 0), combinados[i] * n_valores + codigo, -1)
+
+        #Volvemos a numerar las claves combinadas (0..n-1) para que los códigos no crezcan con cada columna clave
+        todos = np.concatenate(combinados)
+        validos = todos >= 0
+        renumerados = np.full(len(todos), -1, dtype=np.int64)
+        renumerados[validos], unicos = pd.factorize(todos[validos])
+        n_claves = len(unicos)
+        combinados = np.split(renumerados, np.cumsum([len(c) for c in combinados])[:-1])
+
+    return dict(zip(sufijos, combinados)), n_claves
+
+
+def indexar_claves(codigos, n_claves):
+    """Índice directo clave --> fila: como los códigos son enteros entre 0 y n_claves-1, basta con un array (sin ordenar ni hashear).
+
+    Args:
+        codigos (np.ndarray): códigos de clave de una fuente (-1 = clave vacía).
+        n_claves (int): nº total de claves distintas.
+
+    Returns:
+        tuple: (array de n_claves con la primera fila de cada clave o -1 si no existe; nº de filas con cada clave)
+    """
+    validas = np.flatnonzero(codigos >= 0)
+    indice = np.full(n_claves, -1, dtype=np.int64)
+    indice[codigos[validas][::-1]] = validas[::-1] #con índices repetidos gana la última asignación: recorriendo al revés se queda la primera fila
+    repeticiones = np.bincount(codigos[validas], minlength = n_claves)
+    return indice, repeticiones
+
+
+def _muestra_claves(df, sufijo, claves, filas, max_ids):
+    """Primeras claves (sin repetir) de las filas indicadas, para el informe."""
+    columnas = [_columna_clave(clave, sufijo) for clave in claves]
+    muestra = df[columnas].iloc[filas].drop_duplicates().head(max_ids)
+    return [tuple(fila) for fila in muestra.itertuples(index = False, name = None)]
+
+
+@ins.instrumentar
+def reconciliar(fuentes, claves = CLAVES_RECONCILIACION, duplicados = 'primero', max_ids = 10, devolver_informe = False):
+    """Une las tres fuentes por sus claves reales en un único paso (equivalente a encadenar merge(how='left') desde la primera fuente).
+
+    A diferencia de unir por la posición de cada fila, una fila de más o de menos en una fuente no desplaza al resto: cada fila de la
+    primera fuente (el B-End) recibe la fila de cada otra fuente con la misma clave, o vacío si no existe.
+    Las claves se traducen a enteros comunes y se indexan con un array directo clave --> fila, y cada columna del resultado se construye
+    una sola vez tomando sus filas de la fuente original (sin DataFrames intermedios).
+
+    Args:
+        fuentes (dict): {sufijo: DataFrame} renombrados con transformacion.rename_columns, ej. {'req': bend_summary, 'ds': ds_summary, 'pe': pe_summary}.
+                        La primera fuente es la principal: el resultado tiene sus filas, en su orden.
+        claves (list): columnas clave sin sufijo. Por defecto CLAVES_RECONCILIACION (quotation_ID + Option ID).
+        duplicados (str): qué hacer si una clave se repite en una fuente secundaria:
+                          'primero' --> se usa la primera fila con esa clave (y se informa); 'error' --> ValueError.
+        max_ids (int): nº máximo de claves de ejemplo en el informe por fuente.
+        devolver_informe (bool): si True, devuelve también el informe.
+
+    Returns:
+        pd.DataFrame: columnas de la fuente principal seguidas de las de cada otra fuente. El informe queda en df.attrs['reconciliacion'].
+        dict (si devolver_informe=True): {sufijo: {'filas', 'sin_clave', 'claves_duplicadas', 'filas_duplicadas', 'sin_correspondencia', 'muestra_duplicadas', 'muestra_sin_correspondencia'}}.
+                                         En la fuente principal, 'sin_correspondencia' son sus filas que no están en ninguna otra fuente;
+                                         en las demás, sus filas cuya clave no está en la principal (quedan fuera del resultado).
+
+    Ejemplo de uso:
+        df_merged = reconciliar({'req': bend_summary, 'ds': ds_summary, 'pe': pe_summary})
+    """
+    if duplicados not in ('primero', 'error'):
+        raise ValueError(f"duplicados debe ser 'primero' o 'error', no {duplicados!r}")
+
+    sufijos = list(fuentes)
+    principal = sufijos[0]
+    for sufijo in sufijos:
+        faltan = [_columna_clave(clave, sufijo) for clave in claves if _columna_clave(clave, sufijo) not in fuentes[sufijo].columns]
+        if faltan:
+            raise KeyError(f"Faltan columnas clave en la fuente '{sufijo}': {faltan}")
+
+    codigos, n_claves = codificar_claves(fuentes, claves)
+    n_claves = max(n_claves, 1) #los índices necesitan al menos una posición aunque no haya ninguna clave válida
+    codigos_principal = codigos[principal]
+    validas_principal = codigos_principal >= 0
+
+    informe = {}
+    columnas = {col: fuentes[principal][col].array for col in fuentes[principal].columns}
+    encontrada_en_alguna = np.zeros(len(codigos_principal), dtype=bool)
+
+    for sufijo in sufijos:
+        df = fuentes[sufijo]
+        indice, repeticiones = indexar_claves(codigos[sufijo], n_claves)
+        filas_duplicadas = np.flatnonzero((codigos[sufijo] >= 0) & (repeticiones[np.maximum(codigos[sufijo], 0)] > 1))
+        informe[sufijo] = {'filas': len(df),
+                           'sin_clave': int((codigos[sufijo] < 0).sum()),
+                           'claves_duplicadas': int((repeticiones > 1).sum()),
+                           'filas_duplicadas': len(filas_duplicadas),
+                           'muestra_duplicadas': _muestra_claves(df, sufijo, claves, filas_duplicadas, max_ids)}
+        if sufijo == principal:
+            continue
+
+        if duplicados == 'error' and len(filas_duplicadas):
+            raise ValueError(f"Claves duplicadas en la fuente '{sufijo}': {informe[sufijo]['muestra_duplicadas']}")
+
+        #Fila de esta fuente para cada fila de la principal (-1 = sin correspondencia)
+        filas = np.where(validas_principal, indice[np.maximum(codigos_principal, 0)], -1)
+        encontrada_en_alguna |= filas >= 0
+        if validas_principal.any() and (codigos[sufijo] >= 0).any() and not (filas >= 0).any():
+            print(f"⚠️ Ninguna clave de '{sufijo}' coincide con las de '{principal}': revisar el formato de {' + '.join(claves)} en las dos fuentes")
+        for col in df.columns:
+            columnas[col] = pd.api.extensions.take(df[col].array, filas, allow_fill = True)
+
+        #Filas de esta fuente que no se usan: su clave no está en la principal
+        en_principal = np.zeros(n_claves, dtype=bool)
+        en_principal[codigos_principal[validas_principal]] = True
+        sobrantes = np.flatnonzero(~en_principal[np.maximum(codigos[sufijo], 0)] | (codigos[sufijo] < 0))
+        informe[sufijo]['sin_correspondencia'] = len(sobrantes)
+        informe[sufijo]['muestra_sin_correspondencia'] = _muestra_claves(df, sufijo, claves, sobrantes, max_ids)
+
+    sin_pareja = np.flatnonzero(~encontrada_en_alguna)
+    informe[principal]['sin_correspondencia'] = len(sin_pareja)
+    informe[principal]['muestra_sin_correspondencia'] = _muestra_claves(fuentes[principal], principal, claves, sin_pareja, max_ids)
+
+    resultado = pd.DataFrame(columnas)
+    resultado.attrs['reconciliacion'] = informe
+
+    #Resumen por pantalla
+    print(f"🔗 Reconciliación por {' + '.join(claves)}: {len(resultado)} filas de '{principal}'")
+    for sufijo, datos in informe.items():
+        print(f"   {sufijo}: {datos['filas']} filas | {datos['sin_clave']} sin clave | "
+              f"{datos['claves_duplicadas']} claves duplicadas ({datos['filas_duplicadas']} filas) | {datos['sin_correspondencia']} sin correspondencia")
+        if datos['filas_duplicadas']:
+            print(f"   ❌ Duplicadas en {sufijo} (primeras {max_ids}): {datos['muestra_duplicadas']}")
+        if datos['sin_correspondencia']:
+            print(f"   ❌ Sin correspondencia en {sufijo} (primeras {max_ids}): {datos['muestra_sin_correspondencia']}")
+
+    if devolver_informe:
+        return resultado, informe
+    return resultado
@@ -0,0 +1,162 @@
+import os
+import json
+import uuid
+from datetime import datetime
+from . import cache_entradas as ce
+
+
+# Escritura de las salidas (CSV, PNG y .txt con las rutas para Power BI):
+#   - cada fichero se escribe primero en un temporal de la misma carpeta y sustituye al anterior con os.replace (atómico): si la ejecución
+#     se interrumpe, Power BI nunca ve un CSV a medio escribir;
+#   - si el contenido no ha cambiado (mismo hash), el fichero anterior no se toca y conserva su fecha de modificación;
+#   - el manifiesto (manifiesto.json, junto a los *_path.txt) guarda de cada salida su ruta, hash, nº de filas, esquema y fechas,
+#     para que las actualizaciones posteriores (ej. Power BI) puedan saltarse los datos que no han cambiado.
+
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+
+# Cambiar si cambia el formato del manifiesto
+VERSION_MANIFIESTO = 1
+
+
+def ruta_temporal(ruta):
+    """Fichero temporal oculto en la misma carpeta que `ruta` (os.replace sólo es atómico dentro del mismo sistema de ficheros),
+    con la misma extensión (ej. matplotlib decide el formato por la extensión)."""
+    carpeta, nombre = os.path.split(os.path.abspath(ruta))
+    base, extension = os.path.splitext(nombre)
+    return os.path.join(carpeta, f".{base}.{uuid.uuid4().hex[:8]}.tmp{extension}")
+
+
+def _huella_actual(ruta, entrada = None):
+    """Hash del fichero que hay ahora en `ruta` (None si no existe). Si el manifiesto lo registró y el fichero no se ha tocado desde entonces
+    (mismo tamaño y fecha de modificación), se usa el hash guardado en lugar de volver a leerlo."""
+    if not os.path.isfile(ruta):
+        return None
+    estado = os.stat(ruta)
+    if entrada and entrada.get('bytes') == estado.st_size and entrada.get('mtime_ns') == estado.st_mtime_ns:
+        return entrada['hash']
+    return ce.hash_archivo(ruta)
+
+
+def sustituir_si_cambia(temporal, ruta, entrada = None):
+    """Sustituye `ruta` por el fichero `temporal` ya escrito (os.replace, atómico) sólo si su contenido es distinto; si no, borra el temporal.
+
+    Args:
+        temporal (str): fichero ya escrito (ver `ruta_temporal`).
+        ruta (str): fichero de salida.
+        entrada (dict, opcional): entrada del manifiesto de este fichero (evita volver a calcular el hash del fichero anterior).
+
+    Returns:
+        tuple: (hash del contenido, True si el fichero ha cambiado y se ha sustituido)
+    """
+    huella = ce.hash_archivo(temporal)
+    if huella == _huella_actual(ruta, entrada):
+        os.remove(temporal)
+        return huella, False
+    os.replace(temporal, ruta)
+    return huella, True
+
+
+def escribir_si_cambia(ruta, escribir, entrada = None):
+    """Escribe un fichero de forma atómica y sólo si su contenido cambia.
+
+    Args:
+        ruta (str): fichero de salida.
+        escribir (callable): recibe la ruta de un fichero temporal y escribe en ella el contenido (ej. lambda temporal: df.to_csv(temporal)).
+        entrada (dict, opcional): como en `sustituir_si_cambia`.
+
+    Returns:
+        tuple: (hash del contenido, True si el fichero ha cambiado y se ha sustituido)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok = True)
+    temporal = ruta_temporal(ruta)
+    try:
+        escribir(temporal)
+        return sustituir_si_cambia(temporal, ruta, entrada)
+    finally:
+        if os.path.exists(temporal): #error al escribir: no se deja el temporal
+            os.remove(temporal)
+
+
+def esquema(df):
+    """Columnas de un DataFrame con su tipo, para el manifiesto: [{'nombre', 'tipo'}]."""
+    return [{'nombre': str(col), 'tipo': str(tipo)} for col, tipo in df.dtypes.items()]
+
+
+def leer_manifiesto(dir_salida):
+    """Entradas del manifiesto de la carpeta de salida: {nombre del fichero (relativo a dir_salida): entrada}. {} si no hay o no es válido."""
+    ruta = os.path.join(dir_salida, ARCHIVO_MANIFIESTO)
+    if not os.path.isfile(ruta):
+        return {}
+    try:
+        with open(ruta, encoding = "utf-8") as archivo:
+            contenido = json.load(archivo)
+    except (OSError, ValueError):
+        return {}
+    if contenido.get('version') != VERSION_MANIFIESTO:
+        return {}
+    return contenido.get('archivos', {})
+
+
+def guardar_manifiesto(dir_salida, manifiesto):
+    """Guarda el manifiesto (también de forma atómica) e imprime cuántas de las salidas anotadas desde la última vez que se guardó han cambiado."""
+    ruta = os.path.join(dir_salida, ARCHIVO_MANIFIESTO)
+    guardado = leer_manifiesto(dir_salida)
+    comprobados = [entrada for nombre, entrada in manifiesto.items() if guardado.get(nombre) != entrada]
+    contenido = {'version': VERSION_MANIFIESTO, 'actualizado': datetime.now().isoformat(timespec = 'seconds'),
+                 'archivos': dict(sorted(manifiesto.items()))}
+
+    def escribir(temporal):
+        with open(temporal, "w", encoding = "utf-8") as archivo:
+            json.dump(contenido, archivo, indent = 2, ensure_ascii = False)
+    escribir_si_cambia(ruta, escribir)
+
+    cambiados = sum(entrada['cambiado'] for entrada in comprobados)
+    print(f"🗂️ Salidas: {cambiados} actualizadas, {len(comprobados) - cambiados} sin cambios | manifiesto: {ruta}")
+
+
+def registrar(manifiesto, dir_salida, ruta, huella = None, cambiado = None, df = None, filas = None, columnas = None):
+    """Añade (o actualiza) en el manifiesto la entrada de un fichero de salida ya escrito.
+
+    Args:
+        manifiesto (dict): entradas leídas con `leer_manifiesto`. Se modifica.
+        dir_salida (str): carpeta del manifiesto (los nombres de las entradas son relativos a ella).
+        ruta (str): fichero de salida.
+        huella (str, opcional): hash del contenido, si ya se conoce (ej. de `escribir_si_cambia`). None = se calcula.
+        cambiado (bool, opcional): si ha cambiado en esta ejecución. None = se compara con el hash de la entrada anterior.
+        df (pd.DataFrame, opcional): datos escritos, para el nº de filas y el esquema.
+        filas (int, opcional), columnas (list, opcional): nº de filas y esquema si no se indica `df`.
+    """
+    nombre = nombre_en_manifiesto(ruta, dir_salida)
+    anterior = manifiesto.get(nombre, {})
+    huella = huella or _huella_actual(ruta, anterior)
+    if cambiado is None:
+        cambiado = anterior.get('hash') != huella
+    if df is not None:
+        filas, columnas = len(df), esquema(df)
+
+    estado = os.stat(ruta)
+    manifiesto[nombre] = {'ruta': os.path.abspath(ruta),
+                          'hash': huella,
+                          'bytes': estado.st_size,
+                          'filas': filas,
+                          'columnas': columnas,
+                          'modificado': datetime.fromtimestamp(estado.st_mtime).isoformat(timespec = 'seconds'), #último cambio del contenido
+                          'comprobado': datetime.now().isoformat(timespec = 'seconds'),
+                          'cambiado': bool(cambiado),
+                          'mtime_ns': estado.st_mtime_ns}
+
+
+def nombre_en_manifiesto(ruta, dir_salida):
+    """Nombre de la entrada de un fichero en el manifiesto: su ruta relativa a la carpeta de salida (ej. 'merged.csv')."""
+    return os.path.relpath(os.path.abspath(ruta), os.path.abspath(dir_salida)).replace(os.sep, '/')
+
+
+def guardar_salida(ruta, escribir, manifiesto, dir_salida, df = None, filas = None, columnas = None):
+    """`escribir_si_cambia` + `registrar`: escribe un fichero de salida (atómico y sólo si cambia) y lo anota en el manifiesto.
+
+    Returns:
+        bool: True si el fichero ha cambiado.
+    """
+    huella, cambiado = escribir_si_cambia(ruta, escribir, manifiesto.get(nombre_en_manifiesto(ruta, dir_salida)))
+    registrar(manifiesto, dir_salida, ruta, huella, cambiado, df = df, filas = filas, columnas = columnas)
+    return cambiado
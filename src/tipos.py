@@ -0,0 +1,129 @@
+import pandas as pd
+
+
+# Política de tipos: una columna de texto pasa a 'category' si tiene pocos valores distintos respecto al número de filas
+MAX_RATIO_UNICOS = 0.5   # nº de valores distintos / nº de filas
+MAX_UNICOS = 10_000      # y, en cualquier caso, como mucho este nº de valores distintos
+
+
+def _es_texto(serie):
+    """True si la serie es de texto (object/str) o ya es categórica."""
+    return (isinstance(serie.dtype, pd.CategoricalDtype)
+            or pd.api.types.is_object_dtype(serie.dtype)
+            or pd.api.types.is_string_dtype(serie.dtype))
+
+
+def _es_poco_cardinal(serie, max_ratio_unicos = MAX_RATIO_UNICOS, max_unicos = MAX_UNICOS):
+    """True si la columna tiene pocos valores distintos (candidata a 'category')."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return True
+    n_unicos = serie.nunique(dropna = True)
+    return n_unicos <= max_unicos and n_unicos <= max_ratio_unicos * max(len(serie), 1)
+
+
+def convertir_a_categorias(df, max_ratio_unicos = MAX_RATIO_UNICOS, max_unicos = MAX_UNICOS, excluir = ()):
+    """Convierte a 'category' las columnas de texto con pocos valores distintos de un DataFrame (modificándolo).
+
+    Args:
+        df (pd.DataFrame): DataFrame a convertir.
+        max_ratio_unicos (float): máximo de valores distintos / filas para convertir la columna.
+        max_unicos (int): máximo absoluto de valores distintos para convertir la columna.
+        excluir (iterable): columnas que no se deben convertir (ej. IDs).
+
+    Returns:
+        pd.DataFrame: el mismo DataFrame.
+    """
+    for col in df.columns:
+        if col in excluir or not _es_texto(df[col]):
+            continue
+        if not isinstance(df[col].dtype, pd.CategoricalDtype) and _es_poco_cardinal(df[col], max_ratio_unicos, max_unicos):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def alinear_categorias(fuentes):
+    """Unifica las categorías de las columnas equivalentes de varias fuentes para que las uniones y comparaciones entre ellas sigan funcionando
+    (dos categóricas sólo son comparables directamente si tienen las mismas categorías).
+
+    Las columnas equivalentes se reconocen por el nombre sin el sufijo de la fuente que añade transformacion.rename_columns
+    (ej. 'Country_req', 'Country_ds' y 'Country_pe' --> 'Country').
+
+    Args:
+        fuentes (dict): {sufijo: DataFrame}, ej. {'req': bend_summary, 'ds': ds_summary, 'pe': pe_summary}. Se modifican.
+
+    Returns:
+        dict: el mismo diccionario de DataFrames.
+    """
+    grupos = {}
+    for sufijo, df in fuentes.items():
+        terminacion = '_' + sufijo
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                base = col[:-len(terminacion)] if col.endswith(terminacion) else col
+                grupos.setdefault(base, []).append((sufijo, col))
+
+    for base, columnas in grupos.items():
+        if len(columnas) < 2:
+            continue
+        categorias = pd.Index([])
+        for sufijo, col in columnas:
+            categorias = categorias.union(fuentes[sufijo][col].cat.categories, sort = False)
+        tipo = pd.CategoricalDtype(categorias)
+        for sufijo, col in columnas:
+            fuentes[sufijo][col] = fuentes[sufijo][col].astype(tipo)
+
+    return fuentes
+
+
+def aplicar_politica_dtypes(fuentes, max_ratio_unicos = MAX_RATIO_UNICOS, max_unicos = MAX_UNICOS, excluir = ()):
+    """Política de tipos del pipeline: columnas de texto con pocos valores distintos --> 'category', con las mismas categorías en las tres fuentes.
+
+    Args:
+        fuentes (dict): {sufijo: DataFrame}, ej. {'req': bend_summary, 'ds': ds_summary, 'pe': pe_summary}. Se modifican.
+        max_ratio_unicos (float): ver `convertir_a_categorias`.
+        max_unicos (int): ver `convertir_a_categorias`.
+        excluir (iterable): nombres de columna (con sufijo) que no se deben convertir.
+
+    Returns:
+        dict: el mismo diccionario de DataFrames.
+    """
+    for df in fuentes.values():
+        convertir_a_categorias(df, max_ratio_unicos, max_unicos, excluir)
+    return alinear_categorias(fuentes)
+
+
+def memoria_por_columna(df):
+    """Bytes que ocupa cada columna (incluido el contenido de los textos).
+
+    Returns:
+        pd.DataFrame: columnas 'dtype' y 'bytes', una fila por columna.
+    """
+    return pd.DataFrame({'dtype': df.dtypes.astype(str),
+                         'bytes': df.memory_usage(deep = True, index = False)})
+
+
+def reporte_memoria(etapa, despues, antes = None):
+    """Imprime el uso de memoria de una etapa del pipeline y devuelve el detalle por columna, comparando con otro estado si se indica.
+
+    Args:
+        etapa (str): nombre de la etapa (ej. 'carga B-End', 'merge').
+        despues (pd.DataFrame): DataFrame en el estado actual.
+        antes (pd.DataFrame, opcional): memoria_por_columna(df) del mismo DataFrame antes de la conversión.
+
+    Returns:
+        pd.DataFrame: reporte con una fila por columna: dtype/bytes antes (si se indica) y después.
+                      Los reportes de varias etapas se pueden unir con pd.concat y guardar en un CSV.
+    """
+    reporte = memoria_por_columna(despues).add_suffix('_despues')
+    if antes is not None:
+        reporte = antes.add_suffix('_antes').join(reporte, how = 'outer')
+    reporte.insert(0, 'etapa', etapa)
+
+    total = reporte['bytes_despues'].sum() / 1e6
+    if antes is not None:
+        total_antes = reporte['bytes_antes'].sum() / 1e6
+        print(f"🧠 Memoria [{etapa}]: {total_antes:.2f} MB ➡️ {total:.2f} MB (x{total_antes / max(total, 1e-9):.1f} menos)")
+    else:
+        print(f"🧠 Memoria [{etapa}]: {total:.2f} MB")
+
+    return reporte.rename_axis('columna')
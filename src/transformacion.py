@@ -1,11 +1,14 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import requests
 import os
-
-def cargar_y_procesar_excel_bend(ruta_archivo = "data\\bend.xlsm", hoja = "B-Ends"):
+from . import divisas as dv
+from . import cache_entradas as ce
+from . import salidas as sal
+from . import normalizacion as nm
+from . import instrumentacion as ins
+
+@ins.instrumentar
+def cargar_y_procesar_excel_bend(ruta_archivo = "data\\bend.xlsm", hoja = "B-Ends", dir_cache = None, motor = None):
     """Carga y procesa el archivo Excel B-End.
 
     Realiza limpieza de columnas, formatea strings y filtra las ofertas válidas.
@@ -13,22 +16,24 @@ def cargar_y_procesar_excel_bend(ruta_archivo = "data\\bend.xlsm", hoja = "B-End
     Args:
         ruta_archivo (str): Ruta al archivo Excel. Por defecto: "data\\bend.xlsm" #doble barra para saltar caracteres especiales.
         hoja (str): Nombre de la hoja del Excel a cargar. Por defecto: "B-Ends"
+        dir_cache (str or None): Carpeta donde guardar la hoja ya parseada para no volver a leer el Excel mientras no cambie (ej. "output/cache"). None = sin caché.
+        motor (str or None): Motor de lectura del Excel. 'auto' usa calamine (más rápido) si está instalado. None = openpyxl.
 
     Returns:
         pd.DataFrame: DataFrame procesado y listo para análisis.
     """
 
     #skiprows porque empieza en la fila 7
-    bend = pd.read_excel(ruta_archivo, sheet_name=hoja, skiprows = 6, header=1) 
+    bend = ce.leer_excel_cacheado(ruta_archivo, dir_cache = dir_cache, motor = motor, sheet_name=hoja, skiprows = 6, header=1)
 
     #Limpieza de columnas:
     bend.columns = bend.columns.str.strip() 
     bend.rename(columns = {'Unnamed: 0': 'quotation_ID'}, inplace = True)
     
-    #Formateo de columnas:
-    bend['Main Access Currency'] = bend['Main Access Currency'].str.lower().str.strip()
-    bend['City'] = bend['City'].str.title()
-    bend['Country'] = bend['Country'].str.replace('_', ' ')
+    #Formateo de columnas (sobre los valores distintos de cada columna, ver normalizacion.py):
+    nm.normalizar_columnas(bend, {'Main Access Currency': nm.PASOS_DIVISA,
+                                  'City': nm.PASOS_CIUDAD,
+                                  'Country': nm.PASOS_PAIS})
 
     #Columna nueva para identificar el origen
     bend['Source'] = 'Request B-End'
@@ -53,6 +58,8 @@ def commercial_model_provided(celda):
 
     Returns:
         string: nuevo valor que va a tomar la celda que podrá ser B4B, DIA o MPLS en función del servicio que se preste. 
+
+    Para columnas completas usar la versión vectorizada: clasificar_por_reglas(df, REGLAS_COMMERCIAL_MODEL_PROVIDED)
     """
     if celda == 'B4B Resale-Unmanaged':
         return "B4B"
@@ -62,7 +69,46 @@ def commercial_model_provided(celda):
         return "MPLS" #preguntar a Antonio si aquí podemos tener también el servicio de Ethernet.
     
 
-def completing_currency(df, columna_a_completar, columna_backup_1, columna_backup_2):
+def completar_por_prioridad(df, columnas, col_id = 'quotation_ID', max_ids = 10):
+    """
+    Combina (coalesce) varias columnas en orden de prioridad, trabajando por columnas completas (sin recorrer fila a fila):
+    cada fila toma el valor de la primera columna de la lista que no esté vacía.
+
+    Args:
+        df (pd.DataFrame): El DataFrame sobre el cual trabajar.
+        columnas (list): Nombres de las columnas en orden de prioridad (la primera es la columna principal).
+        col_id (str or None): Columna con el identificador que se muestra en el resumen (ej. 'quotation_ID'). None = índice del DataFrame.
+        max_ids (int): Número máximo de IDs de ejemplo que se guardan en el resumen.
+
+    Returns:
+        tuple: (resultado, resumen)
+            - resultado (pd.Series): Serie con los valores completados.
+            - resumen (dict): Resumen compacto con:
+                + 'faltantes': nº de filas en las que la columna principal estaba vacía.
+                + 'por_fuente': nº de filas completadas con cada columna de respaldo (y 'sin dato' si ninguna tenía valor).
+                + 'muestra_ids': como mucho `max_ids` IDs de filas con la columna principal vacía.
+    """
+    principal = df[columnas[0]]
+    resultado = principal.copy()
+    faltante = principal.isna().to_numpy()
+
+    por_fuente = {}
+    for col in columnas[1:]:
+        rellenar = resultado.isna().to_numpy() & df[col].notna().to_numpy()
+        por_fuente[col] = int(rellenar.sum())
+        resultado = resultado.where(~rellenar, df[col])
+    por_fuente['sin dato'] = int(resultado.isna().sum())
+
+    ids = df[col_id] if col_id is not None else df.index.to_series()
+    resumen = {'faltantes': int(faltante.sum()),
+               'por_fuente': por_fuente,
+               'muestra_ids': ids[faltante].head(max_ids).tolist()}
+
+    return resultado, resumen
+
+
+@ins.instrumentar
+def completing_currency(df, columna_a_completar, columna_backup_1, columna_backup_2, max_ids = 10, devolver_resumen = False):
     """
     Completa valores faltantes (NaN) en una columna "objetivo" usando dos columnas de respaldo, en orden de prioridad. La prioridad es:
         1. Usar la columna principal si tiene valor.
@@ -74,47 +120,39 @@ def completing_currency(df, columna_a_completar, columna_backup_1, columna_backu
         columna_a_completar (str): Nombre de la columna principal que queremos completar.
         columna_backup_1 (str): Primera columna de respaldo (prioridad 1).
         columna_backup_2 (str): Segunda columna de respaldo (prioridad 2, si la prioridad 1 está vacía).
+        max_ids (int): Número máximo de quotation IDs con dato faltante que se imprimen como ejemplo.
+        devolver_resumen (bool): Si True, devuelve también el resumen (ver `completar_por_prioridad`).
 
     Returns:
-        pd.Series: Una serie con los valores completados.
+        pd.Series: Una serie con los valores completados (o la tupla (serie, resumen) si devolver_resumen=True).
     """
-    id_dato_faltante = [] 
+    result, resumen = completar_por_prioridad(df, [columna_a_completar, columna_backup_1, columna_backup_2],
+                                              col_id = 'quotation_ID', max_ids = max_ids)
 
-    def completar(row):
-        
-        if pd.isna(row[columna_a_completar]):
-
-            id_dato_faltante.append(row['quotation_ID'])
-
-            if pd.notna(row[columna_backup_1]):
-                return row[columna_backup_1]
-            
-            elif pd.notna(row[columna_backup_2]):
-                return row[columna_backup_2]
-            
-        return row[columna_a_completar]
-    
-    #Aplicamos la función:
-    result =  df.apply(completar, axis=1)
-
-    # Imprimo los ID conflictivos:
-    print(f"🔍❌Ids con dato faltante: '{len(id_dato_faltante)}' \n {id_dato_faltante}")
+    # Imprimo un resumen de los ID conflictivos (recuento por columna de respaldo y una muestra de IDs):
+    detalle = ", ".join(f"'{col}': {n}" for col, n in resumen['por_fuente'].items())
+    print(f"🔍❌Ids con dato faltante: '{resumen['faltantes']}' ({detalle}) \n muestra: {resumen['muestra_ids']}")
 
+    if devolver_resumen:
+        return result, resumen
     return result
 
 
 
-def cargar_y_procesar_ds(ruta_archivo="ds.xlsx"):
+@ins.instrumentar
+def cargar_y_procesar_ds(ruta_archivo="ds.xlsx", dir_cache = None, motor = None):
     """Carga y procesa el archivo Deal Specialist.
 
     Args:
         ruta_archivo (str): Ruta al archivo Excel. Por defecto: "ds.xlsm"
+        dir_cache (str or None): Carpeta donde guardar la hoja ya parseada para no volver a leer el Excel mientras no cambie (ej. "output/cache"). None = sin caché.
+        motor (str or None): Motor de lectura del Excel. 'auto' usa calamine (más rápido) si está instalado. None = openpyxl.
 
     Returns:
         pd.DataFrame: DataFrame procesado y listo para análisis.
     """
 
-    ds = pd.read_excel(ruta_archivo, index_col=0)
+    ds = ce.leer_excel_cacheado(ruta_archivo, dir_cache = dir_cache, motor = motor, index_col=0)
 
     #Limpieza de columnas:
     ds.columns = ds.columns.str.strip() 
@@ -128,22 +166,20 @@ def cargar_y_procesar_ds(ruta_archivo="ds.xlsx"):
         columna_backup_1 = 'Back Up Maintenance Currency',
         columna_backup_2 = 'Main Maintenance Currency')
     
-    #Formateo de columnas:
-    ds['Main Access Currency'] = ds['Main Access Currency'].str.lower().str.strip()
-    ds['City'] = ds['City'].str.title()
-    ds['Country'] = ds['Country'].str.title().str.replace('_', ' ').str.replace('Brasil', 'Brazil')
+    #Formateo de columnas y normalización de los proveedores conocidos (sobre los valores distintos de cada columna, ver normalizacion.py):
+    nm.normalizar_columnas(ds, {'Main Access Currency': nm.PASOS_DIVISA,
+                                'City': nm.PASOS_CIUDAD,
+                                'Country': nm.PASOS_PAIS_DS,
+                                'Main Access Provider (last mile Provider)': nm.PASOS_PROVEEDOR})
 
     #Columna nueva para identificar el origen
     ds['Source'] = 'Deal Specialist'
 
-    # Normalizamos los proveedores conocidos:
-    ds['Main Access Provider (last mile Provider)']= ds['Main Access Provider (last mile Provider)'].str.replace('Telefonica_Chile_S.A._(Mayorista)', 'Telefonica Chile S.A.').str.replace('INTELIGLOBE', 'Inteliglobe').str.replace("_", " ")
-
     #Creamos la columna Full contract Value:
     ds['FCV'] = ds['Main Access NRC'] + (ds['Contract Term (month)']* ds['Main Access MRC'])
 
     # Extraemos commercial Model
-    ds['Commercial_Model']= ds['Comments VPN Site Info\n/Commercial Model'].str.split(' ', expand = True).get(0)
+    ds['Commercial_Model']= nm.normalizar_columna(ds['Comments VPN Site Info\n/Commercial Model'], nm.PASOS_COMMERCIAL_MODEL)
 
     # Ordenar por 'Option ID' y resetear índice
     ds.sort_values(by='Option ID', ascending=True, inplace=True)  
@@ -155,41 +191,125 @@ def cargar_y_procesar_ds(ruta_archivo="ds.xlsx"):
     return ds
 
 
-def cargar_y_procesar_pe (ruta_archivo = "pe.csv"):
-    """Carga y procesa el archivo csv generado por el Pricing Engine
+# Columnas del CSV del Pricing Engine que usa el ETL (las que acaban en pe_summary en main.py y las necesarias para calcularlas)
+COLUMNAS_PE = ['unique_id', 'option_id', 'vpn_site_comments_des',
+               'standard_services_cd', 'site_id', 'lot_cd', 'city_name', 'country_name',
+               'main_access_speed_upstream_kbps_qt', 'main_access_speed_downstream_kbps_qt',
+               'main_access_technology_name', 'main_access_guaranteed_bandwidth_qt', 'contract_term_cd',
+               'main_access_provider_name', 'main_access_currency_cd',
+               'main_access_nrc_amt_quoted_by', 'main_access_nrc_amt',
+               'main_access_mrc_amt_quoted_by', 'main_access_mrc_amt']
+
+# Tipos explícitos para el CSV del Pricing Engine: categorías para columnas con pocos valores distintos y float64 para los importes
+DTYPES_PE = {'standard_services_cd': 'category',
+             'lot_cd': 'category',
+             'city_name': 'category',
+             'country_name': 'category',
+             'main_access_technology_name': 'category',
+             'main_access_provider_name': 'category',
+             'main_access_currency_cd': 'category',
+             'main_access_nrc_amt_quoted_by': 'category',
+             'main_access_mrc_amt_quoted_by': 'category',
+             'main_access_nrc_amt': 'float64',
+             'main_access_mrc_amt': 'float64'}
+
+
+def _limpiar_pe(pe):
+    """Limpieza que no depende del resto del fichero (se puede aplicar a cada bloque por separado en la lectura por bloques).
 
     Args:
-        ruta_archivo (str): Ruta al archivo CSV. Por defecto: "pe.csv"
+        pe (pd.DataFrame): datos (o bloque de datos) del Pricing Engine con los nombres de columna ya limpios.
 
     Returns:
-        pd.DataFrame: DataFrame procesado y listo para análisis.
+        pd.DataFrame: el mismo DataFrame con las columnas formateadas y las columnas nuevas.
     """
-
-    pe = pd.read_csv(ruta_archivo, sep=';')
-
-    #Limpieza de columnas:
-    pe.columns = pe.columns.str.strip() 
-
     #Generamos el ID único a partir de otras celdas:
-    pe['quotation_ID'] = pe['unique_id'].str.split(' ', expand = True).get(2).str.split('_', expand = True).get(0)
+    pe['quotation_ID'] = nm.normalizar_columna(pe['unique_id'], nm.PASOS_QUOTATION_ID_PE, como_categoria = False)
     
     
-    #Formateo de columnas:
-    pe['main_access_currency_cd'] = pe['main_access_currency_cd'].str.lower().str.strip()
-    pe['country_name'] = pe['country_name'].str.replace('_', ' ')
+    #Formateo de columnas y normalización de los proveedores conocidos (sobre los valores distintos de cada columna, ver normalizacion.py):
+    nm.normalizar_columnas(pe, {'main_access_currency_cd': nm.PASOS_DIVISA,
+                                'country_name': nm.PASOS_PAIS,
+                                'main_access_provider_name': nm.PASOS_PROVEEDOR})
     pe['Source'] = 'Pricing Engine' #creamos una columna
-    
-    # Normalizamos los proveedores conocidos:
-    pe['main_access_provider_name'] = pe['main_access_provider_name'].str.replace('Telefonica_Empresas_Chile_S.A.','Telefonica Chile S.A.').str.replace('Inteliglobe_Communications_USA', 'Inteliglobe').str.replace("_", " ")
 
     #Creamos la columna Full contract Value
     pe['FCV'] = pe['main_access_nrc_amt'] + (pe['contract_term_cd']* pe['main_access_mrc_amt'])
 
     # Extraemos commercial Model
-    pe['Commercial_Model'] = pe['vpn_site_comments_des'].str.split(' ', expand = True).get(0)
+    pe['Commercial_Model'] = nm.normalizar_columna(pe['vpn_site_comments_des'], nm.PASOS_COMMERCIAL_MODEL)
+
+    return pe
+
+
+def opciones_csv_pe(ruta_archivo, columnas = None, dtypes = None, motor = None):
+    """Opciones de pd.read_csv para el CSV del Pricing Engine: separador, columnas a leer y tipos, con los nombres tal y como vienen
+    en la cabecera (pueden traer espacios).
+
+    Returns:
+        dict: argumentos para pd.read_csv.
+    """
+    #Los nombres de columna del CSV pueden venir con espacios: leemos sólo la cabecera para traducir los nombres limpios a los originales
+    originales = pd.read_csv(ruta_archivo, sep=';', nrows=0).columns
+    nombre_original = {col.strip(): col for col in originales}
+
+    opciones = {'sep': ';', 'engine': motor}
+    if columnas is not None:
+        faltan = [col for col in columnas if col not in nombre_original]
+        if faltan:
+            raise KeyError(f"Columnas que no existen en {ruta_archivo}: {faltan}")
+        opciones['usecols'] = [nombre_original[col] for col in columnas]
+    if dtypes is not None:
+        opciones['dtype'] = {nombre_original[col]: tipo for col, tipo in dtypes.items() if col in nombre_original}
+    return opciones
+
+
+def unir_bloques_pe(partes, dtypes = None):
+    """Une los bloques ya limpios del Pricing Engine manteniendo como categóricas las columnas que lo eran en los bloques o en `dtypes`."""
+    pe = pd.concat(partes, ignore_index = True) if len(partes) > 1 else partes[0]
+
+    #Las columnas categóricas se vuelven a convertir tras la unión de bloques (si las categorías de cada bloque no coinciden, pandas las deja como texto)
+    categoricas = {col for col in partes[0].columns if isinstance(partes[0][col].dtype, pd.CategoricalDtype)}
+    if dtypes is not None:
+        categoricas |= {col for col, tipo in dtypes.items() if str(tipo) == 'category' and col in pe.columns}
+    for col in categoricas:
+        if not isinstance(pe[col].dtype, pd.CategoricalDtype):
+            pe[col] = pe[col].astype('category')
+    return pe
 
-    #Ordenar por 'Option ID' y resetear índice
-    pe.sort_values(by='option_id', ascending=True, inplace=True) 
+
+@ins.instrumentar
+def cargar_y_procesar_pe (ruta_archivo = "pe.csv", columnas = None, dtypes = None, chunksize = None, motor = None):
+    """Carga y procesa el archivo csv generado por el Pricing Engine
+
+    Args:
+        ruta_archivo (str): Ruta al archivo CSV. Por defecto: "pe.csv"
+        columnas (list or None): Columnas a leer del CSV (ej. COLUMNAS_PE). El resto ni se parsean. None = todas.
+        dtypes (dict or None): Tipos de las columnas (ej. DTYPES_PE). Las columnas 'category' siguen siendo categóricas en el resultado. None = tipos inferidos por pandas.
+        chunksize (int or None): Si se indica, el CSV se lee y limpia por bloques de `chunksize` filas (memoria acotada durante la lectura).
+        motor (str or None): Motor de lectura de pd.read_csv. 'pyarrow' (multihilo, mucho más rápido) no admite lectura por bloques. None = motor C de pandas.
+
+    Returns:
+        pd.DataFrame: DataFrame procesado y listo para análisis.
+    """
+    if motor == 'pyarrow' and chunksize is not None:
+        raise ValueError("El motor 'pyarrow' no admite lectura por bloques: usa chunksize=None o motor=None")
+
+    opciones = opciones_csv_pe(ruta_archivo, columnas, dtypes, motor)
+    if chunksize is None:
+        bloques = [pd.read_csv(ruta_archivo, **opciones)]
+    else:
+        bloques = pd.read_csv(ruta_archivo, chunksize = chunksize, **opciones)
+
+    partes = []
+    for bloque in bloques:
+        #Limpieza de columnas:
+        bloque.columns = bloque.columns.str.strip() 
+        partes.append(_limpiar_pe(bloque))
+    pe = unir_bloques_pe(partes, dtypes)
+
+    #Ordenar por 'Option ID' y resetear índice (orden estable: las filas con el mismo option_id mantienen el orden del fichero)
+    pe.sort_values(by='option_id', ascending=True, inplace=True, kind='stable')
 
     #Cremos una nueva columna de índice 'id' y renombramos columnas
     pe = pe.reset_index(drop=True) 
@@ -260,10 +380,182 @@ name_to_iso = {
 
 
 
+def _mapear_valores_unicos(serie, funcion):
+    """Aplica `funcion` sólo a los valores distintos de la serie y reparte el resultado a todas las filas (en lugar de un .apply fila a fila).
+
+    Args:
+        serie (pd.Series): columna de entrada (admite NaN).
+        funcion (callable): función que recibe un valor y devuelve el valor transformado.
+
+    Returns:
+        pd.Series: serie con el mismo índice que la de entrada y los valores transformados.
+    """
+    codigos, unicos = pd.factorize(serie) #los NaN reciben el código -1
+    valores = np.array([funcion(valor) for valor in unicos] + [funcion(np.nan)], dtype=object) #la última posición es la del NaN (código -1)
+    return pd.Series(valores[codigos], index=serie.index)
+
+
+def _tasas_por_fila(origen, destino, tasas):
+    """Reparte a cada fila el tipo de cambio de su par (origen, destino) a partir de la tabla de pares ya resueltos.
+
+    Args:
+        origen (pd.Series): códigos ISO de la divisa origen de cada fila.
+        destino (pd.Series): códigos ISO de la divisa destino de cada fila.
+        tasas (dict): {(origen, destino): tasa} con un elemento por par distinto. La tasa puede ser None si la API no respondió.
+
+    Returns:
+        np.ndarray: tipo de cambio por fila (float). NaN si falta alguna de las dos divisas o no hay tasa para el par.
+    """
+    resultado = np.full(len(origen), np.nan)
+    if not tasas:
+        return resultado
+
+    indice_pares = pd.MultiIndex.from_tuples(list(tasas.keys()))
+    valores = np.array([np.nan if tasa is None else tasa for tasa in tasas.values()], dtype=float)
+
+    posiciones = indice_pares.get_indexer(pd.MultiIndex.from_arrays([origen.to_numpy(dtype=object), destino.to_numpy(dtype=object)]))
+    encontrados = posiciones >= 0
+    resultado[encontrados] = valores[posiciones[encontrados]]
+    return resultado
+
+
+def _tasas_por_fila_y_fecha(origen, destino, fechas, tabla, base = "USD"):
+    """Tipo de cambio de cada fila en su fecha, a partir de una tabla histórica (ver divisas.tabla_tasas_historicas), con un único
+    cruce as-of vectorizado (pd.merge_asof): cada fila toma la última tasa publicada en su fecha o antes (fines de semana y festivos
+    toman la del último día con datos). El tipo de cambio origen --> destino es tasa(destino) / tasa(origen), ambas frente a `base`.
+
+    El cruce se hace sólo con las combinaciones (divisa, día) distintas (unos pocos miles aunque haya millones de filas)
+    y el resultado se reparte a cada fila con NumPy, como en `_tasas_por_fila`.
+
+    Args:
+        origen, destino (pd.Series): códigos ISO de la divisa origen y destino de cada fila.
+        fechas (pd.Series): fecha de cada fila (datetime64).
+        tabla (pd.DataFrame): columnas fecha, divisa, tasa (unidades de `divisa` por 1 unidad de `base`), ordenada por fecha.
+
+    Returns:
+        np.ndarray: tipo de cambio por fila (float). 1 si las dos divisas son la misma; NaN si falta la divisa, la fecha
+                    o no hay tasa de alguna de las divisas en esa fecha o antes.
+    """
+    n = len(origen)
+    resultado = np.full(n, np.nan)
+    dias = pd.to_datetime(pd.Series(np.asarray(fechas))).to_numpy().astype('datetime64[D]')
+    codigos, divisas = pd.factorize(np.concatenate([np.asarray(origen, dtype=object), np.asarray(destino, dtype=object)]))
+    codigo_origen, codigo_destino = codigos[:n], codigos[n:]
+    validas = (codigo_origen >= 0) & (codigo_destino >= 0) & ~np.isnat(dias)
+    if not validas.any():
+        return resultado
+
+    #Clave entera de cada (día, divisa): ordenar las claves = ordenar por fecha, como necesita merge_asof
+    n_divisas = len(divisas)
+    dias = dias[validas].astype(np.int64)
+    posiciones, claves = pd.factorize(np.concatenate([dias * n_divisas + codigo_origen[validas], dias * n_divisas + codigo_destino[validas]]),
+                                      sort = True)
+    consulta = pd.DataFrame({'fecha': (claves // n_divisas).astype('datetime64[D]').astype('datetime64[ns]'),
+                             'divisa': np.asarray(divisas, dtype=object)[claves % n_divisas].astype(str)})
+    tabla = tabla[['fecha', 'divisa', 'tasa']].astype({'fecha': 'datetime64[ns]', 'divisa': str})
+    cruce = pd.merge_asof(consulta, tabla, on='fecha', by='divisa', direction='backward')
+    tasa_base = np.where(consulta['divisa'].to_numpy() == base, 1.0, cruce['tasa'].to_numpy(dtype=float))
+
+    m = int(validas.sum())
+    tasas = tasa_base[posiciones[m:]] / tasa_base[posiciones[:m]]
+    tasas[codigo_origen[validas] == codigo_destino[validas]] = 1 #misma divisa: no hace falta la tabla
+    resultado[validas] = tasas
+    return resultado
+
+
+def _convertir_columna(valores, tasas):
+    """Convierte una columna de importes con el tipo de cambio de cada fila.
+
+    Args:
+        valores (pd.Series): importes en la divisa origen.
+        tasas (np.ndarray or pd.Series): tipo de cambio de cada fila.
+
+    Returns:
+        np.ndarray: importe convertido. Queda NaN si la tasa no existe o es 0 (igual que la conversión fila a fila original).
+    """
+    valores = pd.to_numeric(valores, errors='coerce').to_numpy(dtype=float)
+    tasas = np.asarray(tasas, dtype=float)
+    return np.where((tasas != 0) & ~np.isnan(tasas), valores * tasas, np.nan)
+
+
+def nombre_a_iso(nombre_divisa, diccionario):
+    """Convierte un nombre de divisa en texto (por ejemplo, 'euro', 'dollar') a su correspondiente código ISO de tres letras 
+    (por ejemplo, 'EUR', 'USD'), utilizando un diccionario de mapeo previamente definido. Funcionamiento:
+        1. Convierte el nombre a minúsculas.
+        2. Elimina espacios en blanco al inicio y final.
+        3. Busca el valor en el diccionario `diccionario`.
+        4. Devuelve el código ISO si lo encuentra, o None si no existe.
+
+    Args:
+        nombre_divisa (str): nombre de la divisa (no estándarizado). Ejemplos: "Euro", " dollar ", "CANADIAN DOLLAR"
+        diccionario (dict): equivalencias 'nombre de divisa' → 'código ISO' (ej. name_to_iso).
+
+    Returns:
+        str or None: Código ISO. Devuelve None si la divisa no está en el diccionario.
+    """
+    return diccionario.get(str(nombre_divisa).strip().lower(), None)
+
+
+def columna_iso(serie, diccionario):
+    """Traduce una columna de nombres de divisa a código ISO, evaluando `nombre_a_iso` sólo una vez por nombre distinto.
+
+    Returns:
+        pd.Categorical: códigos ISO, con todas las divisas del diccionario como categorías (las tres fuentes comparten categorías).
+    """
+    categorias_iso = sorted(set(diccionario.values()))
+    return pd.Categorical(_mapear_valores_unicos(serie, lambda nombre: nombre_a_iso(nombre, diccionario)), categories=categorias_iso)
+
+
+def _pares_distintos(iso_req, iso_ds, iso_pe):
+    """Pares (divisa origen, divisa destino) distintos que hay que convertir: DS --> B-End y PE --> B-End, sin vacíos."""
+    pares = pd.concat([
+        pd.DataFrame({'origen': np.asarray(iso_ds, dtype=object), 'destino': np.asarray(iso_req, dtype=object)}),
+        pd.DataFrame({'origen': np.asarray(iso_pe, dtype=object), 'destino': np.asarray(iso_req, dtype=object)}),
+    ]).dropna().drop_duplicates()
+    return list(pares.itertuples(index=False, name=None))
+
+
+def pares_divisas(df, col_currency_req, col_currency_ds, col_currency_pe, diccionario):
+    """Pares (origen, destino) en código ISO que necesitará `fcv_currency_or_multicurrency` para este DataFrame, sin llamar a la API.
+    Sirve para descargar de una vez los tipos de cambio de varios DataFrames (ej. varios lotes, ver lotes.py).
+
+    Returns:
+        list: pares (origen, destino) distintos.
+    """
+    return _pares_distintos(columna_iso(df[col_currency_req], diccionario),
+                            columna_iso(df[col_currency_ds], diccionario),
+                            columna_iso(df[col_currency_pe], diccionario))
+
+
+# Etiquetas de las columnas same_currency_as_B-End_* (mismas categorías para DS y PE)
+ETIQUETAS_CAMBIO_DIVISA = ["no currency available", "same currency as B-end", "different currency as B-end"]
+
+
+def identificar_cambio_divisa(exchange_rate):
+    """Identifica (columna completa) si la divisa utilizada por el Deal Specialist y por el Pricing Engine es la misma que la requerida en el Request B-End.
+
+    Args:
+        exchange_rate (pd.Series or np.ndarray): Tipo de cambio aplicado entre las dos monedas en cada fila.
+
+    Returns:
+        pd.Categorical: con las categorías de ETIQUETAS_CAMBIO_DIVISA. Tenemos 3 posibilidades:
+            (1) "no currency available" --> Si el tipo de cambio es NaN (no disponible)
+            (2) "same currency as B-end" --> Las divisas son iguales (porque el tipo de cambio = 1).
+            (3) "different currency as B-end" --> Las divisas son diferentes, porque el tipo de cambio es distinto de 1.
+    """
+    exchange_rate = np.asarray(exchange_rate, dtype=float)
+    codigos = np.select([np.isnan(exchange_rate), exchange_rate == 1], [0, 1], default=2)
+    return pd.Categorical.from_codes(codigos, categories=ETIQUETAS_CAMBIO_DIVISA)
+
+
+
+@ins.instrumentar
 def fcv_currency_or_multicurrency(df, col_currency_req,
                                       col_currency_ds, col_val_ds,
                                       col_currency_pe, col_val_pe,
-                                      diccionario):
+                                      diccionario, ruta_cache = None, ttl_horas = 24,
+                                      max_entradas_cache = 10000, offline = False, triangular = True,
+                                      col_fecha = None, fecha_tasas = None, ruta_tabla_tasas = None):
     """
     Analiza el Full Contract Value de cada quotation en distintas divisas, realizando conversiones a la moneda de referencia (moneda del Request B-End),
     y calcula diferencias porcentuales entre el FCV calculado por el Deal Specialist y el FCV del Pricing Engine. 
@@ -279,9 +571,22 @@ def fcv_currency_or_multicurrency(df, col_currency_req,
         - col_currency_pe (str): Columna de divisa del Pricing Engine.
         - col_val_pe (str): Columna con el PCV del PE.
         - diccionario (dict): Diccionario con las equivalencias 'nombre de divisa' → 'código ISO' (ej. "euro" → "EUR").
+        - ruta_cache (str or None): Fichero SQLite donde se guardan los tipos de cambio entre ejecuciones (ej. "output/cache_divisas.sqlite").
+                                    Si es None, la caché sólo dura lo que dura la llamada.
+        - ttl_horas (float or None): Horas que un tipo de cambio de la caché se considera vigente. None = nunca caduca.
+        - max_entradas_cache (int or None): Tamaño máximo de la caché persistente (se eliminan primero las entradas más antiguas).
+        - offline (bool): Si True, no se llama a la API: sólo se usan los tipos de cambio de la caché y se informa de los pares que faltan.
+        - triangular (bool): Si True, todos los pares se calculan a partir de una única tabla de tipos de cambio (una llamada a la API en lugar de una por par).
+        - col_fecha (str or None): Columna con la fecha de cada quotation. Si se indica, cada fila se convierte con el tipo de cambio histórico de su fecha
+                                   (ver divisas.tabla_tasas_historicas) en lugar de con el del día. Las filas sin fecha quedan sin tipo de cambio.
+        - fecha_tasas (str or None): Fecha (YYYY-MM-DD) cuyo tipo de cambio histórico se aplica a todas las filas (si no se indica `col_fecha`).
+                                     Sirve para repetir un análisis pasado con los mismos tipos de cambio.
+        - ruta_tabla_tasas (str or None): Tabla histórica local (.csv o .parquet) con las tasas de cada divisa y fecha. Si es None, el histórico
+                                          se descarga de la API (una vez por rango de fechas) y se guarda en `ruta_cache`.
 
     Returns:
         - pd.DataFrame: DataFrame con valores convertidos, tasas de cambio y delta %.
+                        En `df.attrs['pares_sin_tasa']` quedan los pares (origen, destino) sin tipo de cambio.
     """
 
     # PASO 1: Verificar si las divisas existen en el diccionario
@@ -301,140 +606,78 @@ def fcv_currency_or_multicurrency(df, col_currency_req,
             print(f"❌'{clave}' → ❗ FALTA en el diccionario de divisas")
 
 
-    # PASO 2: Configurar caché para no repetir llamadas a la API
-    cache_tipo_cambio = {}
-
-    def name_to_iso(nombre_divisa):
-        """Convierte un nombre de divisa en texto (por ejemplo, 'euro', 'dollar') a su correspondiente código ISO de tres letras 
-        (por ejemplo, 'EUR', 'USD'), utilizando un diccionario de mapeo previamente definido. Funcionamiento:
-            1. Convierte el nombre a minúsculas.
-            2. Elimina espacios en blanco al inicio y final.
-            3. Busca el valor en el diccionario `diccionario`.
-            4. Devuelve el código ISO si lo encuentra, o None si no existe.
-
-        Args:
-            nombre_divisa (str): nombre de la divisa (no estándarizado). Ejemplos: "Euro", " dollar ", "CANADIAN DOLLAR"
-
-        Returns:
-            str or None: Código ISO. Devuelve None si la divisa no está en el diccionario.
-        """
-        return diccionario.get(str(nombre_divisa).strip().lower(), None)
+    # PASO 2: Traducción de nombres de divisa a código ISO (ver `nombre_a_iso` y `columna_iso`)
 
-    def obtener_tasa_cambio(origen, destino):
-        """Dado un par de monedas (ej.: "USD" a "EUR") esta función:
-            (1) Consulta la API FXRatesAPI para saber el tipo de cambio actual.
-            (2) Guarda los resultados en memoria temporal (cache_tipo_cambio) para no repetir la llamada en caso de que se repita el par de currencies para los que necesitamos conversión.
-            (3) Devuelve el exchange rate para que luego se use en la conversión de "presupuestos".
-
-        Args:
-            origen (str): código de divisa origen (ej.: "USD")
-            destino (str): código de divisa destino (ej.: "EUR")
-
-        Returns:
-            float: tipo de cambio obtenido de la API. Lo aplicamos con un ejemplo:
-                    Ej. obtener_tasa_cambio("USD", "EUR")  output--> 0.8672701405
-        """
-
-        #CASO 1: no se necesita conversión
-        if origen == destino:
-            return 1
-        
-        #CASO 2: se necesita conversión y tenemos almacenado en el caché el tipo de cambio
-        par = (origen, destino) #Guardamos el par de divisas como una tupla (ej.: ("USD", "EUR")).
-        if par in cache_tipo_cambio: #Verificamos si ya tenemos esa conversión guardada (cache)
-            return cache_tipo_cambio[par]  #Si ya lo hemos consultado antes, devolvemos el exchange rate desde el diccionario cache_tipo_cambio. Esto ahorra muchas llamadas a la API.
-        
-        #CASO 3: Llamamos a la API si no encuentra el tipo de cambio en el cache
-        url = f"https://api.fxratesapi.com/convert?from={origen}&to={destino}&format=json"
-        
-        try:
-            r = requests.get(url, timeout=10) ##Esperamos un máximo de 10 segundos evitando que el script se quede colgado indefinidamente si el servidor no responde.
-            if r.status_code == 200:
-
-                data = r.json() #convertimos la respuesta exitosa a un dict de Python (JSON)
-                tasa = data.get("info", {}).get("rate", None) #Extraemos del JSON el valor del tipo de cambio (que está en "info": {....., "rate": 0.923421},) Si no existe, nos da None.
-                cache_tipo_cambio[par] = tasa #Guardamos la tasa en el cache para futuros usos
-                
-                return tasa
-        
-        #CASO 4: Si hay algún error (red, timeout, etc.), lo imprime y devuelve None.
-        except Exception as e:
-            print(f"Error al obtener tipo de cambio {origen} --> {destino}: {e}")
-        
-        return None
-
-
-    def convertir(valor, origen, destino):
-        """convertimos un valor monetario de una divisa a otra, usando una tasa de cambio obtenida previamente de la API (y cacheada para eficiencia).
-
-        Args:
-            valor (float): importe que se quiere convertir (ej. 100)
-            origen (str): Código ISO de la moneda del valor original (ej. "USD")
-            destino (str): ódigo ISO de la moneda a la que se quiere convertir (ej. "EUR")
-
-        Returns:
-            tuple: Devuelve una tupla con (el valor convertido , la tasa de cambio utilizada). 
-                    Ej. convertir(100, 'USD', 'EUR') 
-                    Supongamos que obtener_tasa_cambio (PASO ANTERIOR) devuelve 0.92 --> resultado convertir(100, 'USD', 'EUR') --> (92.0, 0.92)
-        """
-        #CASO 1: si alguno de los tres parámetros es None, no se podrá hacer la conversión
-        if valor is None or origen is None or destino is None:
-            return None, None
-        
-        #CASO 2: cuando sí podemos obteber la conversión:
-        tasa = obtener_tasa_cambio(origen, destino)
-        valor_convertido = valor * tasa if tasa else None #Si la tasa es válida (no None), se multiplica por el valor original. Si no hay tasa, el resultado es None.
-        return valor_convertido, tasa #Devuelve una tupla: el valor convertido y la tasa de cambio utilizada
-
-
-    def identificar_cambio_divisa(exchange_rate):
-        """Creamos una nueva columna identificando si la divisa utilizada por el Deal Specialist y por el Pricing Engine es la misma que la requerida en el Request B-End.
-
-        Args:
-            exchange_rate (float or None): Tipo de cambio aplicado entre las dos monedas
-
-        Returns:
-            str: Tenemos 3 posibilidades:
-                (1) "no currency available" --> Si el tipo de cambio es NaN (no disponible)
-                (2) "same currency as B-end" --> Las divisas son iguales (porque el tipo de cambio = 1).
-                (3) "different currency as B-end" --> Las divisas son diferentes, porque el tipo de cambio es distinto de 1.
-        """
-        if pd.isna(exchange_rate):
-            return "no currency available"
-        elif exchange_rate == 1:
-            return "same currency as B-end"
-        else:
-            return "different currency as B-end"
-
-
-
-    # PASO 3: Aplicar lógica de conversión
+    # PASO 3: Aplicar lógica de conversión (vectorizada: trabajamos con columnas completas en lugar de fila a fila)
     df = df.copy()
 
-    #1) llamamos a la función name_to_iso para convertir la divisa a Código ISO para poder hacer la llamada a la API
-    df['currency_ISO_req'] = df[col_currency_req].apply(name_to_iso)
-    df['currency_ISO_ds'] = df[col_currency_ds].apply(name_to_iso)
-    df['currency_ISO_pe'] = df[col_currency_pe].apply(name_to_iso)
-
-    # llamamos a la función convertir(FCV, divisa_origen, divisa_destino) para convertir los FCV del DS y PE en la divisa de referencia (=la del Request B-End). Aquí estamos haciendo llamamiento a la API
-    #2) Guardamos el FCV en la divisa de referencia:
-    df['FCV_ds_conv'] = df.apply(lambda row: convertir(row[col_val_ds], row['currency_ISO_ds'], row['currency_ISO_req'])[0], axis=1)
-    df['FCV_pe_conv'] = df.apply(lambda row: convertir(row[col_val_pe], row['currency_ISO_pe'], row['currency_ISO_req'])[0], axis=1)
-
-    #3) Guardamos el tipo de cambio aplicado por si necesitamos recurrir a él:
-    df['FCV_ds_exchange_rate'] = df.apply(lambda row: convertir(row[col_val_ds], row['currency_ISO_ds'], row['currency_ISO_req'])[1], axis=1)
-    df['FCV_pe_exchange_rate'] = df.apply(lambda row: convertir(row[col_val_pe], row['currency_ISO_pe'], row['currency_ISO_req'])[1], axis=1)
-
-    #4) Cálculo de delta:(Valor actual - Valor de referencia) / Valor de referencia * 100 o bien Valor actual / Valor de referencia - 1.
+    #1) convertimos la divisa a Código ISO para poder hacer la llamada a la API.
+    #   Sólo se evalúa una vez por cada nombre de divisa distinto y el resultado se mapea de vuelta a todas las filas.
+    #   Las tres columnas son categóricas con las mismas categorías (los códigos ISO del diccionario).
+    df['currency_ISO_req'] = columna_iso(df[col_currency_req], diccionario)
+    df['currency_ISO_ds'] = columna_iso(df[col_currency_ds], diccionario)
+    df['currency_ISO_pe'] = columna_iso(df[col_currency_pe], diccionario)
+
+    #2) Construimos una única tabla de pares (divisa origen, divisa destino) distintos y resolvemos cada tipo de cambio UNA sola vez.
+    #   Aquí es donde se hace el llamamiento a la API (como mucho una llamada por par).
+    pares = _pares_distintos(df['currency_ISO_req'], df['currency_ISO_ds'], df['currency_ISO_pe'])
+    if col_fecha is None and fecha_tasas is None:
+        #   Primero se consulta la caché persistente (si se indica `ruta_cache`) y sólo se llama a la API para los pares que falten (todos a la vez).
+        tasas, pares_sin_tasa = dv.resolver_tasas(pares,
+                                                  ruta_cache = ruta_cache, ttl_horas = ttl_horas,
+                                                  max_entradas = max_entradas_cache, offline = offline,
+                                                  triangular = triangular)
+
+        #3) Tipo de cambio de cada fila (se "reparte" a cada fila con NumPy a partir de la tabla de pares):
+        tasa_ds = _tasas_por_fila(df['currency_ISO_ds'], df['currency_ISO_req'], tasas)
+        tasa_pe = _tasas_por_fila(df['currency_ISO_pe'], df['currency_ISO_req'], tasas)
+    else:
+        #   Tipos de cambio históricos: una tabla divisa x fecha para todo el rango de fechas (sin llamadas por fila) y un cruce as-of por fecha
+        if col_fecha is not None:
+            fechas = pd.to_datetime(df[col_fecha], errors='coerce')
+        else:
+            fechas = pd.Series(pd.Timestamp(fecha_tasas), index=df.index)
+        divisas = {divisa for par in pares for divisa in par}
+        tabla = dv._tabla_vacia()
+        if divisas and fechas.notna().any():
+            tabla = dv.tabla_tasas_historicas(divisas, fechas.min(), fechas.max(), ruta_cache = ruta_cache,
+                                              ruta_tabla = ruta_tabla_tasas, offline = offline)
+        if fechas.isna().any():
+            print(f"❌ {int(fechas.isna().sum())} filas sin fecha en '{col_fecha}': se quedan sin tipo de cambio")
+
+        #3) Tipo de cambio de cada fila en su fecha:
+        tasa_ds = _tasas_por_fila_y_fecha(df['currency_ISO_ds'], df['currency_ISO_req'], fechas, tabla)
+        tasa_pe = _tasas_por_fila_y_fecha(df['currency_ISO_pe'], df['currency_ISO_req'], fechas, tabla)
+        #   Pares con alguna fila (con divisas y fecha) sin tipo de cambio
+        pares_sin_tasa = set()
+        for col_origen, tasa in (('currency_ISO_ds', tasa_ds), ('currency_ISO_pe', tasa_pe)):
+            sin_tasa = np.isnan(tasa) & df[col_origen].notna().to_numpy() & df['currency_ISO_req'].notna().to_numpy() & fechas.notna().to_numpy()
+            origen = df[col_origen][sin_tasa]
+            pares_sin_tasa.update(_pares_distintos(df['currency_ISO_req'][sin_tasa], origen, origen))
+        pares_sin_tasa = sorted(pares_sin_tasa)
+        if pares_sin_tasa:
+            print(f"❌ {len(pares_sin_tasa)} pares sin tipo de cambio histórico en alguna fecha: {', '.join(f'{o}->{d}' for o, d in pares_sin_tasa)}")
+
+    #4) Guardamos el FCV en la divisa de referencia (= la del Request B-End). Si no hay tasa (o es 0) el resultado queda vacío (NaN).
+    df['FCV_ds_conv'] = _convertir_columna(df[col_val_ds], tasa_ds)
+    df['FCV_pe_conv'] = _convertir_columna(df[col_val_pe], tasa_pe)
+
+    #   Guardamos el tipo de cambio aplicado por si necesitamos recurrir a él:
+    df['FCV_ds_exchange_rate'] = tasa_ds
+    df['FCV_pe_exchange_rate'] = tasa_pe
+
+    #5) Cálculo de delta:(Valor actual - Valor de referencia) / Valor de referencia * 100 o bien Valor actual / Valor de referencia - 1.
     #En este caso, nuestro benchmark es el Deal Specialist
     df['delta PE vs DS'] = ((df['FCV_pe_conv'] / df['FCV_ds_conv']) - 1) * 100
 
-    #5) Reemplazamos los infinitos a 0%. Estos infinitos pueden existir porque el FCV del benchmark (DS) puede ser == 0, entonces al calcular la delta de FCV sale inf:
+    #6) Reemplazamos los infinitos a 0%. Estos infinitos pueden existir porque el FCV del benchmark (DS) puede ser == 0, entonces al calcular la delta de FCV sale inf:
     df['delta PE vs DS'] = df['delta PE vs DS'].replace([np.inf, -np.inf], 0)
 
-    #6) identificamos si la divisa utilizada por el Deal Specialist y por el Pricing Engine es la misma que la requerida en el Request B-End
-    df['same_currency_as_B-End_ds'] = df['FCV_ds_exchange_rate'].apply(identificar_cambio_divisa)
-    df['same_currency_as_B-End_pe'] = df['FCV_pe_exchange_rate'].apply(identificar_cambio_divisa)
+    #7) identificamos si la divisa utilizada por el Deal Specialist y por el Pricing Engine es la misma que la requerida en el Request B-End
+    df['same_currency_as_B-End_ds'] = identificar_cambio_divisa(df['FCV_ds_exchange_rate'])
+    df['same_currency_as_B-End_pe'] = identificar_cambio_divisa(df['FCV_pe_exchange_rate'])
+
+    df.attrs['pares_sin_tasa'] = pares_sin_tasa
 
     return df
 
@@ -455,6 +698,8 @@ def same_commercial_model_quoted (value):
         (1)"No changes": si no ha habido cambio del commercial model
         (2) "PE changed": si quien ha cambiado el commercial model quoted ha sido el Pricing Engine
         (3) "DS changed": si quien ha cambiado el commercial model quoted ha sido el Deal Specialist.
+
+    Para columnas completas usar la versión vectorizada: clasificar_por_reglas(df, REGLAS_COMMERCIAL_MODEL_CHANGES)
     """
     #Extraemos el tipo de Commercial Model de cada una de las 3 columnas para esta fila (value)
     b_end = value['Commercial_Model_req']
@@ -484,9 +729,125 @@ def same_commercial_model_quoted (value):
         return "Other service quoted (i.e. MPLS)"
     
 
+# Reglas de clasificación declarativas (ver `clasificar_por_reglas`).
+# Cada regla es (etiqueta, [condiciones]) y se evalúan en orden: gana la primera regla que cumpla TODAS sus condiciones.
+# Una regla sin condiciones es el "en cualquier otro caso".
+REGLAS_COMMERCIAL_MODEL_PROVIDED = [
+    ("B4B", [("Commercial Model", "==", "B4B Resale-Unmanaged")]),
+    ("DIA", [("Commercial Model", "==", "DIA Resale-Unmanaged")]),
+    ("MPLS", []), #preguntar a Antonio si aquí podemos tener también el servicio de Ethernet.
+]
+
+REGLAS_COMMERCIAL_MODEL_CHANGES = [
+    ("Other service quoted (i.e. MPLS)", [("Commercial_Model_req", "not in", ["DIA", "B4B"])]),
+    ("PE changed & DS changed", [("Commercial_Model_pe", "!=col", "Commercial_Model_req"),
+                                 ("Commercial_Model_ds", "!=col", "Commercial_Model_req")]),
+    ("PE changed", [("Commercial_Model_pe", "!=col", "Commercial_Model_req")]),
+    ("DS changed", [("Commercial_Model_ds", "!=col", "Commercial_Model_req")]),
+    ("No changes", []),
+]
+
+
+def _codificar_columnas(df, columnas):
+    """Convierte cada columna en códigos enteros que comparten un único vocabulario (mismo valor --> mismo código en todas las columnas).
+    Así las reglas comparan enteros en lugar de strings, y cada valor distinto se evalúa una sola vez.
+
+    Args:
+        df (pd.DataFrame): DataFrame con los datos.
+        columnas (iterable): columnas a codificar.
+
+    Returns:
+        tuple: (codigos, vocabulario)
+            - codigos (dict): {columna: np.ndarray de enteros}. Los vacíos (NaN) reciben el código -1.
+            - vocabulario (list): valor correspondiente a cada código.
+    """
+    posicion = {}
+    codigos = {}
+    for columna in columnas:
+        codigos_columna, unicos = pd.factorize(df[columna]) #para columnas categóricas reutiliza directamente sus códigos
+        remapeo = np.array([posicion.setdefault(valor, len(posicion)) for valor in unicos], dtype=np.int64)
+        globales = np.full(len(codigos_columna), -1, dtype=np.int64)
+        validos = codigos_columna >= 0
+        globales[validos] = remapeo[codigos_columna[validos]]
+        codigos[columna] = globales
+    return codigos, list(posicion)
+
+
+def _evaluar_condicion(codigos, vocabulario, columna, operador, valor):
+    """Evalúa una condición de una regla sobre la columna completa (ya codificada con `_codificar_columnas`).
+
+    Args:
+        codigos (dict): {columna: códigos enteros}.
+        vocabulario (list): valor correspondiente a cada código.
+        columna (str): columna sobre la que se evalúa la condición.
+        operador (str): uno de '==', '!=', 'in', 'not in' (se compara con un valor o lista de valores)
+                        o '==col', '!=col' (se compara con otra columna, cuyo nombre se pasa en `valor`).
+        valor: valor, lista de valores o nombre de la otra columna.
+
+    Returns:
+        np.ndarray: máscara booleana con una posición por fila.
+    """
+    #Los vacíos (NaN) se comparan igual que en las funciones fila a fila: NaN != 'DIA', NaN no está en ninguna lista y NaN != NaN.
+    codigo = codigos[columna]
+    validos = codigo >= 0
+
+    if operador in ("==col", "!=col"):
+        iguales = (codigo == codigos[valor]) & validos
+        return iguales if operador == "==col" else ~iguales
+
+    if operador in ("==", "!="):
+        cumple_valor = np.array([v == valor for v in vocabulario], dtype=bool)
+    elif operador in ("in", "not in"):
+        cumple_valor = np.array([v in valor for v in vocabulario], dtype=bool)
+    else:
+        raise ValueError(f"Operador '{operador}' no soportado en las reglas de clasificación")
+
+    mascara = np.zeros(len(codigo), dtype=bool)
+    mascara[validos] = cumple_valor[codigo[validos]] #cada valor distinto se evaluó una sola vez; aquí sólo se reparte por códigos
+    return mascara if operador in ("==", "in") else ~mascara
+
+
+@ins.instrumentar
+def clasificar_por_reglas(df, reglas):
+    """Clasifica todas las filas a la vez a partir de una lista de reglas declarativas (sin funciones fila a fila).
+    Las reglas se compilan en una sola llamada a `np.select` sobre los códigos de las etiquetas.
+
+    Args:
+        df (pd.DataFrame): DataFrame con las columnas que usan las reglas.
+        reglas (list): lista de (etiqueta, [(columna, operador, valor), ...]). Ver REGLAS_COMMERCIAL_MODEL_PROVIDED y REGLAS_COMMERCIAL_MODEL_CHANGES.
+                       Las filas que no cumplan ninguna regla quedan vacías (NaN).
+
+    Returns:
+        pd.Series: serie categórica con la etiqueta de cada fila.
+
+    Ejemplo de uso:
+        bend['Commercial Model'] = clasificar_por_reglas(bend, REGLAS_COMMERCIAL_MODEL_PROVIDED)
+    """
+    etiquetas = list(dict.fromkeys(etiqueta for etiqueta, _ in reglas)) #etiquetas distintas, en el orden de las reglas
+    codigo_etiqueta = {etiqueta: i for i, etiqueta in enumerate(etiquetas)}
+
+    columnas = {columna for _, condiciones in reglas for columna, _, _ in condiciones}
+    columnas |= {valor for _, condiciones in reglas for _, operador, valor in condiciones if operador.endswith("col")}
+    codigos_columnas, vocabulario = _codificar_columnas(df, sorted(columnas))
+
+    mascaras, codigos = [], []
+    for etiqueta, condiciones in reglas:
+        mascara = np.ones(len(df), dtype=bool)
+        for columna, operador, valor in condiciones:
+            mascara &= _evaluar_condicion(codigos_columnas, vocabulario, columna, operador, valor)
+        mascaras.append(mascara)
+        codigos.append(codigo_etiqueta[etiqueta])
+
+    resultado = np.select(mascaras, codigos, default=-1) if mascaras else np.full(len(df), -1)
+    return pd.Series(pd.Categorical.from_codes(resultado, categories=etiquetas), index=df.index)
+
+
 def preparacion_floats_powerbi (df): 
     """Función para la preparación de datos para el Power BI: cambiando los puntos de todas las columnas con floats por las comas, para que el Power BI lo entienda:
 
+    OJO: modifica el DataFrame (los floats pasan a ser texto). Para exportar a Power BI es preferible `exportar_csv_powerbi`,
+    que escribe la coma decimal directamente en el CSV sin tocar el DataFrame.
+
     Args:
         df (DataFrame): DataFrame que queremos hacer someter al cambio.
     """
@@ -497,6 +858,32 @@ def preparacion_floats_powerbi (df):
 
 
 
+@ins.instrumentar
+def exportar_csv_powerbi(df, ruta_csv, sep = ',', decimal = ',', encoding = 'utf-8', float_format = None, na_rep = '', chunksize = 100_000,
+                         modo = 'w', cabecera = True):
+    """Escribe un DataFrame en un CSV listo para Power BI (coma como separador decimal) sin modificar el DataFrame:
+    las columnas numéricas siguen siendo numéricas y la conversión a texto la hace el propio escritor de CSV, por bloques de filas.
+
+    Args:
+        df (pd.DataFrame): DataFrame a exportar. No se modifica.
+        ruta_csv (str): Ruta del CSV a generar (ej. 'output/merged.csv').
+        sep (str): Separador de columnas. Por defecto ','. Los valores con coma decimal quedan entre comillas; con sep=';' no hacen falta.
+        decimal (str): Separador decimal. Por defecto ',' (el que entiende Power BI en configuración regional española).
+        encoding (str): Codificación del fichero. Por defecto 'utf-8'.
+        float_format (str or None): Formato de los floats (ej. '%.2f'). None = todos los decimales (igual que str(float)).
+        na_rep (str): Texto para los valores vacíos. Por defecto '' (Power BI lo lee como nulo).
+        chunksize (int): Filas que se convierten a texto y escriben en cada bloque.
+        modo (str): 'w' = crea el fichero; 'a' = añade las filas al final (ej. para escribir un CSV por partes, ver lotes.py).
+        cabecera (bool): si False, no se escribe la fila de nombres de columna (al añadir a un CSV que ya la tiene).
+
+    Ejemplo de uso:
+        exportar_csv_powerbi(df_precios, 'output/precios.csv')
+    """
+    df.to_csv(ruta_csv, index = False, sep = sep, decimal = decimal, encoding = encoding,
+              float_format = float_format, na_rep = na_rep, chunksize = chunksize, mode = modo, header = cabecera)
+
+
+
 def guardar_ruta_csv(nombre_csv, nombre_txt=None):
     """
     Guarda la ruta absoluta del CSV indicado en un archivo .txt auxiliar. La finalidad de este archivo facilitar que los usuarios del ETL puedan saber fácilmente 
@@ -506,7 +893,10 @@ def guardar_ruta_csv(nombre_csv, nombre_txt=None):
     Args:
         - nombre_csv (str): Ruta relativa del archivo CSV que quieres generar (por ejemplo: 'output/merged.csv'). OJO, ejecutamos desde main.py.
         - nombre_txt (str, opcional): Ruta relativa del archivo .txt donde guardar la ruta. 
-                                    Si no se indica, se generará automáticamente con el mismo nombre base.
+                                    Si no se indica, se generará automáticamente con el mismo nombre base, en la carpeta del CSV.
+
+    Returns:
+        - str: ruta del .txt (sólo se reescribe si su contenido cambia).
                                     
     Ejemplo de uso:
         guardar_ruta_csv('output/merged.csv')               # Genera output/merged_path.txt
@@ -519,13 +909,16 @@ def guardar_ruta_csv(nombre_csv, nombre_txt=None):
     if nombre_txt is None: 
         file_name = os.path.basename(nombre_csv) #extraemos sólo el nombre del archivo del csv, sin la carpeta: ej. "output/merged.csv" --> "merged.csv"
         base_name = os.path.splitext(file_name)[0]  #quitamos la extensión.csv, dejándonos solo el nombre base: ej. "merged.csv"--> "merged"
-        nombre_txt = f"output/{base_name}_path.txt" #generamos automáticamente el nombre del .txt asociado, usando ese base_name.
+        nombre_txt = os.path.join(os.path.dirname(nombre_csv), f"{base_name}_path.txt") #generamos automáticamente el nombre del .txt asociado, junto al CSV, usando ese base_name.
     
     #guardamos esa ruta en un archivo auxiliar:
-    #Abrimos (o creamos si no existe) un archivo de texto llamado path_to_csv.txt dentro de la carpeta output/
-    with open(nombre_txt, "w") as archivo: #"w" significa que lo abre en modo escritura, sobreescribiendo cualquier contenido previo // "archivo" es el archivo abierto donde vamos a escribir la ruta.
-        archivo.write(ruta_csv) #Escribe la ruta completa del CSV (output_file) dentro del archivo path_to_csv.txt.
-    
-
-    print(f"✅ Ruta guardada: {nombre_txt}, ➡️  Contenido (ruta del CSV): {ruta_csv}")
+    #Se escribe en un temporal y sustituye al .txt anterior sólo si la ruta ha cambiado (ver salidas.escribir_si_cambia): así Power BI no ve un .txt vacío a medio escribir.
+    def escribir(temporal):
+        with open(temporal, "w") as archivo: #"w" significa que lo abre en modo escritura // "archivo" es el archivo abierto donde vamos a escribir la ruta.
+            archivo.write(ruta_csv) #Escribe la ruta completa del CSV (output_file) dentro del archivo .txt.
+    _, cambiado = sal.escribir_si_cambia(nombre_txt, escribir)
+
+    estado = "Ruta guardada" if cambiado else "Ruta sin cambios"
+    print(f"✅ {estado}: {nombre_txt}, ➡️  Contenido (ruta del CSV): {ruta_csv}")
+    return nombre_txt
 # %%
@@ -1,11 +1,97 @@
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import requests
+from . import instrumentacion as ins
+from . import estadisticas as est
+from . import salidas as sal
 
 
-def generar_boxplot_delta(df, columna="delta PE vs DS", save_path=None, show_plot=True):
+# Por encima de este nº de puntos, los gráficos dibujan una muestra estratificada (o, en el boxplot, sus estadísticos):
+# el tiempo de dibujo y el tamaño del PNG dejan de crecer con los datos
+MAX_PUNTOS = 20_000
+
+# Nº máximo de barras del histograma de outliers
+MAX_BARRAS = 200
+
+# Resolución de los PNG (dots per inch). 300 dpi --> alta calidad; 100-150 es suficiente para verlos en pantalla
+DPI = 300
+
+
+def muestra_estratificada(df, columnas, max_filas = MAX_PUNTOS, semilla = 0):
+    """Muestra aleatoria de unas max_filas filas que conserva la proporción de cada grupo de `columnas`
+    (ej. cada tipo de servicio y fuente de precio) y al menos una fila de cada grupo, para que no desaparezcan los grupos pequeños.
+
+    Args:
+        df (pd.DataFrame): datos.
+        columnas (list): columnas que definen los estratos.
+        max_filas (int): tamaño aproximado de la muestra. Si df tiene menos filas, se devuelve entero.
+        semilla (int): semilla de la muestra (la misma semilla da la misma muestra).
+
+    Returns:
+        pd.DataFrame: filas elegidas, en su orden original.
+    """
+    if len(df) <= max_filas:
+        return df
+    grupos = df.groupby(columnas, observed = True, dropna = False, sort = False).ngroup().to_numpy()
+    tamanos = np.bincount(grupos)
+    probabilidad = np.maximum(max_filas / len(df), 1 / tamanos) #como mínimo, una fila esperada por grupo
+
+    #Cada fila se queda con la probabilidad de su grupo (sin ordenar: coste lineal); los grupos que se quedan vacíos conservan su primera fila
+    elegidas = np.random.default_rng(semilla).random(len(df)) < probabilidad[grupos]
+    vacios = np.bincount(grupos[elegidas], minlength = len(tamanos)) == 0
+    elegidas[np.unique(grupos, return_index = True)[1][vacios]] = True
+    return df.iloc[np.flatnonzero(elegidas)]
+
+
+def _guardar_o_mostrar(save_path, show_plot, dpi):
+    """Guarda la figura actual (si se indica ruta) y la muestra o la cierra.
+    El PNG se escribe en un temporal y sólo sustituye al anterior si ha cambiado (ver salidas.escribir_si_cambia)."""
+    if save_path:
+        sal.escribir_si_cambia(save_path, lambda ruta: plt.savefig(ruta, 
+                                                                   dpi=dpi, #Resolución (dots per inch)
+                                                                   bbox_inches='tight')) #Ajusta los bordes para que el gráfico ocupe el menor espacio posible.
+    if show_plot:
+        plt.show()
+    else:
+        plt.close()
+
+
+def _renderizar(nombre, kwargs):
+    """Dibuja un gráfico de este módulo en un proceso del pool (backend Agg, sin pantalla) y devuelve lo que ha impreso."""
+    import io
+    from contextlib import redirect_stdout
+    plt.switch_backend('Agg')
+    with redirect_stdout(io.StringIO()) as salida:
+        globals()[nombre](**kwargs, show_plot = False)
+    return salida.getvalue()
+
+
+def renderizar_en_paralelo(graficos, procesos = None):
+    """Dibuja varios gráficos independientes a la vez, uno por proceso, con el backend Agg (sólo se guardan en PNG).
+
+    Args:
+        graficos (list): (nombre de la función de este módulo, dict de argumentos), ej. ('generar_boxplot_delta', {'df': df, 'save_path': ...}).
+        procesos (int or None): nº de procesos. None = uno por gráfico (como mucho, nº de núcleos); 1 = uno detrás de otro, sin pool.
+
+    Ejemplo de uso:
+        renderizar_en_paralelo([('generar_boxplot_delta', {'df': df_viz, 'save_path': 'output/delta_boxplot.png'}),
+                                ('visualizar_outliers', {...})])
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    procesos = min(procesos or os.cpu_count() or 1, len(graficos))
+    if procesos <= 1:
+        salidas = [_renderizar(nombre, kwargs) for nombre, kwargs in graficos]
+    else:
+        with ProcessPoolExecutor(max_workers = procesos) as pool:
+            salidas = list(pool.map(_renderizar, *zip(*graficos)))
+    for salida in salidas: #lo que imprime cada gráfico, en orden
+        print(salida, end = '')
+
+
+@ins.instrumentar
+def generar_boxplot_delta(df, columna="delta PE vs DS", save_path=None, show_plot=True, estadisticas=None, max_puntos=MAX_PUNTOS, dpi=DPI):
     """
     Genera un boxplot de la columna indicada, imprime estadísticas principales y
     opcionalmente guarda el gráfico en un archivo.
@@ -16,31 +102,48 @@ def generar_boxplot_delta(df, columna="delta PE vs DS", save_path=None, show_plo
     - columna (str): Nombre de la columna numérica para analizar
     - save_path (str or None): Ruta donde guardar el gráfico si se desea. Si es None, no se guarda.
     - show_plot (bool): Si True, muestra el gráfico por pantalla.
+    - estadisticas (dict or None): resultado de estadisticas.estadisticas_outliers ya calculado (se reutiliza). Si es None, se calcula.
+    - max_puntos (int): con más datos, la caja se dibuja a partir de los estadísticos y sólo se pinta una muestra de los outliers.
+    - dpi (int): resolución del PNG.
     """
+    if estadisticas is None:
+        estadisticas = est.estadisticas_outliers(df, columna, grupos = {})
+    total = est.fila_estadisticas(estadisticas)
 
     # Creamos figura
     plt.figure(figsize=(12, 4))
-    sns.boxplot(x = "delta PE vs DS", 
-                data = df, 
-                width = 0.5, 
-                color = "turquoise",
-                capprops={'color':'purple'}) # para cambiar el color de los bigotes)
+    if total['filas_con_dato'] <= max_puntos:
+        sns.boxplot(x = columna, 
+                    data = df, 
+                    width = 0.5, 
+                    color = "turquoise",
+                    capprops={'color':'purple'}) # para cambiar el color de los bigotes)
+    else:
+        #Muchos datos: la caja sale de los cuartiles ya calculados y los bigotes llegan al último dato dentro de los límites (igual que seaborn)
+        valores = df[columna].to_numpy(dtype=float)
+        dentro = valores[(valores >= total['limite_inferior']) & (valores <= total['limite_superior'])]
+        atipicos = valores[estadisticas['outliers'][est.AGRUPACION_GLOBAL].to_numpy()]
+        if len(atipicos) > max_puntos:
+            atipicos = np.random.default_rng(0).choice(atipicos, max_puntos, replace = False)
+        plt.gca().bxp([{'med': total['mediana'], 'q1': total['q1'], 'q3': total['q3'],
+                        'whislo': dentro.min() if len(dentro) else total['q1'], 'whishi': dentro.max() if len(dentro) else total['q3'],
+                        'fliers': atipicos}],
+                      orientation = 'horizontal', widths = 0.5, patch_artist = True,
+                      boxprops = {'facecolor': 'turquoise'}, capprops = {'color': 'purple'}, medianprops = {'color': 'black'})
+        plt.gca().set_yticks([])
 
     # cambiamos el nombre de los ejes usando los métodos
     plt.title('Delta % = (FCV Pricing Engine / FCV Deal Specialist - 1) * 100', fontsize = 10, color= '#14213d')
     plt.ylabel("Distribución de la Delta %", fontsize = 9)
     plt.xlabel("delta %",  fontsize = 9)
 
-    # Cálculo de estadísticos
-    q1 = round(np.quantile(df['delta PE vs DS'], 0.25), 2)
-    q3 = round(np.quantile(df['delta PE vs DS'], 0.75), 2)
-    ric = q3 - q1
-    limite_inferior = q1 - 1.5 * ric
-    limite_superior = q3 + 1.5 * ric
+    # Estadísticos (sin tener en cuenta las deltas vacías)
+    q1, q3, ric = total['q1'], total['q3'], total['ric']
+    limite_inferior, limite_superior = total['limite_inferior'], total['limite_superior']
 
     #Prints:
     print("💡Estadísticas principales💡: \n")
-    print(f"- Mediana = {round(df['delta PE vs DS'].median(),2)} % ➡️ línea dentro del recuadro")
+    print(f"- Mediana = {total['mediana']} % ➡️ línea dentro del recuadro")
     print(f"- Q1 (25%) = {q1} % ➡️ borde inferior de la Caja" )
     print(f"- Q3 (75%) = {q3} % ➡️ borde superior de la Caja\n" )
     print(f"Rango Intercuartílico (entre Q1 y Q3): {ric}")
@@ -54,29 +157,23 @@ def generar_boxplot_delta(df, columna="delta PE vs DS", save_path=None, show_plo
     # Ajustar el espaciado entre subplots
     plt.tight_layout();
 
-    # Guardar si se solicita
+    # Guardar y/o mostrar
+    _guardar_o_mostrar(save_path, show_plot, dpi)
     if save_path:
-        plt.savefig(save_path, 
-                        dpi=300, #Resolución (dots per inch). 300 dpi --> alta calidad
-                        bbox_inches='tight') #Ajusta los bordes para que el gráfico ocupe el menor espacio posible.
         print(f"📁 Gráfico guardado en: {save_path}")
 
-    # Mostrar si se solicita
-    if show_plot:
-        plt.show()
-    else:
-        plt.close()
-
 
 
 
-def separar_outliers(df, columna):
+def separar_outliers(df, columna, estadisticas=None):
     """
     Calcula los outliers y separa el DataFrame en dos: con outliers y sin outliers.
+    Las filas con la columna vacía (NaN) no están en ninguno de los dos.
     
     Args:
         - df (pd.DataFrame): DataFrame a procesar.
         - columna (str): Nombre de la columna numérica para el análisis.
+        - estadisticas (dict or None): resultado de estadisticas.estadisticas_outliers para este mismo df (se reutiliza). Si es None, se calcula.
 
     Returns:
         dict: Contiene:
@@ -89,32 +186,35 @@ def separar_outliers(df, columna):
             - 'limite_superior': Límite superior de outliers
     """
     
-    q1 = round(np.quantile(df[columna], 0.25), 2)
-    q3 = round(np.quantile(df[columna], 0.75), 2)
-    ric = q3 - q1
-    limite_inferior = q1 - 1.5 * ric
-    limite_superior = q3 + 1.5 * ric
-    
-    outliers = df[(df[columna] < limite_inferior) | (df[columna] > limite_superior)]
-    sin_outliers = df[(df[columna] >= limite_inferior) & (df[columna] <= limite_superior)]
+    if estadisticas is None:
+        estadisticas = est.estadisticas_outliers(df, columna, grupos = {})
+    total = est.fila_estadisticas(estadisticas)
+
+    es_outlier = estadisticas['outliers'][est.AGRUPACION_GLOBAL].to_numpy()
+    con_dato = df[columna].notna().to_numpy()
+    outliers = df[es_outlier]
+    sin_outliers = df[con_dato & ~es_outlier]
     
     return {
         'outliers': outliers,
         'sin_outliers': sin_outliers,
-        'q1': q1,
-        'q3': q3,
-        'ric': ric,
-        'limite_inferior': limite_inferior,
-        'limite_superior': limite_superior
+        'q1': total['q1'],
+        'q3': total['q3'],
+        'ric': total['ric'],
+        'limite_inferior': total['limite_inferior'],
+        'limite_superior': total['limite_superior']
     }
 
 
 
 
 
-def visualizar_outliers(df, limite_inferior, limite_superior, columna='delta PE vs DS', save_path=None):
+@ins.instrumentar
+def visualizar_outliers(df, limite_inferior, limite_superior, columna='delta PE vs DS', save_path=None, show_plot=True, estadisticas=None, dpi=DPI):
     """
     Visualiza un histograma de los outliers de una columna.
+    Si show_plot es False, el gráfico sólo se guarda (ejecución sin pantalla).
+    Si se pasan las `estadisticas` ya calculadas (estadisticas.estadisticas_outliers), los recuentos se toman de ahí.
     """
 
     plt.figure(figsize=(10, 3))
@@ -123,23 +223,26 @@ def visualizar_outliers(df, limite_inferior, limite_superior, columna='delta PE
     plt.ylabel("Nº cotizaciones", fontsize=9)
     plt.grid(axis='y', alpha=0.5) #el alpha mide la transparencia del grid
 
+    # bins='auto' puede dar miles de barras con muchos datos muy dispersos: se limita a MAX_BARRAS
+    valores = df[columna].dropna().to_numpy(dtype=float)
+    bins = 'auto' if len(valores) == 0 or len(np.histogram_bin_edges(valores, bins='auto')) <= MAX_BARRAS + 1 else MAX_BARRAS
     sns.histplot(x = columna,
                  data = df,
-                 bins = 'auto',
+                 bins = bins,
                  color = '#34a0a4')
 
+    if estadisticas is not None:
+        total = est.fila_estadisticas(estadisticas)
+        n_superior, n_inferior = total['outliers_superiores'], total['outliers_inferiores']
+    else:
+        n_superior, n_inferior = int((df[columna] >= limite_superior).sum()), int((df[columna] <= limite_inferior).sum())
+
     print("🚨 OUTLIERS = Valores que quedan fuera de los bigotes")
-    print(f"    🔍 Datos en intervalo SUPERIOR ({limite_superior}, {round(df[columna].max(),2)}): {df[df[columna] >= limite_superior].shape[0]} cotizaciones")    
-    print(f"    🔍 Datos en intervalo INFERIOR ({limite_inferior}, {round(df[columna].min(),2)}): {df[df[columna] <= limite_inferior].shape[0]} cotizaciones")
+    print(f"    🔍 Datos en intervalo SUPERIOR ({limite_superior}, {round(df[columna].max(),2)}): {n_superior} cotizaciones")    
+    print(f"    🔍 Datos en intervalo INFERIOR ({limite_inferior}, {round(df[columna].min(),2)}): {n_inferior} cotizaciones")
 
     plt.tight_layout()
-
-    if save_path:
-        plt.savefig(save_path, 
-                    dpi=300, 
-                    bbox_inches='tight')
-
-    plt.show()
+    _guardar_o_mostrar(save_path, show_plot, dpi)
 
 
 
@@ -147,10 +250,11 @@ def visualizar_outliers(df, limite_inferior, limite_superior, columna='delta PE
 
 
 
+@ins.instrumentar
 def viz_delta_vs_tipo_servicio(df_completo, df_outliers, df_sin_outliers,
                                  col_delta='delta PE vs DS', col_servicio='Lot_pe',
                                  col_com_model='Commercial_Model_req', col_source='main_access_mrc_amt_quoted_by_pe',
-                                 save_path=None):
+                                 save_path=None, show_plot=True, max_puntos=MAX_PUNTOS, dpi=DPI):
     """
     Genera un gráfico comparativo de la distribución del delta % vs tipo de servicio.
     
@@ -163,6 +267,9 @@ def viz_delta_vs_tipo_servicio(df_completo, df_outliers, df_sin_outliers,
         - col_com_model: Columna para la leyenda del primer gráfico--> Commercial_Model_req (ej.'B4B' 'DIA' 'MPLS')
         - col_source: Columna para la leyenda de los otros 2 gráficos: fuente de datos del motor (APIs, Costbook o Regressor)
         - save_path: Ruta para guardar el gráfico (opcional)
+        - show_plot: Si True, muestra el gráfico por pantalla; si False, sólo se guarda
+        - max_puntos: máximo de puntos por panel; con más datos se dibuja una muestra estratificada por tipo de servicio y leyenda
+        - dpi: resolución del PNG
     """
     #configuramos la figura:
     fig, axes = plt.subplots(nrows=1, ncols=4, figsize=(20, 5))
@@ -175,53 +282,77 @@ def viz_delta_vs_tipo_servicio(df_completo, df_outliers, df_sin_outliers,
     plt.suptitle(" Comparativa en torno al delta del FCV \n Delta % = (FCV Pricing Engine / FCV Deal Specialist - 1) * 100",
                  fontsize=12, color='#14213d')
 
-    # PLOT 1: Todos los datos + hue por Commercial Model
-    sns.stripplot(x=col_servicio, 
-                    y=col_delta, 
-                    hue=col_com_model,
-                    palette='Set2', 
-                    data=df_completo, 
-                    ax=axes[0])
-    axes[0].set_title("1. Relación Delta - tipo de servicio \n (TODOS LOS DATOS)", color='grey')
-    axes[0].set_xlabel(""); axes[0].set_ylabel("delta %")
-    axes[0].spines['right'].set_visible(False); axes[0].spines['top'].set_visible(False)
-    axes[0].get_legend().set_title('')
-
-    # PLOT 2: Todos los datos + hue por precio
-    sns.stripplot(x=col_servicio, 
-                    y=col_delta, 
-                    hue=col_source,
-                    palette='Set1', 
-                    data=df_completo, 
-                    ax=axes[1])
-    axes[1].set_title("2. Relación Delta - tipo de servicio \n (TODOS LOS DATOS)", color='grey')
-    axes[1].set_xlabel(""); axes[1].set_ylabel("delta %")
-    axes[1].spines['right'].set_visible(False); axes[1].spines['top'].set_visible(False)
-    axes[1].get_legend().set_title('')
-
-    # PLOT 3: Sólo datos sin outliers
-    sns.stripplot(x=col_servicio, 
-                    y=col_delta, 
-                    hue=col_source,
-                    palette='Set1', 
-                    data=df_sin_outliers, 
-                    ax=axes[2])
-    axes[2].set_title("3. Relación Delta - tipo de servicio \n (DATOS SIN OUTLIERS)", color='grey')
-    axes[2].set_xlabel(""); axes[2].set_ylabel("delta %")
-    axes[2].spines['right'].set_visible(False); axes[2].spines['top'].set_visible(False)
-    axes[2].get_legend().set_title('')
-
-    # PLOT 4: Sólo outliers
-    sns.stripplot(x=col_servicio, 
-                    y=col_delta, 
-                    hue=col_source,
-                    palette='Set1', 
-                    data=df_outliers, 
-                    ax=axes[3])
-    axes[3].set_title("4. Relación Delta - tipo de servicio \n (SÓLO OUTLIERS)", color='grey')
-    axes[3].set_xlabel(""); axes[3].set_ylabel("delta %")
-    axes[3].spines['right'].set_visible(False); axes[3].spines['top'].set_visible(False)
-    axes[3].get_legend().set_title('')
+    # Con muchos datos cada panel dibuja una muestra (mismas proporciones por tipo de servicio y leyenda)
+    # (sólo con las columnas del panel y las filas con delta, que son las que se dibujan)
+    def _muestra(df, col_hue):
+        datos = df[[col_servicio, col_hue, col_delta]].dropna(subset=[col_delta])
+        return muestra_estratificada(datos, [col_servicio, col_hue], max_puntos), len(datos)
+
+    def _titulo(titulo, n_filas, muestra):
+        return titulo if len(muestra) == n_filas else f"{titulo} \n muestra de {len(muestra)} de {n_filas}"
+
+    # El jitter de sns.stripplot usa el generador global de numpy: con semilla fija, los mismos datos dan el mismo PNG (y no se reescribe).
+    # El estado del generador se restaura al terminar, para no cambiar los números aleatorios de quien llama a esta función.
+    estado_aleatorio = np.random.get_state()
+    np.random.seed(0)
+    try:
+        # PLOT 1: Todos los datos + hue por Commercial Model
+        muestra, n_filas = _muestra(df_completo, col_com_model)
+        sns.stripplot(x=col_servicio, 
+                        y=col_delta, 
+                        hue=col_com_model,
+                        palette='Set2', 
+                        data=muestra, 
+                        ax=axes[0])
+        axes[0].set_title(_titulo("1. Relación Delta - tipo de servicio \n (TODOS LOS DATOS)", n_filas, muestra), color='grey')
+        axes[0].set_xlabel(""); axes[0].set_ylabel("delta %")
+        axes[0].spines['right'].set_visible(False); axes[0].spines['top'].set_visible(False)
+        if axes[0].get_legend() is not None: #sin datos (ej. ningún outlier) seaborn no crea leyenda
+            axes[0].get_legend().set_title('')
+
+        # PLOT 2: Todos los datos + hue por precio
+        muestra, n_filas = _muestra(df_completo, col_source)
+        sns.stripplot(x=col_servicio, 
+                        y=col_delta, 
+                        hue=col_source,
+                        palette='Set1', 
+                        data=muestra, 
+                        ax=axes[1])
+        axes[1].set_title(_titulo("2. Relación Delta - tipo de servicio \n (TODOS LOS DATOS)", n_filas, muestra), color='grey')
+        axes[1].set_xlabel(""); axes[1].set_ylabel("delta %")
+        axes[1].spines['right'].set_visible(False); axes[1].spines['top'].set_visible(False)
+        if axes[1].get_legend() is not None:
+            axes[1].get_legend().set_title('')
+
+        # PLOT 3: Sólo datos sin outliers
+        muestra, n_filas = _muestra(df_sin_outliers, col_source)
+        sns.stripplot(x=col_servicio, 
+                        y=col_delta, 
+                        hue=col_source,
+                        palette='Set1', 
+                        data=muestra, 
+                        ax=axes[2])
+        axes[2].set_title(_titulo("3. Relación Delta - tipo de servicio \n (DATOS SIN OUTLIERS)", n_filas, muestra), color='grey')
+        axes[2].set_xlabel(""); axes[2].set_ylabel("delta %")
+        axes[2].spines['right'].set_visible(False); axes[2].spines['top'].set_visible(False)
+        if axes[2].get_legend() is not None:
+            axes[2].get_legend().set_title('')
+
+        # PLOT 4: Sólo outliers
+        muestra, n_filas = _muestra(df_outliers, col_source)
+        sns.stripplot(x=col_servicio, 
+                        y=col_delta, 
+                        hue=col_source,
+                        palette='Set1', 
+                        data=muestra, 
+                        ax=axes[3])
+        axes[3].set_title(_titulo("4. Relación Delta - tipo de servicio \n (SÓLO OUTLIERS)", n_filas, muestra), color='grey')
+        axes[3].set_xlabel(""); axes[3].set_ylabel("delta %")
+        axes[3].spines['right'].set_visible(False); axes[3].spines['top'].set_visible(False)
+        if axes[3].get_legend() is not None:
+            axes[3].get_legend().set_title('')
+    finally:
+        np.random.set_state(estado_aleatorio)
 
     # Misma escala en todos los ejes Y
     minimo = df_completo[col_delta].min()
@@ -230,9 +361,5 @@ def viz_delta_vs_tipo_servicio(df_completo, df_outliers, df_sin_outliers,
         ax.set_ylim(minimo - 50, maximo + 50)
 
     plt.tight_layout()
-
-    if save_path:
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-
-    plt.show()
+    _guardar_o_mostrar(save_path, show_plot, dpi)
 